@@ -6,10 +6,10 @@ WITH want AS (
 SELECT COALESCE(NULLIF(:variable,''), 'co2') AS variable
 ),
 latest AS (
-SELECT variable, MAX(obs_time) AS obs_time
-FROM ghg_surface
-WHERE variable = (SELECT variable FROM want)
-GROUP BY variable
+-- current snapshot from the catalog (011_surface_snapshot.sql)
+SELECT variable, obs_time
+FROM surface_snapshot
+WHERE variable = (SELECT variable FROM want) AND is_current = 1
 ),
 rows AS (
 SELECT s.lat, s.lon, s.value
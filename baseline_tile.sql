@@ -0,0 +1,41 @@
+-- baseline_tile.sql
+-- One overlay tile of the latest snapshot as JSON: {cells: [[lat, lon, value], ...], min, max}
+-- Params: $variable (default 'co2'), $z, $x, $y (Leaflet tile coords)
+-- Zooms deeper than the pyramid fall back to the ancestor tile at its deepest level.
+
+SELECT 'json' AS component;
+
+WITH
+args AS (
+  SELECT COALESCE(NULLIF($variable,''), 'co2') AS variable,
+         CAST($z AS INTEGER) AS z,
+         CAST($x AS INTEGER) AS x,
+         CAST($y AS INTEGER) AS y
+),
+snap AS (
+  SELECT t.variable, t.obs_time, t.vmin, t.vmax
+  FROM surface_tile t, args
+  WHERE t.variable = args.variable
+  ORDER BY t.obs_time DESC
+  LIMIT 1
+),
+lvl AS (
+  SELECT MIN(args.z, (SELECT MAX(t.z) FROM surface_tile t, snap
+                      WHERE t.variable = snap.variable AND t.obs_time = snap.obs_time)) AS z,
+         args.z AS req_z, args.x, args.y
+  FROM args
+),
+tile AS (
+  SELECT t.cells
+  FROM surface_tile t, snap, lvl
+  WHERE t.variable = snap.variable
+    AND t.obs_time = snap.obs_time
+    AND t.z = lvl.z
+    AND t.x = (lvl.x >> (lvl.req_z - lvl.z))
+    AND t.y = (lvl.y >> (lvl.req_z - lvl.z))
+)
+SELECT json_object(
+  'cells', COALESCE((SELECT json(cells) FROM tile), json('[]')),
+  'min',   (SELECT vmin FROM snap),
+  'max',   (SELECT vmax FROM snap)
+) AS contents;
@@ -0,0 +1,229 @@
+# bench/fixtures.py
+# Synthetic inputs for the benchmark suite (run_bench.py):
+# - CAMS-like NetCDF on a regular 1D grid (time, level dims) or a curvilinear 2D grid
+# - 1° SST climatology .asc months with land/missing sentinels
+# - a migrated SQLite DB, optionally seeded with markers (which enqueue GHG jobs)
+# - a VEMAP-like .zip bundle and a local stand-in HTTP server for it (Range / ETag,
+#   optionally dropping the connection part-way) for the download cache
+# - MockCDS, a stand-in for cdsapi.Client.retrieve (queue latency, transient failures)
+# Everything is deterministic (fixed seeds), so runs are comparable.
+
+import glob, hashlib, json, os, shutil, sqlite3, threading, time, zipfile, zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MIGRATIONS = os.path.join(ROOT, "sqlpage", "migrations")
+
+# grid spacing in degrees per named size
+SIZES = {"small": 2.0, "medium": 0.5, "large": 0.25}
+SST_MONTHS = ("01", "04", "07", "10")
+# incompressible filler (MiB) in the download bundle per named size
+BUNDLE_MB = {"small": 8, "medium": 64, "large": 256}
+
+def _field(lat2d, lon2d, ntime, seed):
+    """Smooth CO₂-like field (ppm-ish, float32) with a time trend."""
+    rng = np.random.default_rng(seed)
+    base = 415.0 + 6.0 * np.cos(np.radians(lat2d)) + 2.0 * np.sin(np.radians(2.0 * lon2d))
+    out = np.empty((ntime,) + lat2d.shape, dtype=np.float32)
+    for t in range(ntime):
+        out[t] = base + 0.1 * t + rng.normal(0.0, 0.2, lat2d.shape)
+    return out
+
+def make_cams_nc(path, step=2.0, ntime=4, nlevel=3, curvilinear=False, seed=0):
+    """
+    CAMS-like file: co2/ch4 on (time, lat, lon) plus co2_ml on (time, level, lat, lon).
+    Latitude runs north->south and longitude 0..360 like the ADS downloads.
+    curvilinear=True uses 2D lat/lon on (y, x), as regional model output does.
+    """
+    import xarray as xr
+    if os.path.exists(path):
+        return path
+    lat = np.arange(90.0, -90.0 - step / 2, -step)
+    lon = np.arange(0.0, 360.0, step)
+    time = np.datetime64("2025-01-01T00", "ns") + np.arange(ntime) * np.timedelta64(3, "h")
+    if curvilinear:
+        # sheared grid: lat/lon vary along both axes
+        yy, xx = np.meshgrid(lat[1:-1], lon, indexing="ij")
+        lat2d = yy + 0.25 * step * np.sin(np.radians(xx))
+        lon2d = xx + 0.25 * step * np.cos(np.radians(yy))
+        dims = ("time", "y", "x")
+        coords = {"time": time, "lat": (("y", "x"), lat2d, {"units": "degrees_north"}),
+                  "lon": (("y", "x"), lon2d, {"units": "degrees_east"})}
+    else:
+        lat2d, lon2d = np.meshgrid(lat, lon, indexing="ij")
+        dims = ("time", "latitude", "longitude")
+        coords = {"time": time, "latitude": lat, "longitude": lon}
+    co2 = _field(lat2d, lon2d, ntime, seed)
+    data = {
+        "co2": (dims, co2, {"units": "ppm"}),
+        "ch4": (dims, (co2 - 415.0) * 0.01 + 1.9, {"units": "ppm"}),
+    }
+    if nlevel:
+        level = np.arange(1, nlevel + 1)
+        coords["level"] = level
+        ml = co2[:, None] - 0.5 * level[None, :, None, None]
+        data["co2_ml"] = ((dims[0], "level") + dims[1:], ml.astype(np.float32), {"units": "ppm"})
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    xr.Dataset(data, coords=coords).to_netcdf(path + ".tmp", engine="netcdf4")
+    os.replace(path + ".tmp", path)
+    return path
+
+def make_sst_asc(dirpath, seed=1):
+    """Four climatology months as written by the source (header lines, -888.8 land, -999.9 missing)."""
+    os.makedirs(dirpath, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    lat = np.arange(89.5, -90.0, -1.0)[:, None]
+    for mm in SST_MONTHS:
+        path = os.path.join(dirpath, f"sst_climate_1d_1971-2000-{mm}.asc")
+        if os.path.exists(path):
+            continue
+        a = np.round(28.0 * np.cos(np.radians(lat)) + rng.normal(0.0, 0.5, (180, 360)), 2)
+        a[rng.random((180, 360)) < 0.3] = -888.8
+        a[rng.random((180, 360)) < 0.02] = -999.9
+        with open(path, "w") as f:
+            f.write("ncols 360\nnrows 180\n")
+            for row in a:
+                f.write(" ".join(f"{v:.1f}" if v < -800 else f"{v:.2f}" for v in row) + "\n")
+    return dirpath
+
+def migrated_db(path):
+    """
+    Fresh DB with every sqlpage/migrations/*.sql applied in order (built once,
+    then copied; rebuilt when a migration is newer than the template).
+    """
+    template = os.path.join(os.path.dirname(path), "_migrated.db")
+    migrations = sorted(glob.glob(os.path.join(MIGRATIONS, "*.sql")))
+    if not os.path.exists(template) or os.path.getmtime(template) < max(map(os.path.getmtime, migrations)):
+        conn = sqlite3.connect(template + ".tmp")
+        for p in migrations:
+            conn.executescript(open(p).read())
+        conn.close()
+        os.replace(template + ".tmp", template)
+    shutil.copyfile(template, path)
+    return path
+
+def add_markers(conn, n, seed=2):
+    """n factory markers at random land-ish points; the insert trigger enqueues one job each."""
+    rng = np.random.default_rng(seed)
+    lats = rng.uniform(-60.0, 70.0, n)
+    lons = rng.uniform(-180.0, 180.0, n)
+    start = conn.execute("SELECT COALESCE(MAX(id), 0) FROM markers").fetchone()[0]
+    rows = []
+    for i, (la, lo) in enumerate(zip(lats.tolist(), lons.tolist()), start=start + 1):
+        title = f"bench {i}"
+        rows.append((title, json.dumps({
+            "type": "Feature", "properties": {"title": title},
+            "geometry": {"type": "Point", "coordinates": [round(lo, 4), round(la, 4)]},
+        })))
+    conn.executemany("INSERT INTO markers (title, geojson) VALUES (?, ?)", rows)
+    conn.commit()
+    return n
+
+def make_bundle_zip(path, nc_path, filler_mb=8, seed=3):
+    """Zip like the VEMAP bundle: a readme, a large member the loader doesn't need, then the .nc."""
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    rng = np.random.default_rng(seed)
+    with zipfile.ZipFile(path + ".tmp", "w", zipfile.ZIP_STORED) as z:
+        z.writestr("vemap/README.txt", "synthetic bundle\n")
+        with z.open("vemap/ascii/npp_monthly.bin", "w", force_zip64=True) as f:
+            for _ in range(filler_mb):
+                f.write(rng.bytes(1 << 20))
+        z.write(nc_path, "vemap/netcdf/" + os.path.basename(nc_path))
+    os.replace(path + ".tmp", path)
+    return path
+
+def serve_file(path, cut_after=None):
+    """
+    Stand-in HTTP server for one file: ETag / Last-Modified, If-None-Match, Range and
+    If-Range. With cut_after, the first full response stops after that many bytes.
+    Returns (url, server); server.requests logs (status, Range, If-Range) per GET.
+    Call server.shutdown() when done.
+    """
+    size = os.path.getsize(path)
+    etag = '"%s"' % hashlib.sha1(f"{path}:{os.path.getmtime(path)}:{size}".encode()).hexdigest()
+    cuts = [cut_after] if cut_after else []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def send_response(self, code, message=None):
+            server.requests.append((code, self.headers.get("Range"), self.headers.get("If-Range")))
+            super().send_response(code, message)
+
+        def do_GET(self):
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            start, rng = 0, self.headers.get("Range")
+            if rng and self.headers.get("If-Range", etag) == etag:
+                start = int(rng.split("=")[1].split("-")[0])
+            self.send_response(206 if start else 200)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(size - start))
+            if start:
+                self.send_header("Content-Range", f"bytes {start}-{size - 1}/{size}")
+            self.end_headers()
+            limit = cuts.pop() if cuts and not start else None
+            with open(path, "rb") as f:
+                f.seek(start)
+                sent = 0
+                while block := f.read(1 << 20):
+                    if limit is not None and sent + len(block) > limit:
+                        self.wfile.write(block[:limit - sent])
+                        self.close_connection = True
+                        return
+                    self.wfile.write(block)
+                    sent += len(block)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/{os.path.basename(path)}", server
+
+_HDF5 = threading.Lock()
+
+class MockCDS:
+    """
+    cdsapi.Client stand-in: retrieve(name, request, target) writes a daily CAMS-like
+    NetCDF for the request's variables and date range after `latency` seconds plus
+    `per_field` seconds per variable-day (a queue slot and the extraction time).
+    The first attempt at about one in `fail_every` requests raises, like a transient ADS error.
+    """
+    def __init__(self, step=4.0, latency=0.05, per_field=0.002, fail_every=0):
+        self.step, self.latency, self.per_field, self.fail_every = step, latency, per_field, fail_every
+        self.calls, self.seen, self.lock = 0, set(), threading.Lock()
+
+    def retrieve(self, name, request, target):
+        import xarray as xr
+        key = json.dumps(request, sort_keys=True)
+        with self.lock:
+            self.calls += 1
+            first = key not in self.seen
+            self.seen.add(key)
+        a, _, b = request["date"][0].partition("/")
+        days = np.arange(np.datetime64(a), np.datetime64(b or a) + 1)
+        variables = request["variable"]
+        time.sleep(self.latency + self.per_field * len(variables) * days.size)
+        if first and self.fail_every and int(hashlib.sha1(key.encode()).hexdigest(), 16) % self.fail_every == 0:
+            raise RuntimeError("mock ADS error")
+        lat = np.arange(90.0, -90.0 - self.step / 2, -self.step)
+        lon = np.arange(0.0, 360.0, self.step)
+        lat2d, lon2d = np.meshgrid(lat, lon, indexing="ij")
+        base = 415.0 + 6.0 * np.cos(np.radians(lat2d)) + 2.0 * np.sin(np.radians(2.0 * lon2d))
+        trend = 0.01 * (days - np.datetime64("2025-01-01")).astype(float)  # same values however it's chunked
+        data = {}
+        for v in variables:
+            field = base[None] + trend[:, None, None] + (zlib.crc32(v.encode()) % 100) * 0.1
+            data[v] = (("time", "latitude", "longitude"), field.astype(np.float32), {"units": "ppm"})
+        coords = {"time": days.astype("datetime64[ns]"), "latitude": lat, "longitude": lon}
+        with _HDF5:  # libhdf5 isn't thread-safe; the real client only streams bytes
+            xr.Dataset(data, coords=coords).to_netcdf(target, engine="netcdf4")
@@ -0,0 +1,526 @@
+#!/usr/bin/env python3
+"""
+run_bench.py  (benchmark suite: ingest rates and click latency)
+
+- Generates synthetic fixtures (bench/fixtures.py) under --workdir, once.
+- Times each loader / queue worker in its own Python process against a fresh
+  migrated DB, calling the script's main() with its module paths pointed at
+  the fixtures (so nothing under data/ or sqlpage/ is touched).
+- Runs every top-level SQLPage .sql endpoint through sqlite3 with bound
+  parameters, each call in a rolled-back transaction, and reports p50/p95.
+- Writes JSON results; with --baseline, flags cases slower than
+  baseline * (1 + --tolerance) and exits 1.
+
+  python bench/run_bench.py                       # small + medium grids
+  python bench/run_bench.py --save-baseline       # record bench/baseline.json
+  python bench/run_bench.py --baseline bench/baseline.json --only endpoint
+"""
+
+import argparse, contextlib, glob, json, os, platform, re, shutil, sqlite3, statistics
+import subprocess, sys, tempfile, time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+sys.path[:0] = [BENCH, ROOT, os.path.join(ROOT, "worker")]
+import fixtures
+
+DEFAULT_WORKDIR = os.path.join(tempfile.gettempdir(), "ghg-bench")
+DEFAULT_BASELINE = os.path.join(BENCH, "baseline.json")
+CAMS_NAME = "CAMS global greenhouse gas forecasts {}.nc"   # matches load_local.DATASETS["co2"]
+
+# ---------------- fixture paths ----------------
+def cams_dir(work, size, curvilinear=False):
+    d = os.path.join(work, "data", f"{size}{'-curv' if curvilinear else ''}")
+    fixtures.make_cams_nc(os.path.join(d, CAMS_NAME.format(size)), fixtures.SIZES[size],
+                          curvilinear=curvilinear)
+    return d
+
+def cams_latest(work, size):
+    """data dir holding cams_latest.nc, as fetch_ghg expects."""
+    d = os.path.join(work, "data", f"{size}-latest")
+    fixtures.make_cams_nc(os.path.join(d, "cams_latest.nc"), fixtures.SIZES[size])
+    return d
+
+def fresh_db(work, name):
+    os.makedirs(os.path.join(work, "db"), exist_ok=True)
+    return fixtures.migrated_db(os.path.join(work, "db", f"{name}.db"))
+
+def count(db, sql):
+    conn = sqlite3.connect(db)
+    try:
+        return conn.execute(sql).fetchone()[0]
+    finally:
+        conn.close()
+
+@contextlib.contextmanager
+def argv(*args):
+    saved = sys.argv
+    sys.argv = [args[0]] + [str(a) for a in args[1:]]
+    try:
+        yield
+    finally:
+        sys.argv = saved
+
+def timed(fn):
+    """(seconds, result) of fn() with the script's own output silenced."""
+    with open(os.devnull, "w") as null, contextlib.redirect_stdout(null), contextlib.redirect_stderr(null):
+        t0 = time.perf_counter()
+        out = fn()
+        return time.perf_counter() - t0, out
+
+def result(seconds, items, unit, **extra):
+    return {"seconds": round(seconds, 6), "items": items, "unit": unit,
+            "rate": round(items / seconds, 1) if seconds > 0 else None, **extra}
+
+# ---------------- ingest / queue cases (run in a child process) ----------------
+def case_load_local(work, size, mode=""):
+    t0 = time.perf_counter()
+    import load_local
+    imported = time.perf_counter() - t0
+    db = fresh_db(work, f"load_local-{mode or 'seq'}-{size}")
+    load_local.DB = db
+    load_local.DATA = __import__("pathlib").Path(cams_dir(work, size, curvilinear=(mode == "curv")))
+    flags = ["--parallel"] if mode == "parallel" else []
+    with argv("load_local.py", "--stride", 1, *flags):
+        secs, _ = timed(load_local.main)
+    return result(secs, count(db, "SELECT COUNT(*) FROM ghg_surface"), "rows", import_seconds=round(imported, 4))
+
+def case_load_cams(work, size, mode=""):
+    t0 = time.perf_counter()
+    import load_cams
+    imported = time.perf_counter() - t0
+    db = fresh_db(work, f"load_cams-{mode or 'mem'}-{size}")
+    nc = os.path.join(cams_dir(work, size), CAMS_NAME.format(size))
+    flags = ["--stream"] if mode == "stream" else []
+    with argv("load_cams.py", "--nc", nc, "--db", db, "--var", "co2", *flags):
+        secs, _ = timed(load_cams.main)
+    return result(secs, count(db, "SELECT COUNT(*) FROM co2_grid"), "rows", import_seconds=round(imported, 4))
+
+def case_load_sst(work, storage):
+    import load_sst
+    db = fresh_db(work, f"load_sst-{storage}")
+    load_sst.DB_PATH = db
+    load_sst.DATA_DIR = fixtures.make_sst_asc(os.path.join(work, "data", "sst"))
+    with argv("load_sst.py", "--storage", storage):
+        secs, _ = timed(load_sst.main)
+    return result(secs, 4 * 180 * 360, "cells")
+
+def _queue_db(work, name, markers):
+    db = fresh_db(work, name)
+    conn = sqlite3.connect(db)
+    fixtures.add_markers(conn, markers)
+    conn.close()
+    return db
+
+def _point_fetch_ghg(work, size, cache):
+    import fetch_ghg, cams_cache
+    fetch_ghg.DATA_DIR = cams_latest(work, size)
+    cams_cache.CACHE_DIR = os.path.join(work, "cache", size)
+    if cache == "cold":
+        shutil.rmtree(cams_cache.CACHE_DIR, ignore_errors=True)
+    elif cache == "warm":
+        cams_cache.open_cube(os.path.join(fetch_ghg.DATA_DIR, "cams_latest.nc"), fetch_ghg.cube_arrays,
+                             cams_cache.CACHE_DIR)
+    return fetch_ghg
+
+def case_fetch_ghg(work, markers, mode, size):
+    """mode: batch (warm cache), cold (batch, cache rebuilt), xarray (batch, --no-cache), loop (per job)."""
+    fetch_ghg = _point_fetch_ghg(work, size, "cold" if mode == "cold" else "warm")
+    db = _queue_db(work, f"fetch_ghg-{mode}-{markers}-{size}", markers)
+    fetch_ghg.DB = db
+    flags = {"batch": ["--batch"], "cold": ["--batch"], "xarray": ["--batch", "--no-cache"], "loop": []}[mode]
+    with argv("fetch_ghg.py", *flags):
+        secs, _ = timed(fetch_ghg.main)
+    done = count(db, "SELECT COUNT(*) FROM ghg_fetch_queue WHERE processed_at IS NOT NULL")
+    return result(secs, done, "jobs")
+
+def case_queue_daemon(work, markers, size):
+    _point_fetch_ghg(work, size, "warm")
+    import queue_daemon
+    db = _queue_db(work, f"queue_daemon-{markers}-{size}", markers)
+    with argv("queue_daemon.py", "--db", db, "--once"):
+        secs, _ = timed(queue_daemon.main)
+    done = count(db, "SELECT COUNT(*) FROM ghg_fetch_queue WHERE processed_at IS NOT NULL")
+    return result(secs, done, "jobs")
+
+def case_process_queue(work, markers, size):
+    """worker/process.queue.py (CAMS file only: the scratch DB has no snapshots or SST)."""
+    _point_fetch_ghg(work, size, "warm")
+    import cli
+    process_queue = cli.load("worker/process.queue.py")  # not an importable module name
+    db = _queue_db(work, f"process_queue-{markers}-{size}", markers)
+    with argv("process.queue.py", "--db", db):
+        secs, _ = timed(process_queue.main)
+    done = count(db, "SELECT COUNT(*) FROM ghg_fetch_queue WHERE processed_at IS NOT NULL")
+    return result(secs, done, "jobs")
+
+def case_download(work, size, mode):
+    """mode: cold (full transfer), resume (connection dropped half-way), cached (no network)."""
+    import download, instrument
+    nc = os.path.join(cams_dir(work, size), CAMS_NAME.format(size))
+    bundle = fixtures.make_bundle_zip(os.path.join(work, "data", f"bundle-{size}.zip"), nc, fixtures.BUNDLE_MB[size])
+    nbytes = os.path.getsize(bundle)
+    url, server = fixtures.serve_file(bundle, cut_after=nbytes // 2 if mode == "resume" else None)
+    cache_dir = os.path.join(work, "cache", f"downloads-{size}-{mode}")
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    try:
+        if mode == "cached":
+            download.fetch(url, cache_dir=cache_dir)
+        rss0 = instrument.peak_rss_mb()
+        secs, art = timed(lambda: download.fetch(url, backoff=0, cache_dir=cache_dir))
+        members = list(download.members(art, lambda name: name.endswith(".nc"), cache_dir=cache_dir))
+    finally:
+        server.shutdown()
+    if art.size != nbytes or len(members) != 1:
+        raise RuntimeError(f"download: got {art.size} of {nbytes} bytes, {len(members)} members")
+    return result(secs, nbytes, "bytes", rss_growth_mb=round(instrument.peak_rss_mb() - rss0, 1))
+
+CDS_REQUEST = {"variable": [f"var_{i:02d}" for i in range(8)], "date": ["2025-04-04/2025-07-31"],
+               "data_format": "netcdf"}
+
+def case_cds(work, mode):
+    """
+    mode: single (one request), chunked (variable x month on 8 threads, 1 in 7 calls
+    failing once), refresh (chunked, then the end date moves into a new month).
+    """
+    import cds_retrieve
+    cache_dir = os.path.join(work, "cache", f"cds-{mode}")
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    client = fixtures.MockCDS(fail_every=7 if mode == "chunked" else 0)
+    run = lambda req, **kw: cds_retrieve.retrieve("mock-cams", req, client=client, backoff=0, cache_dir=cache_dir, **kw)
+    if mode == "single":
+        secs, pieces = timed(lambda: run(CDS_REQUEST, workers=1, months=0, by_variable=False))
+    elif mode == "chunked":
+        secs, pieces = timed(lambda: run(CDS_REQUEST, workers=8))
+    else:
+        timed(lambda: run(CDS_REQUEST, workers=8))
+        client.calls = 0
+        secs, pieces = timed(lambda: run({**CDS_REQUEST, "date": ["2025-04-04/2025-08-03"]}, workers=8))
+    view = cds_retrieve.write_view(os.path.join(cache_dir, "view.json"), "mock-cams", pieces)
+    t0 = time.perf_counter()
+    ds = cds_retrieve.open_view(view)
+    first = float(ds[CDS_REQUEST["variable"][-1]].isel(time=-1, latitude=0, longitude=0))
+    open_s = time.perf_counter() - t0
+    return result(secs, len(pieces), "chunks", calls=client.calls, steps=ds.sizes["time"],
+                  open_seconds=round(open_s, 4), sample=round(first, 3))
+def case_enrich(work, size, mode):
+    """queue_daemon over the served DB's 1000 markers re-queued; mode: profile (all layers) or cams-only."""
+    _point_fetch_ghg(work, size, "warm")
+    import queue_daemon
+    db = os.path.join(work, "db", f"enrich-{mode}-{size}.db")
+    shutil.copyfile(served_db(work, size), db)
+    conn = sqlite3.connect(db)
+    with conn:
+        conn.execute("DELETE FROM ghg_observation")
+        conn.execute("UPDATE ghg_fetch_queue SET processed_at = NULL")
+    conn.close()
+    flags = ["--cams-only"] if mode == "cams-only" else []
+    with argv("queue_daemon.py", "--db", db, "--once", *flags):
+        secs, _ = timed(queue_daemon.main)
+    done = count(db, "SELECT COUNT(*) FROM ghg_fetch_queue WHERE processed_at IS NOT NULL")
+    return result(secs, done, "jobs", variables=count(db, "SELECT COUNT(DISTINCT variable) FROM ghg_observation"),
+                  rows=count(db, "SELECT COUNT(*) FROM ghg_observation"))
+
+def case_ensemble(work, size, members, mode):
+    """ensemble.py over the served DB's snapshot with 50 factories; mode: strength (shared sites) or jitter."""
+    import ensemble
+    db = os.path.join(work, "db", f"ensemble-{size}.db")
+    if not os.path.exists(db):
+        shutil.copyfile(served_db(work, size), db + ".tmp")
+        conn = sqlite3.connect(db + ".tmp")
+        with conn:
+            conn.execute("DELETE FROM markers WHERE id > 50")
+        conn.close()
+        os.replace(db + ".tmp", db)
+    flags = ["--jitter-km", 10] if mode == "jitter" else []
+    with argv("ensemble.py", "--db", db, "--members", members, "--threshold", 420, "--seed", 1, "--keep", 1, *flags):
+        secs, _ = timed(ensemble.main)
+    cells = count(db, "SELECT COUNT(*) FROM ensemble_surface")
+    return result(secs, int(members) * cells, "member-cells", members=int(members), cells=cells)
+
+def _probe(db, stop, out):
+    """
+    Child process standing in for SQLPage during a load: a map read of the current
+    co2 snapshot every 10 ms and a queued-marker insert every 50 ms, each on its own
+    connection with sqlite3's default 5 s busy timeout. Puts (read_ms, write_ms, errors).
+    """
+    import random
+    reader, writer = sqlite3.connect(db), sqlite3.connect(db)
+    reads, writes, errors, i = [], [], 0, 0
+    rnd = random.Random(5)
+    while not stop.is_set():
+        lat, lon = rnd.uniform(-60, 70), rnd.uniform(-180, 180)
+        t0 = time.perf_counter()
+        try:
+            reader.execute("""
+                SELECT s.value FROM ghg_surface s
+                JOIN surface_snapshot c ON c.variable = s.variable AND c.obs_time = s.obs_time AND c.is_current = 1
+                WHERE s.variable = 'co2' AND s.lat BETWEEN ? AND ? AND s.lon BETWEEN ? AND ? LIMIT 1
+            """, (lat - 2, lat + 2, lon - 2, lon + 2)).fetchall()
+            reads.append((time.perf_counter() - t0) * 1000)
+        except sqlite3.OperationalError:
+            errors += 1
+        if i % 5 == 0:
+            t0 = time.perf_counter()
+            try:
+                with writer:
+                    writer.execute("INSERT INTO ghg_fetch_queue (marker_id, lat, lon) VALUES (1, ?, ?)", (lat, lon))
+                writes.append((time.perf_counter() - t0) * 1000)
+            except sqlite3.OperationalError:
+                errors += 1
+        i += 1
+        time.sleep(0.01)
+    out.put((reads, writes, errors))
+
+def case_contention(work, size):
+    """load_local --full over the served DB's snapshot while _probe reads the map and queues markers."""
+    import multiprocessing, pathlib, load_local
+    import numpy as np
+    db = os.path.join(work, "db", f"contention-{size}.db")
+    shutil.copyfile(served_db(work, size), db)
+    load_local.DB, load_local.DATA = db, pathlib.Path(cams_dir(work, size))
+    stop, out = multiprocessing.Event(), multiprocessing.Queue()
+    probe = multiprocessing.Process(target=_probe, args=(db, stop, out))
+    probe.start()
+    time.sleep(0.2)
+    with argv("load_local.py", "--stride", 1, "--full"):
+        secs, _ = timed(load_local.main)
+    stop.set()
+    reads, writes, errors = out.get()
+    probe.join()
+    pct = lambda xs, q: round(float(np.percentile(xs, q)), 3) if xs else None
+    return result(secs, count(db, "SELECT COUNT(*) FROM ghg_surface"), "rows",
+                  reads=len(reads), read_p95_ms=pct(reads, 95), read_max_ms=pct(reads, 100),
+                  writes=len(writes), write_p95_ms=pct(writes, 95), write_max_ms=pct(writes, 100),
+                  lock_errors=errors)
+
+# ---------------- endpoints ----------------
+def served_db(work, size):
+    """DB in the state SQLPage serves: surface, co2_grid, SST, markers with observations, scenario."""
+    path = os.path.join(work, "db", f"served-{size}.db")
+    tmp = fresh_db(work, f"served-{size}.tmp")  # also refreshes the migrated template
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(os.path.join(work, "db", "_migrated.db")):
+        os.remove(tmp)
+        return path
+    import load_local, load_cams, load_sst, scenario_engine, pathlib
+    fetch_ghg = _point_fetch_ghg(work, size, "warm")
+    load_local.DB, load_local.DATA = tmp, pathlib.Path(cams_dir(work, size))
+    load_sst.DB_PATH, load_sst.DATA_DIR = tmp, fixtures.make_sst_asc(os.path.join(work, "data", "sst"))
+    nc = os.path.join(cams_dir(work, size), CAMS_NAME.format(size))
+    conn = sqlite3.connect(tmp)
+    fixtures.add_markers(conn, 1000)
+    conn.close()
+    fetch_ghg.DB = tmp
+    with argv("load_local.py", "--stride", 1):
+        timed(load_local.main)
+    with argv("load_cams.py", "--nc", nc, "--db", tmp, "--var", "co2"):
+        timed(load_cams.main)
+    with argv("load_sst.py", "--storage", "both"):
+        timed(load_sst.main)
+    with argv("fetch_ghg.py", "--batch"):
+        timed(fetch_ghg.main)
+    conn = sqlite3.connect(tmp)
+    timed(lambda: scenario_engine.refresh(conn))
+    conn.close()
+    import ensemble
+    with argv("ensemble.py", "--db", tmp, "--members", 100, "--threshold", 420, "--seed", 1, "--workers", 1):
+        timed(ensemble.main)
+    os.replace(tmp, path)
+    return path
+
+TXN_CONTROL = ("BEGIN", "COMMIT", "END", "ROLLBACK")
+SQLPAGE_CALL = re.compile(r"sqlpage\.\w+\((?:\s*'[^']*'\s*,?)*\)")
+
+def statements(sql):
+    """
+    Split an endpoint file into statements (sqlite3.complete_statement handles
+    comments/strings). The file's own BEGIN/COMMIT are dropped: every call runs
+    inside the benchmark's rolled-back transaction instead. Calls to SQLPage's
+    own functions on literals (sqlpage.environment_variable('X')) are evaluated
+    by SQLPage before the query reaches SQLite; here they become NULL.
+    """
+    out, buf = [], ""
+    sql = SQLPAGE_CALL.sub("NULL", sql)
+    for line in sql.splitlines(keepends=True):
+        buf += line
+        if sqlite3.complete_statement(buf):
+            code = [l.strip() for l in buf.splitlines() if l.strip() and not l.strip().startswith("--")]
+            if code and code[0].rstrip(";").split()[0].upper() not in TXN_CONTROL:
+                out.append(buf)
+            buf = ""
+    return out
+
+def endpoint_params(rng, marker_ids):
+    z = int(rng.integers(0, 7))
+    lat, lon = float(rng.uniform(-60, 70)), float(rng.uniform(-180, 180))
+    return {
+        "variable": "co2", "z": z, "x": int(rng.integers(0, 1 << z)), "y": int(rng.integers(0, 1 << z)),
+        "lat": lat, "lon": lon, "latitude": lat, "longitude": lon, "title": "bench",
+        "marker_id": int(rng.choice(marker_ids)), "id": int(rng.choice(marker_ids)), "co": None,
+        "ensemble": None, "stat": str(rng.choice(["mean", "p95", "p_exceed"])),
+    }
+
+def case_endpoints(work, size, repeat):
+    import numpy as np
+    db = served_db(work, size)
+    conn = sqlite3.connect(db, isolation_level=None)
+    marker_ids = [r[0] for r in conn.execute("SELECT id FROM markers")]
+    rng = np.random.default_rng(3)
+    out = {}
+    for path in sorted(glob.glob(os.path.join(ROOT, "*.sql"))):
+        stmts = statements(open(path).read())
+        times, err = [], None
+        for _ in range(repeat):
+            params = endpoint_params(rng, marker_ids)
+            conn.execute("BEGIN")
+            try:
+                t0 = time.perf_counter()
+                for s in stmts:
+                    conn.execute(s, params).fetchall()
+                times.append(time.perf_counter() - t0)
+            except sqlite3.Error as e:
+                err = str(e)
+                break
+            finally:
+                conn.execute("ROLLBACK")
+        name = f"endpoint:{os.path.basename(path)}"
+        if err:
+            out[name] = {"error": err}
+            continue
+        times.sort()
+        p50 = statistics.median(times)
+        out[name] = {"seconds": round(p50, 6), "items": repeat, "unit": "calls",
+                     "p50_ms": round(p50 * 1e3, 3), "p95_ms": round(times[int(0.95 * (len(times) - 1))] * 1e3, 3)}
+    conn.close()
+    return out
+
+# ---------------- plan / driver ----------------
+def plan(sizes, marker_counts):
+    cases = []
+    for size in sizes:
+        cases += [f"load_local:{size}", f"load_local:{size}:parallel", f"load_local:{size}:curv",
+                  f"load_cams:{size}", f"load_cams:{size}:stream"]
+        cases += [f"download:{size}:{mode}" for mode in ("cold", "resume", "cached")]
+    cases += ["load_sst:rows", "load_sst:blob", "cds:single", "cds:chunked", "cds:refresh"]
+    size = sizes[-1]  # queue cases sample the largest requested grid
+    for n in marker_counts:
+        cases += [f"fetch_ghg:{n}:batch:{size}", f"fetch_ghg:{n}:xarray:{size}", f"queue_daemon:{n}:{size}",
+                  f"process_queue:{n}:{size}"]
+        if n <= 1000:
+            cases.append(f"fetch_ghg:{n}:loop:{size}")   # one transaction per job; too slow beyond this
+    cases += [f"fetch_ghg:{max(marker_counts)}:cold:{size}", f"enrich:{size}:profile", f"enrich:{size}:cams-only",
+              f"ensemble:{size}:1000:strength", f"ensemble:{size}:100:jitter", f"contention:{size}",
+              f"endpoints:{size}"]
+    return cases
+
+def run_case(case, work, repeat):
+    kind, *args = case.split(":")
+    import regrid
+    regrid.CACHE_DIR = os.path.join(work, "cache", "regrid")  # weights persist between bench runs
+    if kind == "load_local":
+        return {case: case_load_local(work, *args)}
+    if kind == "load_cams":
+        return {case: case_load_cams(work, *args)}
+    if kind == "load_sst":
+        return {case: case_load_sst(work, *args)}
+    if kind == "fetch_ghg":
+        return {case: case_fetch_ghg(work, int(args[0]), *args[1:])}
+    if kind == "queue_daemon":
+        return {case: case_queue_daemon(work, int(args[0]), *args[1:])}
+    if kind == "process_queue":
+        return {case: case_process_queue(work, int(args[0]), *args[1:])}
+    if kind == "enrich":
+        return {case: case_enrich(work, *args)}
+    if kind == "ensemble":
+        return {case: case_ensemble(work, *args)}
+    if kind == "contention":
+        return {case: case_contention(work, *args)}
+    if kind == "download":
+        return {case: case_download(work, *args)}
+    if kind == "cds":
+        return {case: case_cds(work, *args)}
+    if kind == "endpoints":
+        return case_endpoints(work, args[0], repeat)
+    raise ValueError(f"unknown case {case}")
+
+def run_child(case, work, repeat):
+    """Each case gets a fresh interpreter: clean imports, module globals and page cache state."""
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", case, "--workdir", work, "--repeat", str(repeat)],
+        capture_output=True, text=True, cwd=ROOT,
+        env={**os.environ, "GHG_METRICS_DIR": os.path.join(work, "metrics")}  # keep bench runs out of data/metrics
+    )
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode or not lines:
+        tail = (proc.stderr or proc.stdout).strip().splitlines()[-1:] or ["no output"]
+        return {case: {"error": tail[0]}}
+    return json.loads(lines[-1])
+
+def compare(results, baseline, tolerance):
+    """[(case, base_s, new_s, ratio)] for cases slower than baseline * (1 + tolerance)."""
+    slow = []
+    for case, r in results.items():
+        b = baseline.get("cases", {}).get(case)
+        if not b or "seconds" not in b or "seconds" not in r or not b["seconds"]:
+            continue
+        ratio = r["seconds"] / b["seconds"]
+        r["vs_baseline"] = round(ratio, 3)
+        if ratio > 1.0 + tolerance:
+            slow.append((case, b["seconds"], r["seconds"], ratio))
+    return slow
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workdir", default=DEFAULT_WORKDIR, help="Fixtures and scratch DBs (reused between runs)")
+    ap.add_argument("--sizes", default="small,medium", help=f"Grid sizes: {','.join(fixtures.SIZES)}")
+    ap.add_argument("--markers", default="10,1000,10000", help="Marker counts for queue cases")
+    ap.add_argument("--repeat", type=int, default=50, help="Calls per endpoint")
+    ap.add_argument("--only", default="", help="Run cases whose name contains this")
+    ap.add_argument("--out", default=os.path.join(BENCH, "results.json"))
+    ap.add_argument("--baseline", default="", help="Compare against this results file")
+    ap.add_argument("--save-baseline", action="store_true", help=f"Also write results to {DEFAULT_BASELINE}")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown vs baseline (0.25 = 25%%)")
+    ap.add_argument("--child", default="", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        print(json.dumps(run_case(args.child, args.workdir, args.repeat)))
+        return
+
+    os.makedirs(args.workdir, exist_ok=True)
+    sizes = [s for s in args.sizes.split(",") if s]
+    cases = [c for c in plan(sizes, [int(n) for n in args.markers.split(",")]) if args.only in c]
+    results = {}
+    for case in cases:
+        for name, r in run_child(case, args.workdir, args.repeat).items():
+            results[name] = r
+            if "error" in r:
+                print(f"[bench] {name:<40} ERROR {r['error']}")
+            elif "p50_ms" in r:
+                print(f"[bench] {name:<40} p50 {r['p50_ms']:>9.3f} ms  p95 {r['p95_ms']:>9.3f} ms")
+            else:
+                print(f"[bench] {name:<40} {r['seconds']:>8.3f} s  {r['rate'] or 0:>12,.0f} {r['unit']}/s")
+                if "read_p95_ms" in r:
+                    print(f"[bench] {'':<40} reads p95 {r['read_p95_ms']} ms, writes max {r['write_max_ms']} ms, "
+                          f"{r['lock_errors']} lock errors")
+
+    report = {
+        "meta": {"when": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "python": platform.python_version(),
+                 "sqlite": sqlite3.sqlite_version, "machine": platform.node(), "sizes": sizes},
+        "cases": results,
+    }
+    slow = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            slow = compare(results, json.load(f), args.tolerance)
+        for case, b, n, ratio in slow:
+            print(f"[REGRESSION] {case}: {b:.4f}s -> {n:.4f}s ({ratio:.2f}x)")
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    if args.save_baseline:
+        shutil.copyfile(args.out, DEFAULT_BASELINE)
+    print(f"[bench] wrote {args.out}")
+    sys.exit(1 if slow else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+cams_cache.py  (memory-mapped CAMS cube for marker lookups)
+
+- The chosen NetCDF is converted once into data/cache/cams/<stem>-<key>/:
+  lat.npy, lon.npy, one <variable>.npy per 2D field and meta.json (units, obs_time).
+- <key> hashes the source path, size and mtime, so a new cams_latest.nc gets a new
+  directory; older caches of the same file are removed when it is built.
+- Lookups open the .npy files with mmap_mode="r" and index them directly:
+  no xarray/netCDF decode on a warm start, a few microseconds per marker.
+"""
+
+import os, json, shutil, hashlib, tempfile
+from collections import namedtuple
+from itertools import repeat
+import numpy as np
+
+ROOT = os.path.dirname(__file__)
+CACHE_DIR = os.path.join(ROOT, "data", "cache", "cams")
+
+# fields: {variable: (memmap (nlat, nlon), unit)}
+Cube = namedtuple("Cube", "source obs_time lat lon lon360 fields")
+
+def cache_key(path: str) -> str:
+    st = os.stat(path)
+    raw = f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}"
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+def cache_path(path: str, cache_dir: str = None) -> str:
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir or CACHE_DIR, f"{stem}-{cache_key(path)}")
+
+def build(path: str, load, cache_dir: str = None) -> str:
+    """Convert `path` via load(path) -> (obs_time, lat, lon, {var: (2D array, unit)})."""
+    cache_dir = cache_dir or CACHE_DIR
+    dest = cache_path(path, cache_dir)
+    obs_time, lat, lon, fields = load(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=cache_dir, prefix=".build-")
+    try:
+        np.save(os.path.join(tmp, "lat.npy"), np.asarray(lat, dtype=np.float64))
+        np.save(os.path.join(tmp, "lon.npy"), np.asarray(lon, dtype=np.float64))
+        meta = {"source": os.path.abspath(path), "obs_time": obs_time, "fields": {}}
+        for i, (name, (arr, unit)) in enumerate(fields.items()):
+            fname = f"f{i}.npy"  # variable names aren't always safe file names
+            np.save(os.path.join(tmp, fname), np.ascontiguousarray(arr))
+            meta["fields"][name] = {"file": fname, "unit": unit}
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, dest)  # atomic publish; a concurrent builder may have won
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not os.path.exists(os.path.join(dest, "meta.json")):
+            raise
+    prune(path, cache_dir, keep=dest)
+    return dest
+
+def prune(path: str, cache_dir: str = None, keep: str = None):
+    """Drop caches of older versions of `path`."""
+    cache_dir = cache_dir or CACHE_DIR
+    stem = os.path.splitext(os.path.basename(path))[0]
+    for name in os.listdir(cache_dir):
+        d = os.path.join(cache_dir, name)
+        if name.rsplit("-", 1)[0] == stem and d != keep:
+            shutil.rmtree(d, ignore_errors=True)
+
+def open_cube(path: str, load, cache_dir: str = None) -> Cube:
+    """Memory-mapped cube for `path`, building the cache first if it is missing or stale."""
+    cache_dir = cache_dir or CACHE_DIR
+    d = cache_path(path, cache_dir)
+    if not os.path.exists(os.path.join(d, "meta.json")):
+        print(f"[CACHE] converting {path} -> {d}")
+        d = build(path, load, cache_dir)
+    with open(os.path.join(d, "meta.json")) as f:
+        meta = json.load(f)
+    lat = np.load(os.path.join(d, "lat.npy"))
+    lon = np.load(os.path.join(d, "lon.npy"))
+    fields = {
+        name: (np.load(os.path.join(d, m["file"]), mmap_mode="r"), m["unit"])
+        for name, m in meta["fields"].items()
+    }
+    return Cube(meta["source"], meta["obs_time"], lat, lon, bool(lon.max() > 180), fields)
+
+def nearest_index(axis, values):
+    """Index of the nearest axis entry for each value (axis ascending or descending)."""
+    values = np.asarray(values, dtype=np.float64)
+    desc = axis[0] > axis[-1]
+    a = axis[::-1] if desc else axis
+    i = np.clip(np.searchsorted(a, values), 1, len(a) - 1)
+    i -= (values - a[i - 1]) < (a[i] - values)  # ties go to the larger coordinate, like xarray
+    return len(a) - 1 - i if desc else i
+
+def sample(cube: Cube, marker_ids, lats, lons):
+    """(obs_time, ghg_observation rows) for many markers; same rows as fetch_ghg.sample_markers."""
+    lons = np.asarray(lons, dtype=np.float64)
+    if cube.lon360:
+        lons = lons % 360.0
+    r = nearest_index(cube.lat, lats)
+    c = nearest_index(cube.lon, lons)
+    rows = []
+    for v, (arr, unit) in cube.fields.items():
+        vals = np.asarray(arr[r, c], dtype=float)
+        rows.extend(zip(marker_ids, repeat(cube.obs_time), repeat(v), vals.tolist(), repeat(unit)))
+    return cube.obs_time, rows
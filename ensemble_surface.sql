@@ -0,0 +1,50 @@
+-- ensemble_surface.sql
+-- Summary surface of a Monte Carlo ensemble over factory configurations (illustrative model)
+-- Params: :ensemble (ensemble_run id, default the newest), :stat ('mean' | 'p05' | 'p95' | 'p_exceed', default 'mean')
+-- Reads the tables written by worker/ensemble.py; value = baseline + the delta statistic,
+-- or the exceedance probability for 'p_exceed'.
+
+WITH params AS (
+SELECT COALESCE(CAST(NULLIF(:ensemble,'') AS INTEGER), (SELECT MAX(id) FROM ensemble_run)) AS ensemble_id,
+        COALESCE(NULLIF(:stat,''), 'mean') AS stat
+),
+rows AS (
+SELECT e.lat,
+        e.lon,
+        e.baseline,
+        e.mean,
+        e.p05,
+        e.p95,
+        e.p_exceed,
+        CASE (SELECT stat FROM params)
+          WHEN 'p05' THEN e.baseline + e.p05
+          WHEN 'p95' THEN e.baseline + e.p95
+          WHEN 'p_exceed' THEN e.p_exceed
+          ELSE e.baseline + e.mean
+        END AS value
+FROM ensemble_surface e
+WHERE e.ensemble_id = (SELECT ensemble_id FROM params)
+)
+SELECT
+'json' AS component,
+json_object(
+    'type', 'FeatureCollection',
+    'ensemble', (SELECT json_object('id', r.id, 'name', r.name, 'variable', r.variable, 'members', r.members,
+                                    'threshold', r.threshold, 'created_at', r.created_at)
+                 FROM ensemble_run r WHERE r.id = (SELECT ensemble_id FROM params)),
+    'features', json_group_array(
+    json_object(
+        'type', 'Feature',
+        'properties', json_object(
+        'value', value,
+        'baseline', baseline,
+        'mean', mean,
+        'p05', p05,
+        'p95', p95,
+        'p_exceed', p_exceed
+        ),
+        'geometry', json_object('type', 'Point', 'coordinates', json_array(lon, lat))
+    )
+    )
+) AS value
+FROM rows;
@@ -3,28 +3,40 @@
 fetch_ghg.py  (NetCDF, process ALL queued markers)
 
 - Uses an existing NetCDF in ./data if found (fast).
-- Otherwise downloads one from ADS.
+- Otherwise retrieves REQUEST from ADS in chunks (per variable and month, in
+  parallel, see worker/cds_retrieve.py) and reads them through one lazily
+  merged view, data/cams_latest.json.
 - Opens .nc via netcdf4 (fallback to h5netcdf).
 - Inserts rows into ghg_observation and marks jobs processed.
+- Jobs are leased, completed and retried / dead-lettered through
+  worker/queue_daemon.py (claim/complete/fail), so this one-shot run and any
+  number of queue daemons can share the queue without writing a job twice.
+- --batch: claims every pending job and samples all markers in one pointwise sel.
+- Markers are sampled from a memory-mapped cache of the file (cams_cache.py),
+  converted on first use; --no-cache reads through xarray instead.
+- The other loaded layers (current ghg_surface snapshots, SST climatology) are
+  sampled in the same pass (worker/enrich.py); --cams-only skips them.
 
 Requires (in your venv):
   pip install cdsapi xarray netcdf4 h5netcdf cftime pandas
 """
 
-import os, sqlite3, glob, time
+import os, sys, glob, argparse
 from datetime import datetime
-import xarray as xr
+from functools import partial
+from itertools import repeat
+import numpy as np
+import cams_cache
 
-# Optional (only needed if we must download)
-try:
-    import cdsapi
-except Exception:
-    cdsapi = None
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "worker"))
+from instrument import job, stage
+from database import connect
+import queue_daemon  # imports this module too; only its functions are used, at call time
 
 ROOT = os.path.dirname(__file__)
 DB   = os.path.join(ROOT, "sqlpage", "sqlpage.db")
 DATA_DIR = os.path.join(ROOT, "data")
-os.makedirs(DATA_DIR, exist_ok=True)
+CDS_WORKERS = 4   # chunk requests in flight at once
 
 # ADS dataset + request (kept as NetCDF)
 DATASET = "cams-global-greenhouse-gas-forecasts"
@@ -54,10 +66,11 @@ REQUEST = {
 }
 
 def pick_existing_nc() -> str | None:
-    """Prefer ./data/cams_latest.nc, else most recent *.nc under data/."""
-    preferred = os.path.join(DATA_DIR, "cams_latest.nc")
-    if os.path.exists(preferred) and os.path.getsize(preferred) > 0:
-        return preferred
+    """Prefer ./data/cams_latest.nc, then the chunked view cams_latest.json, else most recent *.nc under data/."""
+    for name in ("cams_latest.nc", "cams_latest.json"):
+        preferred = os.path.join(DATA_DIR, name)
+        if os.path.exists(preferred) and os.path.getsize(preferred) > 0:
+            return preferred
     candidates = sorted(
         glob.glob(os.path.join(DATA_DIR, "*.nc")),
         key=lambda p: os.path.getmtime(p),
@@ -66,21 +79,28 @@ def pick_existing_nc() -> str | None:
     return candidates[0] if candidates else None
 
 def ensure_nc_file() -> str:
-    """Return path to a NetCDF we can use (existing or freshly downloaded)."""
+    """Return path to a NetCDF (or chunked view) we can use (existing or freshly downloaded)."""
     existing = pick_existing_nc()
     if existing:
         print(f"[USE] Using existing NetCDF: {existing}")
         return existing
-    if cdsapi is None:
+    try:
+        import cdsapi  # only needed if we must download
+    except Exception:
         raise RuntimeError("No NetCDF in ./data and cdsapi not available to download one.")
-    out_path = os.path.join(DATA_DIR, "cams_latest.nc")
-    print("[DL] Requesting CAMS file from ADS…")
-    cdsapi.Client(url="https://ads.atmosphere.copernicus.eu/api").retrieve(DATASET, REQUEST).download(out_path)
+    from cds_retrieve import retrieve, write_view
+    print("[DL] Requesting CAMS chunks from ADS…")
+    pieces = retrieve(DATASET, REQUEST, workers=CDS_WORKERS)
+    out_path = write_view(os.path.join(DATA_DIR, "cams_latest.json"), DATASET, pieces)
     print(f"[DL] Saved: {out_path}")
     return out_path
 
 def open_ds(path: str):
     """Open .nc using netcdf4; fallback to h5netcdf with clear error if both fail."""
+    if path.endswith(".json"):
+        from cds_retrieve import open_view
+        return open_view(path)
+    import xarray as xr  # not needed when sampling from the cams_cache memmap
     try:
         return xr.open_dataset(path, engine="netcdf4")
     except Exception as e1:
@@ -92,13 +112,27 @@ def open_ds(path: str):
                 "Install: pip install netcdf4 h5netcdf cftime"
             )
 
-def nearest_point(ds, lat, lon):
+def coord_names(ds):
     latn = "latitude" if "latitude" in ds.coords else ("lat" if "lat" in ds.coords else None)
     lonn = "longitude" if "longitude" in ds.coords else ("lon" if "lon" in ds.coords else None)
     if not latn or not lonn:
         raise RuntimeError("Dataset missing latitude/longitude coords")
+    return latn, lonn
+
+def nearest_point(ds, lat, lon):
+    latn, lonn = coord_names(ds)
     return ds.sel({latn: lat, lonn: lon}, method="nearest")
 
+def nearest_points(ds, lats, lons):
+    """Pointwise nearest selection for many markers at once (new 'job' dim)."""
+    import xarray as xr
+    latn, lonn = coord_names(ds)
+    lons = np.asarray(lons, dtype=float)
+    if float(ds[lonn].max()) > 180:  # dataset on 0..360
+        lons = lons % 360.0
+    return ds.sel({latn: xr.DataArray(np.asarray(lats, dtype=float), dims="job"),
+                   lonn: xr.DataArray(lons, dims="job")}, method="nearest")
+
 def extract_timestamp(ds):
     for k in ("valid_time","time","initial_time","forecast_reference_time"):
         if k in ds.coords:
@@ -106,64 +140,135 @@ def extract_timestamp(ds):
             return str(v) if not isinstance(v, datetime) else v.isoformat()
     return datetime.utcnow().isoformat()
 
-def write_rows(conn, marker_id, obs_time, rows):
-    if not rows:
-        return 0
-    conn.executemany(
-        "INSERT INTO ghg_observation (marker_id, obs_time, variable, value, unit) VALUES (?,?,?,?,?)",
-        [(marker_id, obs_time, var, float(val), unit) for (var, val, unit) in rows]
-    )
-    conn.commit()
-    return len(rows)
-
-def process_one(conn, ds, job):
-    jid, marker_id, lat, lon = job
-    d = ds
+def first_step(ds):
     # Many files are time/step multidimensional; take first for popup
     for dim in ("time","step"):
-        if dim in d.dims:
-            d = d.isel({dim: 0})
+        if dim in ds.dims:
+            ds = ds.isel({dim: 0})
+    return ds
+
+def process_one(conn, sample, worker_id, job):
+    jid, marker_id, lat, lon, _ = job
+    with stage("sample") as st:
+        obs_time, rows = sample([marker_id], [lat], [lon])
+        st.rows(1)
 
-    pt = nearest_point(d, lat, lon)
-    obs_time = extract_timestamp(pt)
+    with stage("write") as st:  # rows keep their layer's obs_time
+        n = queue_daemon.complete(conn, worker_id, [job], obs_time, rows)
+        st.rows(len(rows) if n else 0)
+    if n:
+        print(f"[OK] job {jid} marker {marker_id}: inserted {len(rows)} vars @ {obs_time}")
+    else:
+        print(f"[SKIP] job {jid}: lease lost to another worker")
+
+def claim_all(conn, worker_id):
+    """Lease every visible job (not done, leased elsewhere, backing off or dead)."""
+    return queue_daemon.claim(conn, worker_id, -1)
+
+def sample_markers(ds, marker_ids, lats, lons):
+    """(obs_time, ghg_observation rows) for many markers from one pointwise sel."""
+    pts = nearest_points(first_step(ds), lats, lons)
+    obs_time = extract_timestamp(pts)
 
     rows = []
-    for v in pt.data_vars:
-        da = pt[v]
+    for v in pts.data_vars:
+        da = pts[v]
+        if da.dims != ("job",):
+            continue  # extra dims (e.g. level) aren't a single value per marker
         try:
-            val = float(getattr(da, "values"))
+            vals = np.asarray(da.values, dtype=float)
         except Exception:
             continue
         unit = da.attrs.get("units", "")
-        rows.append((v, val, unit))
+        rows.extend(zip(marker_ids, repeat(obs_time), repeat(v), vals.tolist(), repeat(unit)))
+    return obs_time, rows
+
+def cube_arrays(path: str):
+    """(obs_time, lat, lon, {var: (2D array, unit)}) of the first step, for cams_cache."""
+    ds = first_step(open_ds(path))
+    try:
+        latn, lonn = coord_names(ds)
+        fields = {}
+        for v in ds.data_vars:
+            da = ds[v]
+            if set(da.dims) != {latn, lonn}:
+                continue  # extra dims (e.g. level) aren't a single value per marker
+            arr = da.transpose(latn, lonn).values
+            if not np.issubdtype(arr.dtype, np.number):
+                continue
+            fields[v] = (arr, da.attrs.get("units", ""))
+        return extract_timestamp(ds), ds[latn].values, ds[lonn].values, fields
+    finally:
+        ds.close()
 
-    n = write_rows(conn, marker_id, obs_time, rows)
-    conn.execute("UPDATE ghg_fetch_queue SET processed_at=CURRENT_TIMESTAMP WHERE id=?", (jid,))
-    conn.commit()
-    print(f"[OK] job {jid} marker {marker_id}: inserted {n} vars @ {obs_time}")
+def open_sampler(nc_path: str, use_cache: bool = True):
+    """sample(marker_ids, lats, lons) -> (obs_time, rows), from the memmap cache or xarray."""
+    if use_cache:
+        return partial(cams_cache.sample, cams_cache.open_cube(nc_path, cube_arrays))
+    return partial(sample_markers, open_ds(nc_path))
+
+def process_batch(conn, sample, worker_id, jobs):
+    """All jobs in one vectorized lookup, one executemany, one transaction."""
+    ids, marker_ids, lats, lons, _ = zip(*jobs)
+    with stage("sample") as st:
+        obs_time, rows = sample(marker_ids, lats, lons)
+        st.rows(len(jobs))
+
+    with stage("write") as st:
+        n = queue_daemon.complete(conn, worker_id, jobs, obs_time, rows)
+        st.rows(n)
+    print(f"[OK] batch of {len(jobs)} jobs: {n} completed, {len(rows)} rows sampled @ {obs_time}")
 
 def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--batch", action="store_true",
+                    help="Claim every pending job and process them in one vectorized pass")
+    ap.add_argument("--no-cache", action="store_true",
+                    help="Read the NetCDF through xarray instead of the memory-mapped cache")
+    ap.add_argument("--cams-only", action="store_true",
+                    help="Sample only the CAMS file, not the surface snapshots / SST in the DB")
+    args = ap.parse_args()
+
     print("[INFO] DB:", DB)
-    nc_path = ensure_nc_file()
-    ds = open_ds(nc_path)
+    with stage("open"):
+        nc_path = ensure_nc_file()
+        sample = open_sampler(nc_path, use_cache=not args.no_cache)
 
-    conn = sqlite3.connect(DB)
-    qn = conn.execute("SELECT COUNT(*) FROM ghg_fetch_queue WHERE processed_at IS NULL").fetchone()[0]
+    conn = connect(DB, isolation_level=None)  # claim/complete/fail manage their transactions
+    queue_daemon.check_schema(conn)
+    worker_id = queue_daemon.worker_name()
+    if not args.cams_only:
+        from enrich import Profile
+        with stage("layers"):
+            sample = Profile(sample)
+            sample.refresh(conn)
+    qn = conn.execute(
+        "SELECT COUNT(*) FROM ghg_fetch_queue WHERE processed_at IS NULL AND dead_at IS NULL").fetchone()[0]
     print(f"[INFO] queued jobs: {qn}")
 
-    while True:
-        row = conn.execute(
-            "SELECT id, marker_id, lat, lon FROM ghg_fetch_queue WHERE processed_at IS NULL ORDER BY enqueued_at LIMIT 1"
-        ).fetchone()
-        if not row:
-            print("[DONE] no more jobs.")
-            break
-        print(f"[JOB] processing: {row}")
-        try:
-            process_one(conn, ds, row)
-        except Exception as e:
-            print(f"[ERR] job {row[0]} failed: {e}")
-            time.sleep(1)
+    if args.batch:
+        with stage("claim") as st:
+            jobs = claim_all(conn, worker_id)
+            st.rows(len(jobs))
+        if jobs:
+            try:
+                process_batch(conn, sample, worker_id, jobs)
+            except Exception as e:
+                queue_daemon.fail(conn, worker_id, jobs, str(e))
+                print(f"[ERR] batch of {len(jobs)} jobs failed: {e}")
+        print("[DONE] no more jobs.")
+    else:
+        while True:
+            jobs = queue_daemon.claim(conn, worker_id, 1)
+            if not jobs:
+                print("[DONE] no more jobs.")  # failed ones wait out their backoff
+                break
+            print(f"[JOB] processing: {jobs[0][:4]}")
+            try:
+                process_one(conn, sample, worker_id, jobs[0])
+            except Exception as e:
+                queue_daemon.fail(conn, worker_id, jobs, str(e))
+                print(f"[ERR] job {jobs[0][0]} failed: {e}")
 
     rows = conn.execute(
         "SELECT marker_id, COUNT(*) AS n, MAX(obs_time) AS latest FROM ghg_observation GROUP BY 1 ORDER BY marker_id DESC"
@@ -175,4 +280,5 @@ def main():
     conn.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with job("fetch_ghg"):
+        main()
\ No newline at end of file
@@ -29,7 +29,8 @@ SELECT
   39.8283   AS latitude,
   -98.5795  AS longitude,
   4         AS zoom,
-  'main-map' AS id;
+  'main-map' AS id,
+  sqlpage.environment_variable('GHG_POINT_SERVICE') AS point_service;
 
 -- === Rows for the component (start empty; remove WHERE to show saved) ===
 SELECT id AS marker_id, geojson
@@ -1,6 +1,7 @@
 -- marker_popup.sql
 -- expects :marker_id
--- Shows Latitude/Longitude plus Baseline vs With Factories near the marker
+-- Shows Latitude/Longitude plus Baseline vs With Factories near the marker,
+-- then the marker's climate profile (latest ghg_observation per variable, written by the queue workers)
 
 WITH m AS (
   SELECT
@@ -12,9 +13,27 @@ WITH m AS (
   WHERE id = CAST(:marker_id AS INTEGER)
 ),
 latest AS (
-  SELECT variable, MAX(obs_time) AS obs_time FROM ghg_surface GROUP BY variable
+  -- current snapshot from the catalog (011_surface_snapshot.sql)
+  SELECT variable, obs_time FROM surface_snapshot WHERE variable = 'co2' AND is_current = 1
 ),
-nearest AS (
+cell AS (
+  -- nearest cell of the latest co2 snapshot by index arithmetic (006_grid_index.sql)
+  SELECT
+    MIN(MAX(CAST(round((m.lat - s.lat0) / s.dlat) AS INTEGER), 0), s.nlat - 1) AS r,
+    CASE WHEN s.wrap = 1
+      THEN ((CAST(round((m.lon - s.lon0) / s.dlon) AS INTEGER) % s.nlon) + s.nlon) % s.nlon
+      ELSE MIN(MAX(CAST(round((m.lon - s.lon0) / s.dlon) AS INTEGER), 0), s.nlon - 1)
+    END AS c
+  FROM grid_spec s
+  CROSS JOIN m
+  WHERE s.name = 'ghg_surface:co2'
+),
+indexed AS (
+  SELECT g.lat, g.lon, g.value AS baseline
+  FROM grid_cell g
+  JOIN cell ON g.grid = 'ghg_surface:co2' AND g.r = cell.r AND g.c = cell.c
+),
+scanned AS (
   -- nearest baseline grid point (co2 variable; adjust if you want selection)
   SELECT s.lat, s.lon, s.value AS baseline
   FROM ghg_surface s
@@ -24,6 +43,13 @@ nearest AS (
   ORDER BY (s.lat - m.lat)*(s.lat - m.lat) + (s.lon - m.lon)*(s.lon - m.lon)
   LIMIT 1
 ),
+nearest AS (
+  -- index seek; the scan only runs when the snapshot isn't indexed
+  SELECT lat, lon, baseline FROM indexed
+  UNION ALL
+  SELECT lat, lon, baseline FROM scanned WHERE NOT EXISTS (SELECT 1 FROM indexed)
+  LIMIT 1
+),
 scenario AS (
   -- simple “sum of influence” at marker location across all factories
   SELECT
@@ -45,6 +71,14 @@ scenario AS (
     ) AS delta
   FROM nearest n
   CROSS JOIN m
+),
+profile AS (
+  -- every layer the worker sampled for this marker (worker/enrich.py), newest row per variable
+  SELECT o.variable, o.value, o.unit
+  FROM ghg_observation o
+  WHERE o.marker_id = CAST(:marker_id AS INTEGER)
+    AND o.id = (SELECT MAX(l.id) FROM ghg_observation l
+                WHERE l.marker_id = o.marker_id AND l.variable = o.variable)
 )
 SELECT
   'html' AS component,
@@ -53,5 +87,13 @@ SELECT
     '<hr style="margin:.5rem 0;" />' ||
     '<div><strong>Baseline (CO₂):</strong> ' || COALESCE(printf('%.2f',(SELECT baseline FROM nearest)),'–') || '</div>' ||
     '<div><strong>With Factories:</strong> ' || COALESCE(printf('%.2f',(SELECT baseline + COALESCE(delta,0.0) FROM scenario)),'–') || '</div>' ||
+    COALESCE(
+      '<hr style="margin:.5rem 0;" />' ||
+      '<div style="max-height:10rem;overflow-y:auto;font-size:.9em;">' ||
+        (SELECT group_concat(
+                  '<div>' || variable || ': ' || CASE WHEN value IS NULL THEN '–' ELSE printf('%.4g', value) END ||
+                  COALESCE(' ' || unit, '') || '</div>', '')
+         FROM (SELECT * FROM profile ORDER BY variable)) ||
+      '</div>', '') ||
     '<div style="font-size:.9em;color:#666;"><em>Illustrative model; plug in your CAMS/VEMAP physics as needed.</em></div>' ||
   '</div>' AS html;
\ No newline at end of file
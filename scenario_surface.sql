@@ -1,19 +1,35 @@
 -- scenario_surface.sql
 -- Baseline + factory contributions at grid points (illustrative model)
 -- Params: :variable (default 'co2')
+-- Reads the table kept up to date by worker/scenario_engine.py
+-- (kernel: 50 * strength / (haversine_km^2 + 1), summed over factories).
+-- Until the table holds the variable (fresh DB, or a snapshot not built yet) the
+-- surface is computed live from the current snapshot, as this page used to.
 
 WITH params AS (
 SELECT
     COALESCE(NULLIF(:variable,''), 'co2') AS variable,
     6371.0 AS R_earth_km,
     0.017453292519943295 AS deg2rad,
-    50.0 AS K  -- scale factor for visibility; tune for your data
+    50.0 AS K
 ),
+built AS (
+SELECT EXISTS (SELECT 1 FROM scenario_surface WHERE variable = (SELECT variable FROM params)) AS ok
+),
+stored AS (
+SELECT s.lat,
+        s.lon,
+        s.baseline,
+        s.delta
+FROM scenario_surface s
+WHERE s.variable = (SELECT variable FROM params)
+),
+-- live fallback: empty unless scenario_surface has no rows for the variable
 latest AS (
-SELECT variable, MAX(obs_time) AS obs_time
-FROM ghg_surface
-WHERE variable = (SELECT variable FROM params)
-GROUP BY variable
+SELECT variable, obs_time
+FROM surface_snapshot
+WHERE variable = (SELECT variable FROM params) AND is_current = 1
+    AND NOT (SELECT ok FROM built)
 ),
 grid AS (
 SELECT s.lat, s.lon, s.value AS baseline
@@ -22,59 +38,32 @@ JOIN latest l
     ON l.variable = s.variable AND l.obs_time = s.obs_time
 ),
 factories AS (
-SELECT m.id AS marker_id,
-        CAST(json_extract(m.geojson,'$.geometry.coordinates[1]') AS REAL) AS lat,
+SELECT CAST(json_extract(m.geojson,'$.geometry.coordinates[1]') AS REAL) AS lat,
         CAST(json_extract(m.geojson,'$.geometry.coordinates[0]') AS REAL) AS lon,
         COALESCE(fp.strength, 1.0) AS strength
 FROM markers m
 LEFT JOIN factory_params fp ON fp.marker_id = m.id
 ),
-contrib AS (
-SELECT
-    g.lat AS grid_lat,
-    g.lon AS grid_lon,
-    g.baseline,
-    SUM(
-      (f.strength * (SELECT K FROM params)) /
-    (
-        (
-          (SELECT R_earth_km FROM params) * 2.0 * asin(
-            sqrt(
-              sin( ((f.lat - g.lat) * (SELECT deg2rad FROM params)) / 2.0 ) *
-              sin( ((f.lat - g.lat) * (SELECT deg2rad FROM params)) / 2.0 ) +
-              cos( g.lat * (SELECT deg2rad FROM params) ) *
-              cos( f.lat * (SELECT deg2rad FROM params) ) *
-              sin( ((f.lon - g.lon) * (SELECT deg2rad FROM params)) / 2.0 ) *
-              sin( ((f.lon - g.lon) * (SELECT deg2rad FROM params)) / 2.0 )
-            )
-        )
-        ) *
-        (
-          (SELECT R_earth_km FROM params) * 2.0 * asin(
-            sqrt(
-              sin( ((f.lat - g.lat) * (SELECT deg2rad FROM params)) / 2.0 ) *
-              sin( ((f.lat - g.lat) * (SELECT deg2rad FROM params)) / 2.0 ) +
-              cos( g.lat * (SELECT deg2rad FROM params) ) *
-              cos( f.lat * (SELECT deg2rad FROM params) ) *
-              sin( ((f.lon - g.lon) * (SELECT deg2rad FROM params)) / 2.0 ) *
-              sin( ((f.lon - g.lon) * (SELECT deg2rad FROM params)) / 2.0 )
-            )
-        )
-        ) + 1.0
-    )
-    )
-) AS delta
+live AS (
+SELECT g.lat,
+        g.lon,
+        g.baseline,
+        COALESCE(SUM(
+          f.strength * (SELECT K FROM params) / (
+            power((SELECT R_earth_km FROM params) * 2.0 * asin(sqrt(
+              power(sin((f.lat - g.lat) * (SELECT deg2rad FROM params) / 2.0), 2) +
+              cos(g.lat * (SELECT deg2rad FROM params)) * cos(f.lat * (SELECT deg2rad FROM params)) *
+              power(sin((f.lon - g.lon) * (SELECT deg2rad FROM params) / 2.0), 2)
+            )), 2) + 1.0)
+        ), 0.0) AS delta
 FROM grid g
 LEFT JOIN factories f
 GROUP BY g.lat, g.lon, g.baseline
 ),
 rows AS (
-SELECT grid_lat AS lat,
-        grid_lon AS lon,
-        baseline,
-        COALESCE(delta, 0.0) AS delta,
-        baseline + COALESCE(delta, 0.0) AS scenario_value
-FROM contrib
+SELECT lat, lon, baseline, delta, baseline + delta AS scenario_value FROM stored
+UNION ALL
+SELECT lat, lon, baseline, delta, baseline + delta AS scenario_value FROM live
 )
 SELECT
 'json' AS component,
@@ -92,4 +81,4 @@ json_object(
     )
     )
 ) AS value
-FROM rows;
\ No newline at end of file
+FROM rows;
@@ -9,13 +9,39 @@ CREATE TABLE IF NOT EXISTS co2_grid (
 
 SELECT 'json' AS component;
 
-WITH args AS (SELECT CAST($lat AS REAL) AS lat, CAST($lon AS REAL) AS lon)
+WITH args AS (SELECT CAST($lat AS REAL) AS lat, CAST($lon AS REAL) AS lon),
+norm AS (
+  SELECT
+    lat,
+    CASE WHEN lon >= 180 THEN lon - 360
+         WHEN lon <  -180 THEN lon + 360
+         ELSE lon END AS lon
+  FROM args
+),
+cell AS (
+  -- nearest cell by index arithmetic (see value_at.sql / 006_grid_index.sql)
+  SELECT
+    MIN(MAX(CAST(round((norm.lat - s.lat0) / s.dlat) AS INTEGER), 0), s.nlat - 1) AS r,
+    CASE WHEN s.wrap = 1
+      THEN ((CAST(round((norm.lon - s.lon0) / s.dlon) AS INTEGER) % s.nlon) + s.nlon) % s.nlon
+      ELSE MIN(MAX(CAST(round((norm.lon - s.lon0) / s.dlon) AS INTEGER), 0), s.nlon - 1)
+    END AS c
+  FROM grid_spec AS s, norm
+  WHERE s.name = 'co2_grid'
+)
 SELECT json_object(
   'scenario',
-  (
-    SELECT value
-    FROM co2_grid
-    ORDER BY ((lat - $lat)*(lat - $lat)) + ((lon - $lon)*(lon - $lon))
-    LIMIT 1
+  COALESCE(
+    (
+      SELECT g.value
+      FROM grid_cell AS g
+      JOIN cell ON g.grid = 'co2_grid' AND g.r = cell.r AND g.c = cell.c
+    ),
+    (
+      SELECT value
+      FROM co2_grid
+      ORDER BY ((lat - $lat)*(lat - $lat)) + ((lon - $lon)*(lon - $lon))
+      LIMIT 1
+    )
   )
 ) AS contents;
\ No newline at end of file
@@ -0,0 +1,26 @@
+-- 006_grid_index.sql
+-- Integer cell addressing for nearest-grid-point lookups (like sst_grid's r/c).
+-- Maintained by the loaders (worker/gridindex.py); read by value_at.sql,
+-- scenario_value_at.sql and marker_popup.sql.
+-- r = round((lat - lat0) / dlat), c = round((lon - lon0) / dlon) [mod nlon when wrap = 1]
+
+CREATE TABLE IF NOT EXISTS grid_spec (
+  name  TEXT    PRIMARY KEY,   -- 'co2_grid' or 'ghg_surface:<variable>'
+  lat0  REAL    NOT NULL,      -- southernmost row (r = 0)
+  dlat  REAL    NOT NULL,
+  nlat  INTEGER NOT NULL,
+  lon0  REAL    NOT NULL,      -- westernmost column (c = 0), in [-180, 180)
+  dlon  REAL    NOT NULL,
+  nlon  INTEGER NOT NULL,
+  wrap  INTEGER NOT NULL       -- 1 if columns span 360° (c wraps at the dateline)
+);
+
+CREATE TABLE IF NOT EXISTS grid_cell (
+  grid  TEXT    NOT NULL,
+  r     INTEGER NOT NULL,
+  c     INTEGER NOT NULL,
+  lat   REAL    NOT NULL,
+  lon   REAL    NOT NULL,
+  value REAL    NOT NULL,
+  PRIMARY KEY (grid, r, c)
+) WITHOUT ROWID;
@@ -0,0 +1,21 @@
+-- 007_scenario_surface.sql
+-- Materialized baseline + factory influence, maintained by worker/scenario_engine.py.
+-- scenario_surface.sql just reads it instead of recomputing grid x markers per request.
+
+CREATE TABLE IF NOT EXISTS scenario_surface (
+  variable  TEXT NOT NULL,
+  obs_time  TEXT NOT NULL,          -- ghg_surface snapshot the baseline came from
+  lat       REAL NOT NULL,
+  lon       REAL NOT NULL,
+  baseline  REAL NOT NULL,
+  delta     REAL NOT NULL DEFAULT 0.0,
+  PRIMARY KEY (variable, lat, lon)
+);
+
+-- (lat, lon, strength) of each marker as currently applied to scenario_surface
+CREATE TABLE IF NOT EXISTS scenario_contrib (
+  marker_id INTEGER PRIMARY KEY,
+  lat       REAL NOT NULL,
+  lon       REAL NOT NULL,
+  strength  REAL NOT NULL
+);
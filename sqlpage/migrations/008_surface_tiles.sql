@@ -0,0 +1,16 @@
+-- 008_surface_tiles.sql
+-- Per-zoom Web Mercator tiles of each variable's latest ghg_surface snapshot,
+-- built by worker/tile_pyramid.py after every load and served by baseline_tile.sql.
+
+CREATE TABLE IF NOT EXISTS surface_tile (
+  variable  TEXT    NOT NULL,
+  obs_time  TEXT    NOT NULL,
+  z         INTEGER NOT NULL,
+  x         INTEGER NOT NULL,
+  y         INTEGER NOT NULL,
+  n         INTEGER NOT NULL,   -- binned points in this tile
+  vmin      REAL    NOT NULL,   -- value range of the whole snapshot (for a stable colour scale)
+  vmax      REAL    NOT NULL,
+  cells     TEXT    NOT NULL,   -- JSON [[lat, lon, value], ...]
+  PRIMARY KEY (variable, obs_time, z, x, y)
+) WITHOUT ROWID;
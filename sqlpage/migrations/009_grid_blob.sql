@@ -0,0 +1,19 @@
+-- 009_grid_blob.sql
+-- Packed grid storage (worker/gridblob.py): one row per (dataset, variable, obs_time)
+-- holding the grid header and a float32 little-endian, row-major array
+-- (r = 0 is the southernmost row, c = 0 the westernmost column).
+
+CREATE TABLE IF NOT EXISTS grid_blob (
+  dataset   TEXT    NOT NULL,   -- 'ghg_surface', 'co2_grid', 'sst'
+  variable  TEXT    NOT NULL,
+  obs_time  TEXT    NOT NULL,
+  lat0      REAL    NOT NULL,   -- centre of row 0
+  dlat      REAL    NOT NULL,
+  nlat      INTEGER NOT NULL,
+  lon0      REAL    NOT NULL,   -- centre of column 0, in [-180, 180)
+  dlon      REAL    NOT NULL,
+  nlon      INTEGER NOT NULL,
+  nodata    REAL    NOT NULL,
+  data      BLOB    NOT NULL,
+  PRIMARY KEY (dataset, variable, obs_time)
+);
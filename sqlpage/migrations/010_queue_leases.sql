@@ -0,0 +1,15 @@
+-- 010_queue_leases.sql
+-- Lease/retry bookkeeping for the resident queue worker (worker/queue_daemon.py).
+-- A job is visible when it is unprocessed, not dead-lettered, its lease has
+-- expired and its retry time (if any) has passed.
+
+ALTER TABLE ghg_fetch_queue ADD COLUMN claimed_by      TEXT;
+ALTER TABLE ghg_fetch_queue ADD COLUMN lease_until     DATETIME;
+ALTER TABLE ghg_fetch_queue ADD COLUMN attempts        INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE ghg_fetch_queue ADD COLUMN next_attempt_at DATETIME;
+ALTER TABLE ghg_fetch_queue ADD COLUMN last_error      TEXT;
+ALTER TABLE ghg_fetch_queue ADD COLUMN dead_at         DATETIME;   -- dead-letter after max attempts
+
+CREATE INDEX IF NOT EXISTS idx_queue_pending
+ON ghg_fetch_queue(enqueued_at)
+WHERE processed_at IS NULL AND dead_at IS NULL;
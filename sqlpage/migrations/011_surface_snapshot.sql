@@ -0,0 +1,37 @@
+-- 011_surface_snapshot.sql
+-- Catalog of ghg_surface snapshots (worker/catalog.py). Loaders register each
+-- (variable, obs_time) after committing it and flag the newest one is_current = 1,
+-- so pages resolve the current snapshot with an index seek instead of
+-- MAX(obs_time) GROUP BY variable over ghg_surface.
+
+CREATE TABLE IF NOT EXISTS surface_snapshot (
+  variable    TEXT     NOT NULL,
+  obs_time    TEXT     NOT NULL,
+  n_rows      INTEGER  NOT NULL,
+  lat_min     REAL,
+  lat_max     REAL,
+  lon_min     REAL,
+  lon_max     REAL,
+  dlat        REAL,                 -- NULL when the lats aren't a regular axis
+  dlon        REAL,
+  source      TEXT,                 -- file name(s) or dataset the loader read
+  loaded_at   DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  is_current  INTEGER  NOT NULL DEFAULT 0,
+  PRIMARY KEY (variable, obs_time)
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_surface_snapshot_current
+  ON surface_snapshot(variable) WHERE is_current = 1;
+
+-- Covering index: snapshot reads (variable, obs_time) -> lat, lon, value without touching the table
+CREATE INDEX IF NOT EXISTS idx_ghg_surface_var_time
+  ON ghg_surface(variable, obs_time, lat, lon, value);
+
+-- Catalogue what is already loaded (resolution is filled in by the next load)
+INSERT OR IGNORE INTO surface_snapshot (variable, obs_time, n_rows, lat_min, lat_max, lon_min, lon_max)
+SELECT variable, obs_time, COUNT(*), MIN(lat), MAX(lat), MIN(lon), MAX(lon)
+FROM ghg_surface
+GROUP BY variable, obs_time;
+
+UPDATE surface_snapshot SET is_current = 1
+WHERE obs_time = (SELECT MAX(s.obs_time) FROM surface_snapshot s WHERE s.variable = surface_snapshot.variable);
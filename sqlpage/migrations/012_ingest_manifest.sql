@@ -0,0 +1,19 @@
+-- 012_ingest_manifest.sql
+-- Ingestion manifest for the ghg_surface loaders (worker/manifest.py): the content
+-- hash, load parameters and HTTP validators of each (source, variable) last loaded,
+-- so unchanged inputs are skipped and changed ones are written as cell deltas.
+
+CREATE TABLE IF NOT EXISTS ingest_manifest (
+  source      TEXT     NOT NULL,      -- file name, URL or request key
+  variable    TEXT     NOT NULL,      -- ghg_surface variable it feeds
+  sha256      TEXT     NOT NULL,
+  params      TEXT     NOT NULL DEFAULT '',   -- stride / data var etc.; a change forces a reload
+  size        INTEGER,
+  mtime_ns    INTEGER,
+  etag        TEXT,                   -- HTTP validators for downloaded sources
+  last_modified TEXT,
+  obs_time    TEXT,                   -- snapshot the input was last written to
+  n_cells     INTEGER,
+  loaded_at   DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (source, variable)
+);
@@ -0,0 +1,26 @@
+-- 013_retention.sql
+-- Rollups for ghg_observation history (worker/compact.py): raw observations past
+-- the retention window are folded into daily, then monthly min/mean/max buckets.
+
+CREATE TABLE IF NOT EXISTS ghg_observation_rollup (
+  marker_id INTEGER NOT NULL,
+  variable  TEXT    NOT NULL,
+  period    TEXT    NOT NULL,          -- 'day' | 'month'
+  bucket    TEXT    NOT NULL,          -- 'YYYY-MM-DD' | 'YYYY-MM'
+  n         INTEGER NOT NULL,          -- observations folded in
+  vmin      REAL,
+  vmean     REAL,
+  vmax      REAL,
+  unit      TEXT,
+  PRIMARY KEY (marker_id, variable, period, bucket)
+);
+
+-- compact.py finds expired observations by time
+CREATE INDEX IF NOT EXISTS idx_ghg_obs_time ON ghg_observation(obs_time);
+
+-- Rollups go with their marker, like ghg_observation (004_ghg_triggers.sql)
+CREATE TRIGGER IF NOT EXISTS trg_markers_delete_cleanup_rollup
+AFTER DELETE ON markers
+BEGIN
+DELETE FROM ghg_observation_rollup WHERE marker_id = OLD.id;
+END;
@@ -0,0 +1,29 @@
+-- 014_ensemble.sql
+-- Monte Carlo / ensemble runs over factory configurations (worker/ensemble.py).
+-- Only per-cell summaries over the members are stored, one ensemble_run row per run;
+-- ensemble_surface.sql serves them like scenario_surface.sql.
+
+CREATE TABLE IF NOT EXISTS ensemble_run (
+  id          INTEGER  PRIMARY KEY,
+  name        TEXT,
+  variable    TEXT     NOT NULL,
+  obs_time    TEXT     NOT NULL,     -- ghg_surface snapshot the baseline came from
+  members     INTEGER  NOT NULL,
+  sites       INTEGER  NOT NULL,     -- factory sites per member (incl. candidates)
+  threshold   REAL,                  -- p_exceed = P(baseline + delta > threshold)
+  spec        TEXT,                  -- JSON: how the members were drawn
+  seconds     REAL,
+  created_at  DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS ensemble_surface (
+  ensemble_id INTEGER NOT NULL,
+  lat         REAL    NOT NULL,
+  lon         REAL    NOT NULL,
+  baseline    REAL    NOT NULL,
+  mean        REAL    NOT NULL,      -- delta over members: mean, 5th / 95th percentile
+  p05         REAL    NOT NULL,
+  p95         REAL    NOT NULL,
+  p_exceed    REAL,                  -- NULL when the run had no threshold
+  PRIMARY KEY (ensemble_id, lat, lon)
+) WITHOUT ROWID;
@@ -0,0 +1,53 @@
+-- 015_scenario_dirty.sql
+-- Marks scenario_surface stale when a marker or its factory parameters change, so
+-- the queue daemon (worker/queue_daemon.py) reruns worker/scenario_engine.py's
+-- refresh() after a popup edit instead of waiting for cron.
+-- n counts the changes since the last refresh, which deletes the row.
+
+CREATE TABLE IF NOT EXISTS scenario_dirty (
+  id          INTEGER  PRIMARY KEY CHECK (id = 1),
+  n           INTEGER  NOT NULL DEFAULT 1,
+  changed_at  DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_markers_insert_scenario
+AFTER INSERT ON markers
+BEGIN
+INSERT INTO scenario_dirty (id) VALUES (1)
+  ON CONFLICT(id) DO UPDATE SET n = n + 1, changed_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_markers_update_scenario
+AFTER UPDATE OF geojson ON markers
+BEGIN
+INSERT INTO scenario_dirty (id) VALUES (1)
+  ON CONFLICT(id) DO UPDATE SET n = n + 1, changed_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_markers_delete_scenario
+AFTER DELETE ON markers
+BEGIN
+INSERT INTO scenario_dirty (id) VALUES (1)
+  ON CONFLICT(id) DO UPDATE SET n = n + 1, changed_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_factory_params_insert_scenario
+AFTER INSERT ON factory_params
+BEGIN
+INSERT INTO scenario_dirty (id) VALUES (1)
+  ON CONFLICT(id) DO UPDATE SET n = n + 1, changed_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_factory_params_update_scenario
+AFTER UPDATE OF strength ON factory_params
+BEGIN
+INSERT INTO scenario_dirty (id) VALUES (1)
+  ON CONFLICT(id) DO UPDATE SET n = n + 1, changed_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_factory_params_delete_scenario
+AFTER DELETE ON factory_params
+BEGIN
+INSERT INTO scenario_dirty (id) VALUES (1)
+  ON CONFLICT(id) DO UPDATE SET n = n + 1, changed_at = CURRENT_TIMESTAMP;
+END;
@@ -0,0 +1,23 @@
+-- 016_observation_fetched_at.sql
+-- When each ghg_observation row was written, so worker/compact.py's retention
+-- window follows ingest time instead of obs_time (the CAMS validity time, which
+-- can be months old on the day a marker is fetched).
+-- ALTER TABLE can't add a CURRENT_TIMESTAMP default, so a trigger stamps rows
+-- inserted without one; rows already present count as fetched now.
+
+ALTER TABLE ghg_observation ADD COLUMN fetched_at DATETIME;
+
+UPDATE ghg_observation SET fetched_at = CURRENT_TIMESTAMP WHERE fetched_at IS NULL;
+
+CREATE TRIGGER IF NOT EXISTS trg_ghg_observation_fetched_at
+AFTER INSERT ON ghg_observation
+WHEN NEW.fetched_at IS NULL
+BEGIN
+UPDATE ghg_observation SET fetched_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+END;
+
+-- compact.py finds expired observations by ingest time
+CREATE INDEX IF NOT EXISTS idx_ghg_obs_fetched_at ON ghg_observation(fetched_at);
+
+-- latest row per marker/variable (MAX(id), as marker_popup.sql shows it) is one seek
+CREATE INDEX IF NOT EXISTS idx_ghg_obs_marker_var ON ghg_observation(marker_id, variable);
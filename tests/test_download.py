@@ -0,0 +1,71 @@
+# tests/test_download.py
+# worker/download.py against bench/fixtures.py's stand-in HTTP server:
+# Range resume, sha256 check, If-Range restart and the no-network cache hit.
+#   python -m pytest -q tests
+
+import hashlib, os, sys
+import pytest, requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "worker"), os.path.join(ROOT, "bench")]
+
+import download, fixtures
+
+MIB = 1 << 20  # download.CHUNK: a cut on a chunk boundary leaves exactly that much in the .part file
+
+def _file(path, nbytes, seed=0):
+    data = hashlib.sha256(str(seed).encode()).digest() * (nbytes // 32)
+    path.write_bytes(data)
+    return data
+
+@pytest.fixture
+def serve():
+    servers = []
+    def start(path, cut_after=None):
+        url, server = fixtures.serve_file(str(path), cut_after=cut_after)
+        servers.append(server)
+        return url, server
+    yield start
+    for server in servers:
+        server.shutdown()
+
+def test_resume_after_cut(tmp_path, serve):
+    data = _file(tmp_path / "bundle.zip", 5 * MIB)
+    url, server = serve(tmp_path / "bundle.zip", cut_after=2 * MIB)
+    art = download.fetch(url, backoff=0, cache_dir=tmp_path / "cache")
+    assert [status for status, _, _ in server.requests] == [200, 206]
+    status, rng, if_range = server.requests[1]
+    assert rng == f"bytes={2 * MIB}-" and if_range
+    assert art.size == len(data) and art.sha256 == hashlib.sha256(data).hexdigest()
+    assert art.path.read_bytes() == data
+
+def test_sha256_mismatch_raises(tmp_path, serve):
+    _file(tmp_path / "bundle.zip", MIB)
+    url, _ = serve(tmp_path / "bundle.zip")
+    with pytest.raises(ValueError, match="sha256"):
+        download.fetch(url, expected_sha256="0" * 64, cache_dir=tmp_path / "cache")
+    assert download.lookup(url, cache_dir=tmp_path / "cache") is None
+
+def test_changed_etag_restarts_at_zero(tmp_path, serve):
+    path, cache = tmp_path / "bundle.zip", tmp_path / "cache"
+    _file(path, 4 * MIB, seed=1)
+    url, _ = serve(path, cut_after=2 * MIB)
+    with pytest.raises(requests.RequestException):  # connection dropped, no retries left
+        download.fetch(url, key="bundle", retries=0, cache_dir=cache)
+    assert download.partial_path("bundle", ".zip", cache).stat().st_size == 2 * MIB
+
+    data = _file(path, 3 * MIB, seed=2)  # changed upstream: new size / mtime, new ETag
+    url, server = serve(path)
+    art = download.fetch(url, key="bundle", suffix=".zip", backoff=0, cache_dir=cache)
+    [(status, rng, if_range)] = server.requests
+    assert status == 200 and rng == f"bytes={2 * MIB}-" and if_range  # If-Range didn't match
+    assert art.sha256 == hashlib.sha256(data).hexdigest() and art.path.read_bytes() == data
+
+def test_cached_rerun_makes_no_request(tmp_path, serve):
+    data = _file(tmp_path / "bundle.zip", MIB)
+    url, server = serve(tmp_path / "bundle.zip")
+    first = download.fetch(url, cache_dir=tmp_path / "cache")
+    assert len(server.requests) == 1 and first.fetched
+    again = download.fetch(url, cache_dir=tmp_path / "cache")
+    assert len(server.requests) == 1 and not again.fetched
+    assert again.path == first.path and again.path.read_bytes() == data
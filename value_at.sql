@@ -27,7 +27,25 @@ norm AS (
          ELSE lon END AS lon
   FROM args
 ),
+cell AS (
+  -- nearest cell by index arithmetic on the loader-maintained grid_spec (006_grid_index.sql)
+  SELECT
+    MIN(MAX(CAST(round((norm.lat - s.lat0) / s.dlat) AS INTEGER), 0), s.nlat - 1) AS r,
+    CASE WHEN s.wrap = 1
+      THEN ((CAST(round((norm.lon - s.lon0) / s.dlon) AS INTEGER) % s.nlon) + s.nlon) % s.nlon
+      ELSE MIN(MAX(CAST(round((norm.lon - s.lon0) / s.dlon) AS INTEGER), 0), s.nlon - 1)
+    END AS c
+  FROM grid_spec AS s, norm
+  WHERE s.name = 'co2_grid'
+),
+indexed AS (
+  -- one primary-key seek
+  SELECT g.value AS v
+  FROM grid_cell AS g
+  JOIN cell ON g.grid = 'co2_grid' AND g.r = cell.r AND g.c = cell.c
+),
 nearest AS (
+  -- fallback scan (unindexed/irregular grid, or masked cell):
   -- nearest neighbor in simple lat/lon space with dateline wrap
   SELECT g.value AS v
   FROM co2_grid AS g, norm
@@ -48,6 +66,7 @@ nearest AS (
 result AS (
   -- If the table is empty, return a gentle fallback so overlays still render
   SELECT COALESCE(
+           (SELECT v FROM indexed),
            (SELECT v FROM nearest),
            (SELECT 400.0
                    + (ABS(lat)/90.0)*30.0         -- poleward increase
@@ -0,0 +1,7 @@
+# worker/__main__.py
+# `python worker <command> [args...]` (see cli.py)
+
+import sys
+from cli import main
+
+sys.exit(main())
@@ -0,0 +1,72 @@
+# worker/bulkload.py
+# Staging-table bulk loads for co2_grid / ghg_surface.
+# - Fill `<table>_staging` (same columns + primary key, no secondary indexes)
+#   under relaxed pragmas, committing as often as you like: readers never see it.
+# - swap_in() then drops the live table, renames staging into place and rebuilds
+#   the live table's secondary indexes, all in ONE transaction, so SQLPage
+#   readers see either the old data or the new data, never a partial table.
+# - tables that keep history (ghg_surface) stage only the new snapshot and
+#   merge_in() appends it in one transaction, instead of copying every older
+#   snapshot into staging on each run.
+# Both restore synchronous=NORMAL first: the live table is never written unsynced.
+
+import sqlite3
+
+def relax_pragmas(conn: sqlite3.Connection):
+    """Per-connection settings for a load whose staging table is disposable."""
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-262144")  # 256 MB page cache
+
+def restore_pragmas(conn: sqlite3.Connection):
+    """Back to durable commits before a transaction that touches the live table."""
+    conn.execute("PRAGMA synchronous=NORMAL")
+
+def staging_name(table: str) -> str:
+    return f"{table}_staging"
+
+def begin_staging(conn: sqlite3.Connection, table: str) -> str:
+    """Create an empty staging copy of `table` (definition read from sqlite_master)."""
+    row = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (table,)
+    ).fetchone()
+    if not row:
+        raise RuntimeError(f"table {table} does not exist; create it before a bulk load")
+    staging = staging_name(table)
+    _, sep, tail = row[0].partition("(")
+    conn.execute(f"DROP TABLE IF EXISTS {staging}")
+    conn.execute(f"CREATE TABLE {staging} {sep}{tail}")
+    conn.commit()
+    return staging
+
+def swap_in(conn: sqlite3.Connection, table: str, staging: str):
+    """Atomically replace `table` with `staging`, building its secondary indexes once."""
+    conn.commit()
+    restore_pragmas(conn)
+    indexes = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type='index' AND tbl_name=? AND sql IS NOT NULL",
+        (table,)
+    ).fetchall()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(f"DROP TABLE {table}")
+        conn.execute(f"ALTER TABLE {staging} RENAME TO {table}")
+        for (sql,) in indexes:
+            conn.execute(sql)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def merge_in(conn: sqlite3.Connection, table: str, staging: str):
+    """Atomically add the staged rows to `table` (replacing equal keys) and drop `staging`."""
+    conn.commit()
+    restore_pragmas(conn)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(f"INSERT OR REPLACE INTO {table} SELECT * FROM {staging}")
+        conn.execute(f"DROP TABLE {staging}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
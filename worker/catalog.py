@@ -0,0 +1,77 @@
+# worker/catalog.py
+# Snapshot catalog for ghg_surface: one surface_snapshot row per loaded
+# (variable, obs_time) with its size, bbox and resolution; the newest snapshot of
+# each variable is flagged is_current = 1, so SQL pages resolve "latest" with an
+# index seek instead of MAX(obs_time) GROUP BY variable over the whole table.
+
+import sqlite3
+import numpy as np
+from gridindex import regular_axis
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS surface_snapshot (
+  variable    TEXT     NOT NULL,
+  obs_time    TEXT     NOT NULL,
+  n_rows      INTEGER  NOT NULL,
+  lat_min     REAL,
+  lat_max     REAL,
+  lon_min     REAL,
+  lon_max     REAL,
+  dlat        REAL,                 -- NULL when the lats aren't a regular axis
+  dlon        REAL,
+  source      TEXT,                 -- file name(s) or dataset the loader read
+  loaded_at   DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  is_current  INTEGER  NOT NULL DEFAULT 0,
+  PRIMARY KEY (variable, obs_time)
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_surface_snapshot_current
+  ON surface_snapshot(variable) WHERE is_current = 1;
+CREATE INDEX IF NOT EXISTS idx_ghg_surface_var_time
+  ON ghg_surface(variable, obs_time, lat, lon, value);
+"""
+
+def ensure_schema(conn: sqlite3.Connection):
+    conn.executescript(SCHEMA)
+
+def _step(values):
+    ax = regular_axis(np.asarray(values, dtype=np.float64)) if values else None
+    return ax[1] if ax else None
+
+def set_current(conn: sqlite3.Connection, variable):
+    """Flag the newest catalogued snapshot of `variable` (doesn't commit)."""
+    conn.execute("UPDATE surface_snapshot SET is_current = 0 WHERE variable = ? AND is_current = 1", (variable,))
+    conn.execute("""
+        UPDATE surface_snapshot SET is_current = 1
+        WHERE variable = ? AND obs_time = (SELECT MAX(obs_time) FROM surface_snapshot WHERE variable = ?)
+    """, (variable, variable))
+
+def register_snapshot(conn: sqlite3.Connection, variable, obs_time, source=None):
+    """Catalogue one committed ghg_surface snapshot and move the current flag if it is newer."""
+    ensure_schema(conn)
+    n, lat_min, lat_max, lon_min, lon_max = conn.execute(
+        "SELECT COUNT(*), MIN(lat), MAX(lat), MIN(lon), MAX(lon) FROM ghg_surface WHERE variable=? AND obs_time=?",
+        (variable, obs_time)
+    ).fetchone()
+    lats = [r[0] for r in conn.execute(
+        "SELECT DISTINCT lat FROM ghg_surface WHERE variable=? AND obs_time=?", (variable, obs_time))]
+    lons = [r[0] for r in conn.execute(
+        "SELECT DISTINCT lon FROM ghg_surface WHERE variable=? AND obs_time=?", (variable, obs_time))]
+    with conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO surface_snapshot
+              (variable, obs_time, n_rows, lat_min, lat_max, lon_min, lon_max, dlat, dlon, source)
+            VALUES (?,?,?,?,?,?,?,?,?,?)
+        """, (variable, obs_time, n, lat_min, lat_max, lon_min, lon_max, _step(lats), _step(lons), source))
+        set_current(conn, variable)
+    print(f"[catalog] {variable} @ {obs_time}: {n} rows")
+
+def current_snapshots(conn: sqlite3.Connection):
+    """[(variable, obs_time)] of the current snapshots; catalogues ghg_surface once if the catalog is empty."""
+    ensure_schema(conn)
+    if not conn.execute("SELECT 1 FROM surface_snapshot LIMIT 1").fetchone():
+        for variable, obs_time in conn.execute(
+                "SELECT DISTINCT variable, obs_time FROM ghg_surface").fetchall():
+            register_snapshot(conn, variable, obs_time)
+    return conn.execute(
+        "SELECT variable, obs_time FROM surface_snapshot WHERE is_current = 1 ORDER BY variable"
+    ).fetchall()
@@ -0,0 +1,258 @@
+# worker/cds_retrieve.py
+# Chunked, concurrent CDS/ADS retrieval for big requests (fetch_ghg's CAMS cube).
+# - plan() splits a request into one chunk per variable x calendar-month window of
+#   its date range; windows are aligned to months, so moving the end date only
+#   changes the last window's chunks
+# - retrieve() runs the chunks on a bounded thread pool; each is stored in the
+#   download cache (download.py) under its own request hash and retried on its own.
+#   A chunk that keeps failing doesn't stop the others, and the next run only
+#   asks for what's missing
+# - write_view() records the chunk files in a small .json; open_view() merges them
+#   lazily (variables merged per window, windows concatenated along time on
+#   access), so fetch_ghg.open_ds() treats it like one NetCDF
+# Any object with cdsapi.Client's retrieve(name, request, target) can be passed as client.
+#   python worker/cds_retrieve.py [--workers 4] [--months 1] [--end 2025-10-31]
+
+import argparse, datetime, hashlib, json, os, pathlib, sys, threading, time, zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+import download
+from instrument import job, stage
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+ADS_URL = "https://ads.atmosphere.copernicus.eu/api"
+
+_local = threading.local()
+
+def _day(s):
+    return datetime.date.fromisoformat(str(s).strip())
+
+def date_ranges(spec):
+    """[(start, end)] from a request's "date": 'a/b' ranges or single days, str or list."""
+    out = []
+    for item in ([spec] if isinstance(spec, str) else spec):
+        a, _, b = str(item).partition("/")
+        out.append((_day(a), _day(b or a)))
+    return out
+
+def month_windows(start, end, months=1):
+    """(start, end) pieces of [start, end], cut at the first day of every `months`-th month."""
+    while start <= end:
+        m = start.month - 1 + months
+        nxt = datetime.date(start.year + m // 12, m % 12 + 1, 1)
+        stop = min(end, nxt - datetime.timedelta(days=1))
+        yield start, stop
+        start = stop + datetime.timedelta(days=1)
+
+def plan(request, months=1, by_variable=True):
+    """Independent chunk requests covering `request` (months=0 keeps the date ranges whole)."""
+    variables = request.get("variable", [])
+    variables = [variables] if isinstance(variables, str) else list(variables)
+    groups = [[v] for v in variables] if by_variable and variables else [variables]
+    if "date" in request and months > 0:
+        dates = [f"{a}/{b}" for lo, hi in date_ranges(request["date"]) for a, b in month_windows(lo, hi, months)]
+    else:
+        dates = [request.get("date")]
+    chunks = []
+    for d in dates:
+        for g in groups:
+            req = dict(request)
+            if g:
+                req["variable"] = g
+            if d is not None:
+                req["date"] = [d] if isinstance(d, str) else d
+            chunks.append(req)
+    return chunks
+
+def chunk_key(dataset, req):
+    return f"cds:{dataset}:" + hashlib.sha256(json.dumps(req, sort_keys=True).encode()).hexdigest()[:16]
+
+def _label(req):
+    return f"{','.join(req.get('variable', [])) or '*'} {req.get('date', [''])[0]}"
+
+def _suffix(req):
+    fmt = str(req.get("data_format", req.get("format", "netcdf")))
+    return ".grib" if "grib" in fmt else ".nc"
+
+def _client():
+    """One cdsapi.Client per pool thread."""
+    if not hasattr(_local, "client"):
+        import cdsapi
+        _local.client = cdsapi.Client(url=ADS_URL)
+    return _local.client
+
+def fetch_chunk(dataset, req, client=None, retries=2, backoff=30.0, cache_dir=None):
+    """(Artifact, retrieved) for one chunk, from the download cache or the API."""
+    key, suffix = chunk_key(dataset, req), _suffix(req)
+    art = download.lookup(key, cache_dir)
+    if art:
+        return art, False
+    for attempt in range(retries + 1):
+        part = download.partial_path(key, suffix, cache_dir)
+        try:
+            (client or _client()).retrieve(dataset, req, str(part))
+            return download.put(key, part, suffix, cache_dir=cache_dir, url=f"cds:{dataset}", request=req), True
+        except Exception as e:
+            if attempt == retries:
+                raise
+            print(f"[cds] {_label(req)}: {e} (retry {attempt + 1}/{retries})")
+            time.sleep(backoff * 2 ** attempt)
+
+def retrieve(dataset, request, client=None, workers=4, months=1, by_variable=True, retries=2, backoff=30.0,
+             cache_dir=None):
+    """
+    [(chunk request, Artifact)] for every chunk of `request`, at most `workers`
+    in flight. Raises once all chunks have run if any of them failed for good.
+    """
+    chunks = plan(request, months, by_variable)
+    arts, failed, done = [None] * len(chunks), [], 0
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futs = {pool.submit(fetch_chunk, dataset, req, client, retries, backoff, cache_dir): i
+                for i, req in enumerate(chunks)}
+        for fut in as_completed(futs):
+            i = futs[fut]
+            done += 1
+            try:
+                arts[i], fresh = fut.result()
+                print(f"[cds] {done}/{len(chunks)} {_label(chunks[i])}: {'retrieved' if fresh else 'cached'}")
+            except Exception as e:
+                failed.append((_label(chunks[i]), e))
+                print(f"[cds] {done}/{len(chunks)} {_label(chunks[i])}: failed: {e}")
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(chunks)} chunks failed (the others are cached): "
+                           + "; ".join(f"{lbl}: {e}" for lbl, e in failed[:3]))
+    print(f"[cds] {dataset}: {len(chunks)} chunks in {time.perf_counter() - t0:.1f}s")
+    return list(zip(chunks, arts))
+
+def write_view(path, dataset, pieces):
+    """Write the chunk list to `path` (left untouched when unchanged, so caches keyed on its mtime stay)."""
+    view = {"dataset": dataset, "chunks": [
+        {"variable": req.get("variable"), "date": (req.get("date") or [None])[0],
+         "path": str(art.path), "sha256": art.sha256} for req, art in pieces]}
+    text = json.dumps(view, indent=1)
+    try:
+        if pathlib.Path(path).read_text() == text:
+            return str(path)
+    except OSError:
+        pass
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+    return str(path)
+
+# ---------- lazy merged view ----------
+
+def _open_nc(path):
+    import xarray as xr
+    try:
+        return xr.open_dataset(path, engine="netcdf4")
+    except Exception:
+        return xr.open_dataset(path, engine="h5netcdf")
+
+def _open_chunk(c):
+    """Datasets in one chunk file (ADS may answer with a zip of NetCDFs)."""
+    if not zipfile.is_zipfile(c["path"]):
+        return [_open_nc(c["path"])]
+    art = download.Artifact(None, pathlib.Path(c["path"]), c["sha256"], None, None, None, False)
+    return [_open_nc(p) for p in download.members(art, lambda name: name.endswith((".nc", ".nc4")))]
+
+def _time_dim(ds):
+    for name, c in ds.coords.items():
+        if c.ndim == 1 and c.dims[0] == name and np.issubdtype(c.dtype, np.datetime64):
+            return name
+    return None
+
+def _concat_array():
+    from xarray.backends import BackendArray
+    from xarray.core import indexing
+
+    class Concat(BackendArray):
+        """Variables from several files joined along one axis; only the parts a read touches are loaded."""
+        def __init__(self, parts, axis):
+            self.parts, self.axis = parts, axis
+            self.offsets = np.cumsum([0] + [p.shape[axis] for p in parts])
+            shape = list(parts[0].shape)
+            shape[axis] = int(self.offsets[-1])
+            self.shape, self.dtype = tuple(shape), parts[0].dtype
+
+        def __getitem__(self, key):
+            return indexing.explicit_indexing_adapter(key, self.shape, indexing.IndexingSupport.OUTER, self._read)
+
+        def _read(self, key):
+            ax = self.axis
+            idx = np.arange(self.shape[ax])[key[ax]]
+            scalar = np.ndim(idx) == 0
+            idx = np.atleast_1d(idx)
+            out_ax = sum(not isinstance(k, (int, np.integer)) for k in key[:ax])
+            part = np.searchsorted(self.offsets, idx, side="right") - 1
+            blocks, pos = [], []
+            for i in np.unique(part):
+                m = np.flatnonzero(part == i)
+                blocks.append(np.asarray(self.parts[i][key[:ax] + (idx[m] - self.offsets[i],) + key[ax + 1:]].values))
+                pos.append(m)
+            if not blocks:
+                return np.asarray(self.parts[0][key[:ax] + (idx,) + key[ax + 1:]].values)
+            out = np.take(np.concatenate(blocks, axis=out_ax), np.argsort(np.concatenate(pos)), axis=out_ax)
+            return np.take(out, 0, axis=out_ax) if scalar else out
+
+    return Concat, indexing.LazilyIndexedArray
+
+def concat_lazy(dss):
+    """Datasets with the same variables, joined along their datetime dimension without reading data."""
+    import xarray as xr
+    dim = _time_dim(dss[0]) if len(dss) > 1 else None
+    if dim is None:
+        return dss[0]
+    Concat, Lazy = _concat_array()
+    coords = {}
+    for name, c in dss[0].coords.items():
+        coords[name] = (xr.Variable(c.dims, np.concatenate([d[name].values for d in dss]), c.attrs)
+                        if dim in c.dims else c.variable)
+    data = {}
+    for name, v in dss[0].data_vars.items():
+        if dim not in v.dims:
+            data[name] = v.variable
+            continue
+        parts = [d[name].variable for d in dss]
+        data[name] = xr.Variable(v.dims, Lazy(Concat(parts, v.dims.index(dim))), v.attrs, v.encoding)
+    return xr.Dataset(data, coords=coords, attrs=dss[0].attrs)
+
+def open_view(path):
+    """One lazily merged Dataset over the chunk files listed in a write_view() .json."""
+    import xarray as xr
+    with open(path) as f:
+        view = json.load(f)
+    windows = {}
+    for c in view["chunks"]:
+        windows.setdefault(c["date"] or "", []).extend(_open_chunk(c))
+    merged = [xr.merge(dss, compat="override", combine_attrs="drop_conflicts")
+              for _, dss in sorted(windows.items())]
+    return concat_lazy(merged)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, default=4, help="Chunks in flight at once")
+    ap.add_argument("--months", type=int, default=1, help="Months per chunk (0: whole date range)")
+    ap.add_argument("--retries", type=int, default=2, help="Retries per chunk")
+    ap.add_argument("--end", default=None, help="Move the request's end date (e.g. today) before planning")
+    args = ap.parse_args()
+
+    sys.path.insert(0, str(ROOT))  # fetch_ghg.py lives at the repo root
+    import fetch_ghg
+    request = dict(fetch_ghg.REQUEST)
+    if args.end:
+        request["date"] = [f"{date_ranges(request['date'])[0][0]}/{args.end}"]
+    with stage("retrieve") as st:
+        pieces = retrieve(fetch_ghg.DATASET, request, workers=args.workers, months=args.months, retries=args.retries)
+        st.rows(len(pieces))
+    out = write_view(os.path.join(fetch_ghg.DATA_DIR, "cams_latest.json"), fetch_ghg.DATASET, pieces)
+    print(f"[cds] view: {out}")
+    if os.path.exists(os.path.join(fetch_ghg.DATA_DIR, "cams_latest.nc")):
+        print("[cds] note: data/cams_latest.nc exists and is used before the view; remove it to switch")
+
+if __name__ == "__main__":
+    with job("cds_retrieve"):
+        main()
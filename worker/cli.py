@@ -0,0 +1,218 @@
+# worker/cli.py
+# One entry point for the loaders and queue workers:
+#   python worker <command> [args...]      (same args as python worker/<command>.py)
+#   python worker serve [--preload ...]    warm process on a local socket
+# - only the chosen command's module is imported, so a run pays for its own
+#   dependencies (xarray, cdsapi, ...) and nothing else; import / startup time is
+#   printed and recorded as the "import" stage of the command's metrics job
+# - while `serve` is running, one-shot commands are sent to it instead: it has
+#   the scientific stack imported already and forks a child per invocation
+#   (fresh worker modules, the caller's cwd and environment, output streamed
+#   back), so cron runs skip the ~1 s cold import. --cold bypasses it; the
+#   resident daemons (queue_daemon, point_service) always run in-process.
+
+import time
+T0 = time.perf_counter()
+
+import argparse, importlib, importlib.util, json, os, pathlib, signal, socket, sys
+from contextlib import nullcontext
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+SOCKET = os.environ.get("GHG_WORKER_SOCKET", str(ROOT / "data" / "worker.sock"))
+
+# command -> (script under the repo root, metrics job name or None, description)
+COMMANDS = {
+    "load_cams":       ("worker/load_cams.py", "load_cams", "CAMS CO2 NetCDF -> co2_grid / ghg_surface"),
+    "load_local":      ("worker/load_local.py", "load_local", "every NetCDF under data/ -> ghg_surface"),
+    "load_sst":        ("worker/load_sst.py", "load_sst", "SST .asc grids -> ghg_surface"),
+    "load_agro":       ("worker/load_agro.py", "load_agro", "CDS agroclimatic indicator -> ghg_surface"),
+    "load_vemap":      ("worker/load_vemap.py", "load_vemap", "VEMAP-2 NPP bundle -> ghg_surface"),
+    "fetch_ghg":       ("fetch_ghg.py", "fetch_ghg", "drain ghg_fetch_queue from the CAMS file"),
+    "cds_retrieve":    ("worker/cds_retrieve.py", "cds_retrieve", "chunked CAMS retrieval -> data/cams_latest.json"),
+    "process_queue":   ("worker/process.queue.py", "process_queue", "drain ghg_fetch_queue (all loaded layers)"),
+    "queue_daemon":    ("worker/queue_daemon.py", None, "resident ghg_fetch_queue worker"),
+    "scenario_engine": ("worker/scenario_engine.py", "scenario_engine", "refresh scenario_surface"),
+    "ensemble":        ("worker/ensemble.py", "ensemble", "Monte Carlo factory configurations -> ensemble_surface"),
+    "tile_pyramid":    ("worker/tile_pyramid.py", "tile_pyramid", "rebuild surface_tile"),
+    "regrid":          ("worker/regrid.py", "regrid", "regrid current snapshots onto a common grid"),
+    "compact":         ("worker/compact.py", "compact", "retention / rollups / incremental vacuum"),
+    "point_service":   ("worker/point_service.py", None, "resident point-query HTTP service"),
+    "asc_to_csv":      ("worker/asc_to_csv.py", None, "convert .asc grids to CSV"),
+}
+# long-running; never handed to the warm server
+DAEMONS = {"queue_daemon", "point_service"}
+
+# what `serve` imports up front (missing ones are skipped)
+PRELOAD = "numpy,scipy.sparse,scipy.spatial,scipy.ndimage,xarray,netCDF4,h5netcdf,cdsapi,requests"
+
+def load(script):
+    """Import a worker script by path (process.queue.py isn't a valid module name)."""
+    path = ROOT / script
+    if str(path.parent) not in sys.path:
+        sys.path.insert(0, str(path.parent))
+    name = path.stem
+    if "." not in name:
+        return importlib.import_module(name)
+    spec = importlib.util.spec_from_file_location(name.replace(".", "_"), path)
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = mod
+    spec.loader.exec_module(mod)
+    return mod
+
+def run(command, args, warm=False):
+    """Import and run one command in this process (its main() parses `args`)."""
+    script, job_name, _ = COMMANDS[command]
+    from instrument import job, stage  # after the (warm) caller's environment is in place
+    with job(job_name) if job_name else nullcontext():
+        t = time.perf_counter()
+        with stage("import", command=command, warm=warm) if job_name else nullcontext():
+            mod = load(script)
+        now = time.perf_counter()
+        print(f"[worker] {command}: imports {now - t:.3f}s, ready {now - T0:.3f}s after start"
+              f"{' (warm)' if warm else ''}", file=sys.stderr, flush=True)
+        sys.argv = [f"worker {command}", *args]
+        mod.main()
+
+def exit_code(e: SystemExit):
+    if e.code is None or isinstance(e.code, int):
+        return e.code or 0
+    print(e.code, file=sys.stderr)
+    return 1
+
+# ---------- warm mode ----------
+
+def _child(conn: socket.socket):
+    """Forked per invocation: adopt the caller's context, run, report the exit code."""
+    global T0
+    T0 = time.perf_counter()
+    for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGCHLD):
+        signal.signal(sig, signal.SIG_DFL)
+    req = json.loads(conn.makefile("rb").readline())
+    os.chdir(req["cwd"])
+    os.environ.clear()
+    os.environ.update(req["env"])
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.dup2(conn.fileno(), 1)
+    os.dup2(conn.fileno(), 2)
+    sys.stdout.reconfigure(line_buffering=True)
+    code = 1
+    try:
+        run(req["command"], req["args"], warm=True)
+        code = 0
+    except SystemExit as e:
+        code = exit_code(e)
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            conn.sendall(f"\0{code}\n".encode())
+        except OSError:
+            pass
+    return code
+
+def serve(argv):
+    ap = argparse.ArgumentParser(prog="worker serve")
+    ap.add_argument("--socket", default=SOCKET)
+    ap.add_argument("--preload", default=PRELOAD, help="Comma-separated modules to import up front")
+    args = ap.parse_args(argv)
+
+    t = time.perf_counter()
+    loaded = []
+    for name in filter(None, args.preload.split(",")):
+        try:
+            importlib.import_module(name)
+            loaded.append(name)
+        except ImportError:
+            pass
+    if "xarray" in sys.modules:
+        sys.modules["xarray"].backends.list_engines()  # entry-point scan, otherwise paid on first open
+    print(f"[serve] preloaded {', '.join(loaded)} in {time.perf_counter() - t:.2f}s")
+
+    path = pathlib.Path(args.socket)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.exists():
+        path.unlink()  # stale socket from a killed server
+    srv = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    srv.bind(str(path))
+    os.chmod(path, 0o600)
+    srv.listen(16)
+    srv.settimeout(1.0)  # wake up to reap children / notice a stop request
+    stopping = []
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stopping.append(True))
+    print(f"[serve] listening on {path}")
+    try:
+        while not stopping:
+            try:
+                while os.waitpid(-1, os.WNOHANG)[0]:
+                    pass
+            except ChildProcessError:
+                pass
+            try:
+                conn, _ = srv.accept()
+            except (socket.timeout, InterruptedError):
+                continue
+            if os.fork() == 0:
+                srv.close()
+                os._exit(_child(conn))
+            conn.close()
+    finally:
+        srv.close()
+        path.unlink(missing_ok=True)
+
+def send(sock_path, command, args):
+    """Run a command in the warm server; returns its exit code, or None if none is listening."""
+    if not os.path.exists(sock_path):
+        return None
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(sock_path)
+    except OSError:
+        s.close()
+        return None
+    with s:
+        req = {"command": command, "args": args, "cwd": os.getcwd(), "env": dict(os.environ)}
+        s.sendall(json.dumps(req).encode() + b"\n")
+        out, tail = sys.stdout.buffer, None
+        while chunk := s.recv(65536):
+            if tail is None:
+                i = chunk.find(b"\0")
+                if i < 0:
+                    out.write(chunk)
+                    out.flush()
+                    continue
+                out.write(chunk[:i])
+                tail, chunk = b"", chunk[i + 1:]
+            tail += chunk
+        out.flush()
+    if tail is None:
+        print(f"[worker] {command}: warm process exited without a status", file=sys.stderr)
+        return 1
+    return int(tail.strip() or 1)
+
+def main(argv=None):
+    listing = "\n".join(f"  {name:<16} {desc}" for name, (_, _, desc) in COMMANDS.items())
+    ap = argparse.ArgumentParser(
+        prog="worker", formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=f"commands:\n{listing}\n  {'serve':<16} keep a warm process on --socket\n\n"
+               "`worker <command> -h` shows the command's own options.")
+    ap.add_argument("--socket", default=SOCKET, help="Warm server socket (GHG_WORKER_SOCKET)")
+    ap.add_argument("--cold", action="store_true", help="Run in this process even if a warm server is up")
+    ap.add_argument("command", metavar="command", choices=[*COMMANDS, "serve"])
+    ap.add_argument("args", nargs=argparse.REMAINDER)
+    args = ap.parse_args(argv)
+
+    if args.command == "serve":
+        return serve(["--socket", args.socket, *args.args])
+    if not args.cold and args.command not in DAEMONS:
+        code = send(args.socket, args.command, args.args)
+        if code is not None:
+            return code
+    run(args.command, args.args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,310 @@
+# worker/compact.py
+# Retention / rollup / compaction so the DB stays bounded:
+# - ghg_surface: keep the newest --keep-snapshots snapshots per variable at full
+#   detail (the current one always), delete older ones (rows, packed grid_blob rows,
+#   surface_snapshot entries); rows of a snapshot that was never catalogued (a load
+#   killed before publish_snapshot()) go once they are --orphan-hours old
+# - ghg_observation: rows fetched more than --raw-days ago (fetched_at, from
+#   016_observation_fetched_at.sql) roll up into daily min/mean/max of their obs_time
+#   in ghg_observation_rollup, daily buckets older than --daily-days into monthly
+#   ones; the observation marker_popup.sql shows (MAX(id) per marker/variable)
+#   always stays raw
+# - free pages are handed back with PRAGMA incremental_vacuum in short slices
+# Everything runs in small transactions (--batch rows each, --pause between them)
+# within a --max-seconds budget, so SQLPage readers are never held up for long;
+# an interrupted run just continues next time.
+#   python worker/compact.py [--keep-snapshots 3 --raw-days 30 --daily-days 365]
+#   python worker/compact.py --enable-incremental-vacuum   # once; runs a full VACUUM
+
+import argparse, sqlite3, pathlib, time
+from instrument import job, stage
+from database import connect
+
+DB = pathlib.Path(__file__).resolve().parents[1] / "sqlpage" / "sqlpage.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ghg_observation_rollup (
+  marker_id INTEGER NOT NULL,
+  variable  TEXT    NOT NULL,
+  period    TEXT    NOT NULL,          -- 'day' | 'month'
+  bucket    TEXT    NOT NULL,          -- 'YYYY-MM-DD' | 'YYYY-MM'
+  n         INTEGER NOT NULL,          -- observations folded in
+  vmin      REAL,
+  vmean     REAL,
+  vmax      REAL,
+  unit      TEXT,
+  PRIMARY KEY (marker_id, variable, period, bucket)
+);
+CREATE TRIGGER IF NOT EXISTS trg_markers_delete_cleanup_rollup
+AFTER DELETE ON markers
+BEGIN
+DELETE FROM ghg_observation_rollup WHERE marker_id = OLD.id;
+END;
+"""
+
+# merging a bucket into an existing one: n-weighted mean (SET sees the old row)
+MERGE = """
+ON CONFLICT(marker_id, variable, period, bucket) DO UPDATE SET
+  n     = n + excluded.n,
+  vmin  = MIN(vmin, excluded.vmin),
+  vmax  = MAX(vmax, excluded.vmax),
+  vmean = (vmean * n + excluded.vmean * excluded.n) / (n + excluded.n)
+"""
+
+class Budget:
+    """Deadline for the whole run plus the pause that lets other connections in."""
+    def __init__(self, seconds, pause):
+        self.end, self.pause = time.monotonic() + seconds, pause
+
+    def left(self):
+        return time.monotonic() < self.end
+
+    def breathe(self):
+        time.sleep(self.pause)
+
+def ensure_schema(conn: sqlite3.Connection):
+    conn.executescript(SCHEMA)
+
+def _has_table(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,)).fetchone()
+
+def _has_column(conn, table, column):
+    return any(r[1] == column for r in conn.execute(f"PRAGMA table_info({table})"))
+
+def _cutoff(conn, days):
+    return conn.execute("SELECT strftime('%Y-%m-%dT%H:%M:%S', 'now', ?)", (f"-{days} days",)).fetchone()[0]
+
+# ---------------- ghg_surface snapshots ----------------
+def expired_snapshots(conn, keep):
+    """[(variable, obs_time)] beyond the newest `keep` catalogued snapshots of each variable."""
+    return conn.execute("""
+        SELECT variable, obs_time FROM (
+          SELECT variable, obs_time, is_current,
+                 ROW_NUMBER() OVER (PARTITION BY variable ORDER BY obs_time DESC) AS rn
+          FROM surface_snapshot
+        ) WHERE rn > ? AND is_current = 0
+        ORDER BY variable, obs_time
+    """, (keep,)).fetchall()
+
+def drop_snapshot(conn, variable, obs_time, budget, batch):
+    """Delete one snapshot's rows a batch at a time: (rows deleted, finished?)."""
+    deleted = 0
+    while budget.left():
+        with conn:
+            n = conn.execute("""
+                DELETE FROM ghg_surface WHERE rowid IN (
+                  SELECT rowid FROM ghg_surface WHERE variable=? AND obs_time=? LIMIT ?)
+            """, (variable, obs_time, batch)).rowcount
+            deleted += n
+            if n < batch:
+                conn.execute("DELETE FROM surface_snapshot WHERE variable=? AND obs_time=? AND is_current=0",
+                             (variable, obs_time))
+                print(f"[compact] {variable} @ {obs_time}: dropped {deleted} rows")
+                return deleted, True
+        budget.breathe()
+    return deleted, False
+
+def orphan_snapshots(conn, hours):
+    """
+    [(variable, obs_time)] with ghg_surface rows but no surface_snapshot entry,
+    written more than `hours` ago (obs_time is the load's start time). One index
+    seek per distinct snapshot instead of a scan.
+    """
+    cutoff = conn.execute("SELECT strftime('%Y-%m-%dT%H:%M:%SZ', 'now', ?)", (f"-{hours} hours",)).fetchone()[0]
+    found, key = [], ("", "")
+    while row := conn.execute(
+            "SELECT variable, obs_time FROM ghg_surface WHERE (variable, obs_time) > (?, ?) "
+            "ORDER BY variable, obs_time LIMIT 1", key).fetchone():
+        key = row
+        if row[1] < cutoff and not conn.execute(
+                "SELECT 1 FROM surface_snapshot WHERE variable=? AND obs_time=?", row).fetchone():
+            found.append(row)
+    return found
+
+def drop_blobs(conn, keep, orphan_hours=24):
+    """
+    Packed ghg_surface / regridded grids beyond the newest `keep` per variable, and
+    packed snapshots never catalogued within `orphan_hours` (one row each, so one
+    statement each).
+    """
+    if not _has_table(conn, "grid_blob"):
+        return 0
+    with conn:
+        orphans = conn.execute("""
+            DELETE FROM grid_blob
+            WHERE dataset = 'ghg_surface' AND obs_time < strftime('%Y-%m-%dT%H:%M:%SZ', 'now', ?)
+              AND NOT EXISTS (SELECT 1 FROM surface_snapshot s
+                              WHERE s.variable = grid_blob.variable AND s.obs_time = grid_blob.obs_time)
+        """, (f"-{orphan_hours} hours",)).rowcount
+        return orphans + conn.execute("""
+            DELETE FROM grid_blob WHERE rowid IN (
+              SELECT rowid FROM (
+                SELECT rowid, ROW_NUMBER() OVER (PARTITION BY dataset, variable ORDER BY obs_time DESC) AS rn
+                FROM grid_blob WHERE dataset = 'ghg_surface' OR (dataset LIKE 'regrid:%' AND variable <> 'sst')
+              ) WHERE rn > ?)
+        """, (keep,)).rowcount
+
+# ---------------- ghg_observation rollups ----------------
+def rollup_raw(conn, days, budget, batch):
+    """Fold raw observations fetched more than `days` ago into daily buckets, `batch` rows per transaction."""
+    cutoff = conn.execute("SELECT datetime('now', ?)", (f"-{days} days",)).fetchone()[0]  # CURRENT_TIMESTAMP format
+    total = 0
+    while budget.left():
+        with conn:
+            conn.execute("DROP TABLE IF EXISTS temp.rollup_batch")
+            conn.execute("""
+                CREATE TEMP TABLE rollup_batch AS
+                SELECT o.id FROM ghg_observation o
+                WHERE o.fetched_at < ?
+                  AND o.id < (SELECT MAX(l.id) FROM ghg_observation l
+                              WHERE l.marker_id = o.marker_id AND l.variable = o.variable)
+                LIMIT ?
+            """, (cutoff, batch))
+            conn.execute(f"""
+                INSERT INTO ghg_observation_rollup (marker_id, variable, period, bucket, n, vmin, vmean, vmax, unit)
+                SELECT marker_id, variable, 'day', substr(obs_time, 1, 10),
+                       COUNT(*), MIN(value), AVG(value), MAX(value), MAX(unit)
+                FROM ghg_observation
+                WHERE id IN (SELECT id FROM temp.rollup_batch) AND value IS NOT NULL
+                GROUP BY marker_id, variable, substr(obs_time, 1, 10)
+                {MERGE}
+            """)
+            n = conn.execute("DELETE FROM ghg_observation WHERE id IN (SELECT id FROM temp.rollup_batch)").rowcount
+            conn.execute("DROP TABLE temp.rollup_batch")
+        total += n
+        if n < batch:
+            break
+        budget.breathe()
+    return total
+
+def rollup_daily(conn, days, budget, batch):
+    """Fold daily buckets older than `days` into monthly ones."""
+    cutoff = _cutoff(conn, days)[:10]
+    total = 0
+    while budget.left():
+        with conn:
+            conn.execute("DROP TABLE IF EXISTS temp.rollup_batch")
+            conn.execute("""
+                CREATE TEMP TABLE rollup_batch AS
+                SELECT rowid AS id FROM ghg_observation_rollup
+                WHERE period = 'day' AND bucket < ? LIMIT ?
+            """, (cutoff, batch))
+            conn.execute(f"""
+                INSERT INTO ghg_observation_rollup (marker_id, variable, period, bucket, n, vmin, vmean, vmax, unit)
+                SELECT marker_id, variable, 'month', substr(bucket, 1, 7),
+                       SUM(n), MIN(vmin), SUM(vmean * n) / SUM(n), MAX(vmax), MAX(unit)
+                FROM ghg_observation_rollup
+                WHERE rowid IN (SELECT id FROM temp.rollup_batch) AND n > 0
+                GROUP BY marker_id, variable, substr(bucket, 1, 7)
+                {MERGE}
+            """)
+            n = conn.execute(
+                "DELETE FROM ghg_observation_rollup WHERE rowid IN (SELECT id FROM temp.rollup_batch)").rowcount
+            conn.execute("DROP TABLE temp.rollup_batch")
+        total += n
+        if n < batch:
+            break
+        budget.breathe()
+    return total
+
+def drop_months(conn, days):
+    """Monthly buckets older than `days` (0 = keep forever)."""
+    if not days:
+        return 0
+    with conn:
+        return conn.execute("DELETE FROM ghg_observation_rollup WHERE period = 'month' AND bucket < ?",
+                            (_cutoff(conn, days)[:7],)).rowcount
+
+# ---------------- space ----------------
+def incremental_vacuum(conn, budget, pages):
+    """Return free pages to the OS, `pages` at a time; needs auto_vacuum = INCREMENTAL."""
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        print(f"[compact] auto_vacuum is not INCREMENTAL; {free} free pages stay for reuse "
+              "(run once with --enable-incremental-vacuum to reclaim them)")
+        return 0
+    freed = 0
+    while budget.left():
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if not free:
+            break
+        conn.execute(f"PRAGMA incremental_vacuum({min(free, pages)})").fetchall()
+        freed += min(free, pages)
+        budget.breathe()
+    if conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal":
+        conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()  # never waits on readers
+    return freed
+
+def enable_incremental_vacuum(conn):
+    """One-off: switch auto_vacuum to INCREMENTAL (takes a full VACUUM, which blocks writers meanwhile)."""
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    print(f"[compact] auto_vacuum = {conn.execute('PRAGMA auto_vacuum').fetchone()[0]}")
+
+def compact(conn, keep=3, raw_days=30, daily_days=365, monthly_days=0,
+            seconds=60.0, pause=0.05, batch=5000, pages=2000, orphan_hours=24):
+    ensure_schema(conn)
+    budget = Budget(seconds, pause)
+    if _has_table(conn, "surface_snapshot"):
+        for variable, obs_time in expired_snapshots(conn, keep):
+            with stage("snapshots", var=variable) as st:
+                n, done = drop_snapshot(conn, variable, obs_time, budget, batch)
+                st.rows(n)
+            if not done:
+                break
+        for variable, obs_time in orphan_snapshots(conn, orphan_hours):
+            with stage("orphans", var=variable) as st:
+                n, done = drop_snapshot(conn, variable, obs_time, budget, batch)
+                st.rows(n)
+            if not done:
+                break
+        with stage("blobs") as st:
+            st.rows(drop_blobs(conn, keep, orphan_hours))
+    if _has_column(conn, "ghg_observation", "fetched_at"):
+        with stage("rollup_raw") as st:
+            st.rows(rollup_raw(conn, raw_days, budget, batch))
+    elif _has_table(conn, "ghg_observation"):
+        print("[compact] ghg_observation.fetched_at missing: run SQLPage migrations first "
+              "(sqlpage/migrations/016_observation_fetched_at.sql); raw rollup skipped")
+    with stage("rollup_daily") as st:
+        st.rows(rollup_daily(conn, daily_days, budget, batch))
+    with stage("drop_months") as st:
+        st.rows(drop_months(conn, monthly_days))
+    with stage("vacuum") as st:
+        st.rows(incremental_vacuum(conn, budget, pages))
+    if not budget.left():
+        print("[compact] time budget used up; the rest is left for the next run")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db", default=str(DB))
+    ap.add_argument("--keep-snapshots", type=int, default=3,
+                    help="Full-detail ghg_surface snapshots to keep per variable (>= 1)")
+    ap.add_argument("--orphan-hours", type=float, default=24,
+                    help="Drop uncatalogued ghg_surface snapshots (interrupted loads) older than this")
+    ap.add_argument("--raw-days", type=int, default=30, help="Raw observations older than this roll up daily")
+    ap.add_argument("--daily-days", type=int, default=365, help="Daily rollups older than this roll up monthly")
+    ap.add_argument("--monthly-days", type=int, default=0, help="Drop monthly rollups older than this (0 = never)")
+    ap.add_argument("--max-seconds", type=float, default=60.0, help="Time budget for the run")
+    ap.add_argument("--batch", type=int, default=5000, help="Rows per transaction")
+    ap.add_argument("--pause", type=float, default=0.05, help="Seconds between transactions")
+    ap.add_argument("--vacuum-pages", type=int, default=2000, help="Pages per incremental_vacuum slice")
+    ap.add_argument("--enable-incremental-vacuum", action="store_true",
+                    help="Switch the DB to auto_vacuum=INCREMENTAL (one full VACUUM) and exit")
+    args = ap.parse_args()
+    if args.keep_snapshots < 1:
+        ap.error("--keep-snapshots must be >= 1")
+
+    conn = connect(args.db)
+    try:
+        if args.enable_incremental_vacuum:
+            enable_incremental_vacuum(conn)
+            return
+        compact(conn, args.keep_snapshots, args.raw_days, args.daily_days, args.monthly_days,
+                args.max_seconds, args.pause, args.batch, args.vacuum_pages, args.orphan_hours)
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    with job("compact"):
+        main()
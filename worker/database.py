@@ -0,0 +1,184 @@
+# worker/database.py
+# Shared SQLite access for every worker script, so loads, queue workers and
+# SQLPage's reads of sqlpage/sqlpage.db coexist:
+# - connect(): one connection per (db, mode, thread), reused across modules;
+#   WAL journal (readers never block the writer, the writer never blocks readers),
+#   a busy timeout so a locked DB waits instead of raising "database is locked",
+#   synchronous=NORMAL (safe under WAL) and a larger prepared-statement cache
+# - Writer: a single writer thread fed through a queue; statements are applied
+#   in order and committed in transactions bounded by rows and seconds, so a
+#   long load never holds the write lock for more than a moment at a time
+
+import sqlite3, pathlib, threading, queue, time
+from concurrent.futures import Future
+from itertools import islice
+
+DB = pathlib.Path(__file__).resolve().parents[1] / "sqlpage" / "sqlpage.db"
+BUSY_TIMEOUT = 30.0       # seconds a statement waits for a lock before failing
+CACHED_STATEMENTS = 256   # prepared statements kept per connection (sqlite3 default: 128)
+
+_conns = {}  # (thread, path, readonly, kwargs) -> Connection
+_lock = threading.Lock()
+
+class Connection(sqlite3.Connection):
+    """sqlite3 connection that leaves the reuse cache when closed."""
+    def close(self):
+        with _lock:
+            for key in [k for k, c in _conns.items() if c is self]:
+                del _conns[key]
+        super().close()
+
+def _open(path, readonly=False, **kw):
+    kw.setdefault("timeout", BUSY_TIMEOUT)
+    kw.setdefault("cached_statements", CACHED_STATEMENTS)
+    if readonly:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, factory=Connection, **kw)
+    else:
+        conn = sqlite3.connect(path, factory=Connection, **kw)
+        if conn.execute("PRAGMA journal_mode").fetchone()[0] != "wal":
+            conn.execute("PRAGMA journal_mode=WAL")  # persistent: stored in the DB file
+        conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={int(kw['timeout'] * 1000)}")
+    return conn
+
+def connect(path=None, readonly=False, **kw) -> sqlite3.Connection:
+    """
+    The calling thread's connection to `path` (default: sqlpage/sqlpage.db),
+    opened on first use. Extra sqlite3.connect() arguments (isolation_level,
+    check_same_thread, ...) are part of the cache key; close() drops it.
+    """
+    path = str(path or DB)
+    key = (threading.get_ident(), path, readonly, tuple(sorted(kw.items())))
+    with _lock:
+        conn = _conns.get(key)
+    if conn is None:
+        conn = _open(path, readonly, **kw)
+        with _lock:
+            _conns[key] = conn
+    return conn
+
+class Writer:
+    """
+    Single writer thread with its own connection. execute()/executemany()/call()
+    queue work and return at once; it is applied in order inside BEGIN IMMEDIATE
+    transactions that commit once `rows` rows were written or the transaction is
+    `seconds` old, whichever comes first. A call() item always lands in one
+    transaction. On an error the open transaction is rolled back, later items
+    are dropped and flush()/close() raise it. Use as a context manager.
+    """
+    def __init__(self, path=None, rows=50_000, seconds=0.5, setup=None, depth=64):
+        self.rows, self.seconds = rows, seconds
+        self.q = queue.Queue(maxsize=depth)  # bounded: producers can't run far ahead of the disk
+        self.error = None
+        self.commits = self.written = 0
+        self.thread = threading.Thread(target=self._run, args=(str(path or DB), setup),
+                                       name="db-writer", daemon=True)
+        self.thread.start()
+
+    def execute(self, sql, params=()):
+        self._put(("execute", sql, params, None))
+
+    def executemany(self, sql, rows):
+        """Queue an executemany; a long iterable is split across transactions."""
+        self._put(("many", sql, rows, None))
+
+    def call(self, fn, *args):
+        """Run fn(conn, *args) on the writer connection; Future of its result."""
+        fut = Future()
+        self._put(("call", fn, args, fut))
+        return fut
+
+    def flush(self):
+        """Wait until everything queued so far is committed."""
+        fut = Future()
+        self._put(("flush", None, None, fut))
+        fut.result()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.q.put(None)
+            self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _put(self, item):
+        if self.error is not None:
+            raise self.error
+        self.q.put(item)
+
+    def _run(self, path, setup):
+        self.pending, self.started = 0, None
+        try:
+            conn = _open(path, isolation_level=None)  # transactions managed here
+            if setup:
+                setup(conn)
+        except BaseException as e:
+            conn, self.error = None, e  # fail every queued item instead of hanging producers
+        try:
+            while True:
+                wait = None if self.started is None else max(0.0, self.started + self.seconds - time.monotonic())
+                try:
+                    item = self.q.get(timeout=wait)
+                except queue.Empty:
+                    self._commit(conn)
+                    continue
+                if item is None:
+                    break
+                kind, a, b, fut = item
+                if self.error is not None:
+                    if fut:
+                        fut.set_exception(self.error)
+                    continue
+                try:
+                    if kind == "flush":
+                        self._commit(conn)
+                        fut.set_result(None)
+                    elif kind == "call":
+                        self._begin(conn)
+                        result = a(conn, *b)
+                        self._done(conn, 1)
+                        fut.set_result(result)
+                    elif kind == "execute":
+                        self._begin(conn)
+                        conn.execute(a, b)
+                        self._done(conn, 1)
+                    else:
+                        it = iter(b)
+                        while chunk := list(islice(it, max(1, min(self.rows - self.pending, 10_000)))):
+                            self._begin(conn)
+                            conn.executemany(a, chunk)
+                            self._done(conn, len(chunk))
+                except BaseException as e:
+                    if conn.in_transaction:
+                        conn.rollback()
+                    self.error, self.started, self.pending = e, None, 0
+                    if fut and not fut.done():
+                        fut.set_exception(e)
+        finally:
+            if conn is not None:
+                if conn.in_transaction:
+                    self._commit(conn) if self.error is None else conn.rollback()
+                conn.close()
+
+    def _begin(self, conn):
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+            self.started = time.monotonic()
+
+    def _done(self, conn, n):
+        self.pending += n
+        self.written += n
+        if self.pending >= self.rows or time.monotonic() - self.started >= self.seconds:
+            self._commit(conn)
+
+    def _commit(self, conn):
+        if conn.in_transaction:
+            conn.commit()
+            self.commits += 1
+        self.pending, self.started = 0, None
@@ -0,0 +1,235 @@
+# worker/download.py
+# Streamed, resumable, content-addressed download cache for the loaders.
+# - fetch(url) streams the response to partial/<key>.part in 1 MiB chunks,
+#   hashing as it goes; an interrupted transfer resumes with a Range request
+#   (If-Range on the ETag / Last-Modified it started with, so a file that changed
+#   upstream restarts from byte 0)
+# - a finished file is checked (length, optional sha256) and moved to
+#   objects/<sha256[:2]>/<sha256><suffix>; refs/<sha1(key)>.json maps the key
+#   (URL, or a request hash for CDS retrievals via put()) to it with its validators
+# - a key already in the cache is returned without touching the network;
+#   revalidate=True sends a conditional GET, force=True downloads again
+# - members() extracts single archive members next to the object, once
+# Cache root: data/cache/downloads (CACHE_DIR, resolved at call time).
+
+import contextlib, datetime, hashlib, json, os, pathlib, re, shutil, time, zipfile
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+CACHE_DIR = ROOT / "data" / "cache" / "downloads"
+CHUNK = 1 << 20
+
+Artifact = namedtuple("Artifact", "key path sha256 size etag last_modified fetched")
+
+class IncompleteDownload(Exception):
+    """The transfer stopped early or can't continue from the partial file; retried."""
+
+def _root(cache_dir=None):
+    return pathlib.Path(cache_dir or CACHE_DIR)
+
+def _kid(key):
+    return hashlib.sha1(key.encode()).hexdigest()
+
+def _ref_path(key, cache_dir=None):
+    return _root(cache_dir) / "refs" / f"{_kid(key)}.json"
+
+def partial_path(key, suffix="", cache_dir=None):
+    """Where an in-progress download of `key` lives (for put() after an external retrieve)."""
+    d = _root(cache_dir) / "partial"
+    d.mkdir(parents=True, exist_ok=True)
+    return d / f"{_kid(key)}{suffix}.part"
+
+def _write_json(path, obj):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(obj, indent=1))
+    os.replace(tmp, path)
+
+def _read_json(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+def lookup(key, cache_dir=None):
+    """Cached Artifact for `key`, or None (no ref, or its object is missing / truncated)."""
+    ref = _read_json(_ref_path(key, cache_dir))
+    if not ref:
+        return None
+    path = _root(cache_dir) / ref["object"]
+    try:
+        if path.stat().st_size != ref["size"]:
+            return None
+    except OSError:
+        return None
+    return Artifact(key, path, ref["sha256"], ref["size"], ref.get("etag"), ref.get("last_modified"), False)
+
+def _hash_file(path, h=None):
+    h = h or hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK), b""):
+            h.update(block)
+    return h
+
+def put(key, src, suffix="", digest=None, expected_sha256=None, cache_dir=None, **meta):
+    """
+    Move a finished file into the cache under `key` (sha256 computed unless given);
+    extra meta (url, etag, last_modified) is kept in the ref. Returns the Artifact.
+    """
+    src = pathlib.Path(src)
+    size = src.stat().st_size
+    digest = digest or _hash_file(src).hexdigest()
+    if expected_sha256 and digest != expected_sha256.lower():
+        src.unlink()
+        raise ValueError(f"{key}: sha256 {digest} != expected {expected_sha256}")
+    root = _root(cache_dir)
+    obj = root / "objects" / digest[:2] / f"{digest}{suffix}"
+    obj.parent.mkdir(parents=True, exist_ok=True)
+    if obj.exists():
+        src.unlink()
+    else:
+        os.replace(src, obj)
+    old = _read_json(_ref_path(key, cache_dir))
+    _write_json(_ref_path(key, cache_dir), {
+        "key": key, "object": str(obj.relative_to(root)), "sha256": digest, "size": size,
+        "stored_at": datetime.datetime.utcnow().replace(microsecond=0).isoformat() + "Z", **meta,
+    })
+    if old and old["object"] != str(obj.relative_to(root)):
+        _release(root, old)
+    return Artifact(key, obj, digest, size, meta.get("etag"), meta.get("last_modified"), True)
+
+def _release(root, old):
+    """Drop an object (and its extracted members) no other ref points at."""
+    for p in (root / "refs").glob("*.json"):
+        ref = _read_json(p)
+        if ref and ref["object"] == old["object"]:
+            return
+    (root / old["object"]).unlink(missing_ok=True)
+    shutil.rmtree(root / "extracted" / old["sha256"], ignore_errors=True)
+
+@contextlib.contextmanager
+def _locked(path):
+    """Exclusive lock so two runs don't append to the same .part file."""
+    try:
+        import fcntl
+    except ImportError:  # not on Windows
+        yield
+        return
+    with open(path.with_name(path.name + ".lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _content_range(value):
+    """(start, total) from 'bytes 100-199/1000' (total None for '*')."""
+    m = re.match(r"bytes (\d+)-\d+/(\d+|\*)", value or "")
+    if not m:
+        return None, None
+    return int(m.group(1)), (None if m.group(2) == "*" else int(m.group(2)))
+
+def _transfer(session, url, key, part, cached, timeout):
+    """One GET; appends to `part` when the server honours the Range. Returns (meta, sha256, size) or cached."""
+    state_path = part.with_name(part.name + ".json")
+    state = _read_json(state_path) or {}
+    have = part.stat().st_size if part.exists() else 0
+    headers = {"Accept-Encoding": "identity"}  # byte ranges/lengths of the stored file, not of a gzip stream
+    if cached:
+        if cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+    validator = state.get("etag") or state.get("last_modified")
+    if have and validator:
+        headers["Range"] = f"bytes={have}-"
+        headers["If-Range"] = validator
+
+    with session.get(url, headers=headers, stream=True, timeout=timeout, allow_redirects=True) as r:
+        if r.status_code == 304 and cached:
+            return cached
+        if r.status_code == 416:
+            part.unlink(missing_ok=True)
+            raise IncompleteDownload("range not satisfiable; restarting")
+        r.raise_for_status()
+        meta = {"url": url, "etag": r.headers.get("ETag"), "last_modified": r.headers.get("Last-Modified")}
+        if r.status_code == 206:
+            start, total = _content_range(r.headers.get("Content-Range"))
+            if start != have:
+                part.unlink(missing_ok=True)
+                raise IncompleteDownload(f"server resumed at {start}, have {have}; restarting")
+            h, mode = _hash_file(part), "ab"
+            print(f"[download] {key}: resuming at {have} bytes")
+        else:
+            length = r.headers.get("Content-Length")
+            have, total, h, mode = 0, (int(length) if length else None), hashlib.sha256(), "wb"
+        _write_json(state_path, meta)
+        with open(part, mode) as f:
+            for block in r.iter_content(CHUNK):
+                f.write(block)
+                h.update(block)
+                have += len(block)
+    if total is not None and have != total:
+        raise IncompleteDownload(f"got {have} of {total} bytes")
+    state_path.unlink(missing_ok=True)
+    return meta, h.hexdigest(), have
+
+def fetch(url, session=None, key=None, suffix=None, expected_sha256=None,
+          revalidate=False, force=False, retries=4, backoff=0.5, timeout=60, cache_dir=None):
+    """
+    Cached Artifact for `url` (key defaults to the URL), downloading it if needed.
+    Network errors mid-transfer resume from the partial file, up to `retries` times
+    (backoff, 2*backoff, ... seconds apart).
+    """
+    import requests
+    key = key or url
+    suffix = pathlib.PurePosixPath(urlsplit(url).path).suffix if suffix is None else suffix
+    cached = None if force else lookup(key, cache_dir)
+    if cached and not revalidate:
+        print(f"[download] {key}: cached {cached.sha256[:12]} ({cached.size} bytes)")
+        return cached
+    session = session or requests.Session()
+    part = partial_path(key, suffix, cache_dir)
+    with _locked(part):
+        if not (force or revalidate):
+            cached = lookup(key, cache_dir)  # another run may have finished it while we waited
+            if cached:
+                return cached
+        for attempt in range(retries + 1):
+            try:
+                out = _transfer(session, url, key, part, cached, timeout)
+                break
+            except (IncompleteDownload, requests.ConnectionError, requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError) as e:
+                if attempt == retries:
+                    raise
+                print(f"[download] {key}: {e} (retry {attempt + 1}/{retries})")
+                time.sleep(backoff * 2 ** attempt)
+        if isinstance(out, Artifact):
+            print(f"[download] {key}: not modified")
+            return out
+        meta, digest, size = out
+        art = put(key, part, suffix, digest=digest, expected_sha256=expected_sha256, cache_dir=cache_dir, **meta)
+    print(f"[download] {key}: {size} bytes -> {art.sha256[:12]}")
+    return art
+
+def members(art: Artifact, want, cache_dir=None):
+    """
+    Paths of the zip members of `art` for which want(name) is true, extracted
+    lazily (one at a time, streamed) into extracted/<sha256>/ and reused afterwards.
+    """
+    dest = _root(cache_dir) / "extracted" / art.sha256
+    with zipfile.ZipFile(art.path) as z:
+        for info in z.infolist():
+            if info.is_dir() or not want(info.filename):
+                continue
+            parts = [p for p in pathlib.PurePosixPath(info.filename).parts if p not in ("/", "..")]
+            out = dest.joinpath(*parts)
+            if not (out.exists() and out.stat().st_size == info.file_size):
+                out.parent.mkdir(parents=True, exist_ok=True)
+                tmp = out.with_name(out.name + ".tmp")
+                with z.open(info) as src, open(tmp, "wb") as dst:
+                    shutil.copyfileobj(src, dst, CHUNK)  # CRC is checked at the end of the stream
+                os.replace(tmp, out)
+            yield out
@@ -0,0 +1,172 @@
+# worker/enrich.py
+# One-pass marker enrichment: every loaded layer is sampled for a whole batch of
+# claimed markers, so a popup gets the full climate profile from one job.
+# - the CAMS cube (fetch_ghg's sampler, memmap cache) when one is open
+# - the current ghg_surface snapshots (co2, precip, npp, ...): their packed
+#   grid_blob row if there is one, else the rows gridded once (gridblob.from_points)
+# - the SST climatology: sst_grid's r/c grid (or its grid_blob rows), the month
+#   closest to the batch's obs_time
+# Every layer is held as a regular grid, so a batch costs one index computation
+# and one fancy-index per layer. Markers off a layer's extent or on its nodata
+# cells get no row for it; CAMS variables win over a surface snapshot of the same name.
+# Layers stay loaded between batches; refresh() reloads them only when another
+# connection has committed (PRAGMA data_version) and the layer fingerprint moved.
+
+import sqlite3, time, datetime
+from itertools import repeat
+import numpy as np
+from gridblob import GridHeader, from_points, read_grid
+from load_sst import SST_HEADER, SST_SENTINELS
+
+UNITS = {"co2": "ppm", "sst": "°C"}  # ghg_surface has no unit column
+
+class Grid:
+    """Regular lat/lon grid in memory (r = 0 south); lookups are index arithmetic."""
+    def __init__(self, header: GridHeader, arr):
+        self.h, self.arr = header, np.asarray(arr, dtype=np.float32)
+        self.wrap = abs(header.nlon * header.dlon - 360.0) < header.dlon / 2
+
+    def sample(self, lats, lons):
+        """Nearest-cell values; NaN on nodata and off the grid (lons in [-180, 180))."""
+        h = self.h
+        fr = (lats - h.lat0) / h.dlat
+        fc = (lons - h.lon0) / h.dlon
+        ok = (fr >= -0.5) & (fr <= h.nlat - 0.5)
+        if not self.wrap:
+            ok &= (fc >= -0.5) & (fc <= h.nlon - 0.5)
+        r = np.clip(np.rint(fr), 0, h.nlat - 1).astype(np.int64)
+        c = np.rint(fc).astype(np.int64)
+        c = c % h.nlon if self.wrap else np.clip(c, 0, h.nlon - 1)
+        out = self.arr[r, c].astype(np.float64)
+        out[~ok] = np.nan
+        return out
+
+def _has_table(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,)).fetchone()
+
+def signature(conn: sqlite3.Connection):
+    """Cheap fingerprint of everything the layers come from."""
+    parts = []
+    if _has_table(conn, "surface_snapshot"):
+        parts.append(conn.execute(
+            "SELECT group_concat(variable || '@' || obs_time || '@' || loaded_at, ';') "
+            "FROM surface_snapshot WHERE is_current = 1").fetchone())
+    if _has_table(conn, "sst_grid"):
+        parts.append(conn.execute("SELECT COUNT(*), MAX(rowid) FROM sst_grid WHERE kind = 'clim'").fetchone())
+    if _has_table(conn, "grid_blob"):
+        parts.append(conn.execute(
+            "SELECT group_concat(variable || '@' || obs_time || '@' || rowid, ';') "
+            "FROM grid_blob WHERE dataset = 'sst'").fetchone())
+    return repr(parts)
+
+def surface_grid(conn, variable, obs_time):
+    """Grid of one ghg_surface snapshot, or None (empty, or not a regular lat/lon grid)."""
+    if _has_table(conn, "grid_blob"):
+        found = read_grid(conn, "ghg_surface", variable, obs_time)
+        if found:
+            return Grid(*found)
+    rows = conn.execute(
+        "SELECT lat, lon, value FROM ghg_surface WHERE variable=? AND obs_time=? AND value IS NOT NULL",
+        (variable, obs_time)).fetchall()
+    if not rows:
+        return None
+    lats, lons, vals = (np.array(col, dtype=np.float64) for col in zip(*rows))
+    packed = from_points(lats, ((lons + 180.0) % 360.0) - 180.0, vals)
+    if packed is None:
+        print(f"[enrich] {variable} @ {obs_time}: not a regular lat/lon grid, skipped")
+        return None
+    return Grid(*packed)
+
+def sst_grids(conn):
+    """{period 'MM': Grid} of the SST climatology; grid_blob rows first, then sst_grid."""
+    h = GridHeader(nodata=np.nan, **SST_HEADER)
+    grids = {}
+    if _has_table(conn, "grid_blob"):
+        for (period,) in conn.execute(
+                "SELECT obs_time FROM grid_blob WHERE dataset = 'sst' AND variable = 'clim'").fetchall():
+            grids[period] = Grid(*read_grid(conn, "sst", "clim", period))
+    if grids or not _has_table(conn, "sst_grid"):
+        return grids
+    rows = conn.execute("SELECT period, r, c, sst FROM sst_grid WHERE kind = 'clim'").fetchall()
+    if not rows:
+        return grids
+    period, r, c, sst = zip(*rows)
+    period, sst = np.array(period), np.array(sst, dtype=np.float64)
+    r, c = np.array(r, dtype=np.int64), np.array(c, dtype=np.int64)
+    sst[np.isin(sst, SST_SENTINELS)] = np.nan
+    for p in np.unique(period):
+        m = period == p
+        arr = np.full((h.nlat, h.nlon), np.nan, dtype=np.float32)
+        arr[h.nlat - 1 - r[m], c[m]] = sst[m]  # sst_grid's r = 0 is 90N; flip to south-up
+        grids[str(p)] = Grid(h, arr)
+    return grids
+
+def nearest_period(periods, month):
+    """Climatology period ('MM') closest to `month`, going round the year."""
+    return min(periods, key=lambda p: (min(abs(int(p) - month), 12 - abs(int(p) - month)), p))
+
+def _month(obs_time):
+    try:
+        return int(str(obs_time)[5:7])
+    except ValueError:
+        return datetime.datetime.utcnow().month
+
+class Profile:
+    """
+    sample(marker_ids, lats, lons) -> (obs_time, ghg_observation rows) across all
+    loaded layers; set `cams` to fetch_ghg's sampler (or None) before calling.
+    """
+    def __init__(self, cams=None):
+        self.cams = cams
+        self.surface, self.sst = {}, {}
+        self.version = self.sig = None
+
+    def refresh(self, conn: sqlite3.Connection):
+        """Reload the layers if another connection changed them; True if it did."""
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self.version:
+            return False
+        self.version = version
+        sig = signature(conn)
+        if sig == self.sig:
+            return False
+        t0 = time.perf_counter()
+        own_txn = not conn.in_transaction
+        if own_txn:
+            conn.execute("BEGIN")  # one consistent read across all layers
+        try:
+            surface = {}
+            if _has_table(conn, "surface_snapshot"):
+                for variable, obs_time in conn.execute(
+                        "SELECT variable, obs_time FROM surface_snapshot WHERE is_current = 1").fetchall():
+                    grid = surface_grid(conn, variable, obs_time)
+                    if grid is not None:
+                        surface[variable] = (obs_time, grid)
+            sst = sst_grids(conn)
+        finally:
+            if own_txn:
+                conn.rollback()
+        self.surface, self.sst, self.sig = surface, sst, sig
+        print(f"[enrich] layers: {', '.join(sorted(surface)) or 'no surface snapshots'}; "
+              f"sst months: {','.join(sorted(sst)) or 'none'} ({time.perf_counter() - t0:.2f}s)")
+        return True
+
+    def __call__(self, marker_ids, lats, lons):
+        obs_time, rows = self.cams(marker_ids, lats, lons) if self.cams else (None, [])
+        stamp = obs_time or datetime.datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
+        ids = np.asarray(marker_ids)
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = ((np.asarray(lons, dtype=np.float64) + 180.0) % 360.0) - 180.0
+        have = {r[2] for r in rows}
+
+        def add(variable, when, vals):
+            ok = np.isfinite(vals)
+            rows.extend(zip(ids[ok].tolist(), repeat(when), repeat(variable), vals[ok].tolist(),
+                            repeat(UNITS.get(variable))))
+
+        for variable, (snap_time, grid) in self.surface.items():
+            if variable not in have:
+                add(variable, snap_time, grid.sample(lats, lons))
+        if self.sst and "sst" not in have:
+            add("sst", stamp, self.sst[nearest_period(self.sst, _month(stamp))].sample(lats, lons))
+        return stamp, rows
@@ -0,0 +1,295 @@
+# worker/ensemble.py
+# Monte Carlo / ensemble evaluation of factory configurations with the scenario
+# kernel (scenario_engine.py: K * strength / (haversine_km^2 + 1)) over a current
+# ghg_surface snapshot.
+# - members come from --configs (JSON list of configurations, each a list of
+#   [lat, lon, strength]) or are drawn around the current markers/factory_params:
+#   strength multipliers (--strength lognormal:0.3 | uniform:0.5:1.5 | normal:0.2),
+#   on/off (--p-active), position jitter (--jitter-km) and extra --candidates sites
+# - a run is (members x sites) arrays. Members sharing their sites (no jitter) cost
+#   one matrix product per grid block: strengths (members x sites) @ kernel
+#   (sites x cells). Otherwise the kernel is evaluated per member site
+# - grid blocks are sized to BLOCK elements and spread over a process pool
+# - only per-cell summaries are stored, in ensemble_surface under one ensemble_run
+#   row: mean / p5 / p95 of the delta over members, and
+#   P(baseline + delta > --threshold)
+#   python worker/ensemble.py --members 1000 --strength lognormal:0.3 [--threshold 425]
+
+import argparse, json, os, pathlib, time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from catalog import current_snapshots
+from gridblob import read_grid
+from scenario_engine import R_EARTH_KM, K, current_factories
+from instrument import job, stage
+from database import connect
+
+DB = pathlib.Path(__file__).resolve().parents[1] / "sqlpage" / "sqlpage.db"
+
+KM_PER_DEG = 111.32
+# elements per NumPy block (kernel / member fields); small enough for the allocator to reuse
+BLOCK = 2_000_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ensemble_run (
+  id          INTEGER  PRIMARY KEY,
+  name        TEXT,
+  variable    TEXT     NOT NULL,
+  obs_time    TEXT     NOT NULL,
+  members     INTEGER  NOT NULL,
+  sites       INTEGER  NOT NULL,
+  threshold   REAL,
+  spec        TEXT,
+  seconds     REAL,
+  created_at  DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS ensemble_surface (
+  ensemble_id INTEGER NOT NULL,
+  lat         REAL    NOT NULL,
+  lon         REAL    NOT NULL,
+  baseline    REAL    NOT NULL,
+  mean        REAL    NOT NULL,
+  p05         REAL    NOT NULL,
+  p95         REAL    NOT NULL,
+  p_exceed    REAL,
+  PRIMARY KEY (ensemble_id, lat, lon)
+) WITHOUT ROWID;
+"""
+
+# ---------------- members ----------------
+def draw_strength(rng, dist, shape):
+    """Strength multipliers with mean ~1: fixed, lognormal[:sigma], uniform[:lo:hi], normal[:sd]."""
+    kind, *p = dist.split(":")
+    p = [float(x) for x in p]
+    if kind == "fixed":
+        return np.ones(shape)
+    if kind == "lognormal":
+        sigma = p[0] if p else 0.3
+        return rng.lognormal(-sigma * sigma / 2.0, sigma, shape)
+    if kind == "uniform":
+        lo, hi = p if p else (0.5, 1.5)
+        return rng.uniform(lo, hi, shape)
+    if kind == "normal":
+        return np.clip(rng.normal(1.0, p[0] if p else 0.2, shape), 0.0, None)
+    raise ValueError(f"unknown strength distribution {dist!r}")
+
+def draw_members(factories, n, rng, strength="fixed", p_active=1.0, jitter_km=0.0,
+                 candidates=(), p_candidate=0.5):
+    """(lat, lon, strength), each (n, sites), around `factories` [(lat, lon, strength)] plus candidate sites."""
+    sites = list(factories) + list(candidates)
+    lat0, lon0, s0 = (np.array(c, dtype=np.float64) for c in zip(*sites))
+    shape = (n, len(sites))
+    active = np.r_[np.full(len(factories), p_active), np.full(len(candidates), p_candidate)]
+    s = s0 * draw_strength(rng, strength, shape) * (rng.random(shape) < active)
+    if jitter_km <= 0:
+        return np.broadcast_to(lat0, shape), np.broadcast_to(lon0, shape), s
+    dy, dx = rng.normal(0.0, jitter_km, (2, *shape))
+    lat = np.clip(lat0 + dy / KM_PER_DEG, -90.0, 90.0)
+    lon = lon0 + dx / (KM_PER_DEG * np.maximum(np.cos(np.radians(lat0)), 1e-6))
+    return lat, lon, s
+
+def from_configs(configs):
+    """(lat, lon, strength) arrays from explicit configurations, padded with zero-strength sites."""
+    n, f = len(configs), max((len(c) for c in configs), default=0)
+    lat, lon, s = np.zeros((n, f)), np.zeros((n, f)), np.zeros((n, f))
+    for i, config in enumerate(configs):
+        if config:
+            lat[i, :len(config)], lon[i, :len(config)], s[i, :len(config)] = zip(*config)
+    return lat, lon, s
+
+# ---------------- kernel ----------------
+def unit(lat, lon):
+    la, lo = np.radians(lat), np.radians(lon)
+    return np.stack([np.cos(la) * np.cos(lo), np.cos(la) * np.sin(lo), np.sin(la)], axis=-1)
+
+def kernel(a, b):
+    """K / (great-circle km^2 + 1) between unit vectors a (N, 3) and b (P, 3) -> (N, P)."""
+    k = a @ b.T
+    np.subtract(1.0, k, out=k)
+    np.clip(k, 0.0, 2.0, out=k)
+    np.sqrt(k * 0.5, out=k)                        # half the chord length
+    np.arcsin(np.minimum(k, 1.0, out=k), out=k)
+    k *= 2.0 * R_EARTH_KM                          # km
+    np.square(k, out=k)
+    k += 1.0
+    return np.divide(K, k, out=k)
+
+def plan_members(lat, lon, s):
+    """Shared-site form {"S": (U, M) strengths, "sites": (U, 3)} when it fits, else per-member sites."""
+    m, f = s.shape
+    pairs = np.stack([np.ravel(lat), np.ravel(lon)], axis=1)
+    uniq, inv = np.unique(pairs, axis=0, return_inverse=True)
+    if m * len(uniq) <= BLOCK:
+        S = np.zeros((len(uniq), m))
+        np.add.at(S, (inv.ravel(), np.repeat(np.arange(m), f)), np.ravel(s))
+        return {"S": S, "sites": unit(uniq[:, 0], uniq[:, 1])}
+    return {"s": np.ascontiguousarray(s), "sites": unit(lat, lon)}   # sites (M, F, 3)
+
+_STATE = {}
+
+def _init(state):
+    _STATE.clear()
+    _STATE.update(state)
+
+def fields(cells):
+    """Delta of every member at cells (G, 3) -> (G, M), members contiguous per cell."""
+    if "S" in _STATE:
+        return kernel(cells, _STATE["sites"]) @ _STATE["S"]
+    s, sites = _STATE["s"], _STATE["sites"]
+    m, f = s.shape
+    out = np.empty((len(cells), m))
+    step = max(1, BLOCK // max(1, f * len(cells)))
+    for i in range(0, m, step):
+        k = kernel(cells, sites[i:i + step].reshape(-1, 3)).reshape(len(cells), -1, f)
+        out[:, i:i + step] = np.einsum("gmf,mf->gm", k, s[i:i + step])
+    return out
+
+def _block(task):
+    """Summaries for one grid block: (mean, p05, p95, p_exceed)."""
+    glat, glon, base = task
+    d = fields(unit(glat, glon))
+    threshold = _STATE["threshold"]
+    mean = d.mean(axis=1)
+    if threshold is None:
+        exceed = np.full(base.shape, np.nan)
+    else:
+        exceed = (d > (threshold - base)[:, None]).mean(axis=1)
+    p05, p95 = np.percentile(d, [5.0, 95.0], axis=1, overwrite_input=True)
+    return mean, p05, p95, exceed
+
+def evaluate(glat, glon, base, lat, lon, s, threshold=None, workers=None):
+    """(mean, p05, p95, p_exceed) per grid cell over the members (lat, lon, s: (M, sites))."""
+    state = plan_members(lat, lon, s)
+    state["threshold"] = threshold
+    width = len(state["sites"]) if "S" in state else s.shape[1]   # kernel rows per member block
+    gb = max(1, BLOCK // max(width, s.shape[0]))
+    tasks = [(glat[i:i + gb], glon[i:i + gb], base[i:i + gb]) for i in range(0, glat.size, gb)]
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    if workers <= 1:
+        _init(state)
+        parts = list(map(_block, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init, initargs=(state,)) as pool:
+            parts = list(pool.map(_block, tasks))
+    if not parts:
+        return tuple(np.empty(0) for _ in range(4))
+    return tuple(np.concatenate(col) for col in zip(*parts))
+
+# ---------------- DB ----------------
+def grid(conn, variable):
+    """
+    (obs_time, lat, lon, baseline) of the current snapshot of `variable`: its
+    ghg_surface rows, or its packed grid_blob (--storage blob loads); cells
+    without a value are left out.
+    """
+    obs_time = dict(current_snapshots(conn)).get(variable)
+    if obs_time is None:
+        raise SystemExit(f"no current {variable} snapshot in ghg_surface")
+    rows = conn.execute(
+        "SELECT lat, lon, value FROM ghg_surface WHERE variable=? AND obs_time=? AND value IS NOT NULL",
+        (variable, obs_time)
+    ).fetchall()
+    if rows:
+        return (obs_time, *(np.array(c, dtype=np.float64) for c in zip(*rows)))
+    found = None
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='grid_blob'").fetchone():
+        found = read_grid(conn, "ghg_surface", variable, obs_time)
+    if not found:
+        raise SystemExit(f"{variable} @ {obs_time}: no cells in ghg_surface or grid_blob")
+    h, arr = found
+    glat, glon = np.meshgrid(h.lat0 + h.dlat * np.arange(h.nlat), h.lon0 + h.dlon * np.arange(h.nlon), indexing="ij")
+    ok = np.isfinite(arr)
+    return obs_time, glat[ok], glon[ok], arr[ok].astype(np.float64)
+
+def store(conn, name, variable, obs_time, spec, members, sites, threshold, seconds, glat, glon, base, stats):
+    """One ensemble_run row and its surface in one transaction; returns the ensemble id."""
+    mean, p05, p95, exceed = stats
+    exceed = [None if not np.isfinite(v) else v for v in exceed.tolist()]
+    with conn:
+        eid = conn.execute(
+            "INSERT INTO ensemble_run(name,variable,obs_time,members,sites,threshold,spec,seconds) "
+            "VALUES (?,?,?,?,?,?,?,?)",
+            (name, variable, obs_time, members, sites, threshold, json.dumps(spec), seconds)
+        ).lastrowid
+        conn.executemany(
+            "INSERT INTO ensemble_surface(ensemble_id,lat,lon,baseline,mean,p05,p95,p_exceed) VALUES (?,?,?,?,?,?,?,?)",
+            zip([eid] * glat.size, glat.tolist(), glon.tolist(), base.tolist(),
+                mean.tolist(), p05.tolist(), p95.tolist(), exceed)
+        )
+    return eid
+
+def prune(conn, keep):
+    """Drop all but the newest `keep` ensembles."""
+    with conn:
+        old = [r[0] for r in conn.execute(
+            "SELECT id FROM ensemble_run ORDER BY id DESC LIMIT -1 OFFSET ?", (keep,)).fetchall()]
+        conn.executemany("DELETE FROM ensemble_surface WHERE ensemble_id=?", [(i,) for i in old])
+        conn.executemany("DELETE FROM ensemble_run WHERE id=?", [(i,) for i in old])
+    return len(old)
+
+def _load_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db", default=str(DB))
+    ap.add_argument("--variable", default="co2")
+    ap.add_argument("--name", default=None)
+    ap.add_argument("--configs", default=None,
+                    help="JSON list of configurations ([[lat, lon, strength], ...] each) instead of drawing them")
+    ap.add_argument("--members", type=int, default=1000)
+    ap.add_argument("--strength", default="lognormal:0.3",
+                    help="Multiplier distribution: fixed, lognormal:SIGMA, uniform:LO:HI, normal:SD")
+    ap.add_argument("--p-active", type=float, default=1.0, help="Probability each existing factory operates")
+    ap.add_argument("--jitter-km", type=float, default=0.0, help="Gaussian position jitter per factory, km")
+    ap.add_argument("--candidates", default=None, help="JSON list of extra [lat, lon, strength] sites")
+    ap.add_argument("--p-candidate", type=float, default=0.5, help="Probability each candidate site is built")
+    ap.add_argument("--threshold", type=float, default=None, help="p_exceed = P(baseline + delta > threshold)")
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--workers", type=int, default=None, help="Processes (default: CPU count)")
+    ap.add_argument("--keep", type=int, default=10, help="Ensembles kept after this run (0 = all)")
+    args = ap.parse_args()
+
+    conn = connect(args.db)
+    try:
+        conn.executescript(SCHEMA)
+        t0 = time.perf_counter()
+        with stage("grid", var=args.variable) as st:
+            obs_time, glat, glon, base = grid(conn, args.variable)
+            st.rows(glat.size)
+        with stage("members") as st:
+            if args.configs:
+                lat, lon, s = from_configs(_load_json(args.configs))
+                spec = {"configs": os.path.basename(args.configs)}
+            else:
+                factories = list(current_factories(conn).values())
+                candidates = _load_json(args.candidates) if args.candidates else []
+                if not factories and not candidates:
+                    raise SystemExit("no markers or candidate sites to build members from")
+                spec = {k: getattr(args, k) for k in
+                        ("members", "strength", "p_active", "jitter_km", "p_candidate", "seed")}
+                spec["factories"], spec["candidates"] = len(factories), len(candidates)
+                lat, lon, s = draw_members(factories, args.members, np.random.default_rng(args.seed),
+                                           args.strength, args.p_active, args.jitter_km, candidates, args.p_candidate)
+            st.rows(s.shape[0])
+        with stage("evaluate", var=args.variable) as st:
+            stats = evaluate(glat, glon, base, lat, lon, s, args.threshold, args.workers)
+            st.rows(glat.size * s.shape[0])
+        seconds = time.perf_counter() - t0
+        with stage("write") as st:
+            eid = store(conn, args.name, args.variable, obs_time, spec, s.shape[0], s.shape[1], args.threshold,
+                        seconds, glat, glon, base, stats)
+            st.rows(glat.size)
+        print(f"[ensemble] #{eid}: {s.shape[0]} members x {s.shape[1]} sites over {glat.size} {args.variable} "
+              f"cells @ {obs_time} in {seconds:.2f}s")
+        if args.keep:
+            dropped = prune(conn, args.keep)
+            if dropped:
+                print(f"[ensemble] pruned {dropped} older ensembles")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    with job("ensemble"):
+        main()
@@ -0,0 +1,148 @@
+# worker/gridblob.py
+# Packed grid storage: one grid_blob row per (dataset, variable, obs_time) instead
+# of one row per cell.
+# - header columns: origin (lat0, lon0 = south-west cell centre), spacing, shape, nodata
+# - data: float32 little-endian, row-major, r = 0 is the southernmost row
+# Lookups are index arithmetic: a point read fetches 4 bytes through incremental
+# blob I/O; a region read fetches only the rows it needs.
+
+import sqlite3
+from collections import namedtuple
+import numpy as np
+from gridindex import regular_axis
+
+NODATA = -9999.0
+DTYPE = np.dtype("<f4")
+
+GridHeader = namedtuple("GridHeader", "lat0 dlat nlat lon0 dlon nlon nodata")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS grid_blob (
+  dataset   TEXT    NOT NULL,   -- 'ghg_surface', 'co2_grid', 'sst'
+  variable  TEXT    NOT NULL,
+  obs_time  TEXT    NOT NULL,
+  lat0      REAL    NOT NULL,
+  dlat      REAL    NOT NULL,
+  nlat      INTEGER NOT NULL,
+  lon0      REAL    NOT NULL,
+  dlon      REAL    NOT NULL,
+  nlon      INTEGER NOT NULL,
+  nodata    REAL    NOT NULL,
+  data      BLOB    NOT NULL,
+  PRIMARY KEY (dataset, variable, obs_time)
+);
+"""
+
+def ensure_schema(conn: sqlite3.Connection):
+    conn.executescript(SCHEMA)
+
+# ---------------- encode / decode ----------------
+def encode(arr, nodata=NODATA) -> bytes:
+    a = np.asarray(arr, dtype=np.float64)
+    return np.where(np.isfinite(a), a, nodata).astype(DTYPE).tobytes()
+
+def decode(data, header: GridHeader):
+    a = np.frombuffer(data, dtype=DTYPE).reshape(header.nlat, header.nlon).astype(np.float32)
+    a[a == np.float32(header.nodata)] = np.nan
+    return a
+
+def from_axes(lat, lon, arr):
+    """Header + south-up array for a full grid on 1D axes (either direction)."""
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    arr = np.asarray(arr)
+    ax_lat, ax_lon = regular_axis(lat), regular_axis(lon)
+    if ax_lat is None or ax_lon is None or ax_lat[2] != lat.size or ax_lon[2] != lon.size:
+        return None
+    arr = arr[np.argsort(lat)][:, np.argsort(lon)]
+    return GridHeader(ax_lat[0], ax_lat[1], ax_lat[2], ax_lon[0], ax_lon[1], ax_lon[2], NODATA), arr
+
+def from_points(lats, lons, vals):
+    """Header + array from scattered cells of a regular grid (gaps become nodata)."""
+    ax_lat, ax_lon = regular_axis(lats), regular_axis(lons)
+    if ax_lat is None or ax_lon is None:
+        return None
+    h = GridHeader(ax_lat[0], ax_lat[1], ax_lat[2], ax_lon[0], ax_lon[1], ax_lon[2], NODATA)
+    arr = np.full((h.nlat, h.nlon), np.nan, dtype=np.float32)
+    r = np.rint((np.asarray(lats) - h.lat0) / h.dlat).astype(np.int64)
+    c = np.rint((np.asarray(lons) - h.lon0) / h.dlon).astype(np.int64)
+    arr[r, c] = vals
+    return h, arr
+
+# ---------------- DB I/O ----------------
+def write_blob(conn: sqlite3.Connection, dataset, variable, obs_time, header: GridHeader, arr):
+    """Insert/replace one grid (call ensure_schema() first; this doesn't commit)."""
+    conn.execute(
+        "INSERT OR REPLACE INTO grid_blob(dataset,variable,obs_time,lat0,dlat,nlat,lon0,dlon,nlon,nodata,data) "
+        "VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+        (dataset, variable, obs_time, *header, encode(arr, header.nodata))
+    )
+
+def _row(conn, dataset, variable, obs_time, cols):
+    if obs_time is None:
+        return conn.execute(
+            f"SELECT {cols} FROM grid_blob WHERE dataset=? AND variable=? ORDER BY obs_time DESC LIMIT 1",
+            (dataset, variable)
+        ).fetchone()
+    return conn.execute(
+        f"SELECT {cols} FROM grid_blob WHERE dataset=? AND variable=? AND obs_time=?",
+        (dataset, variable, obs_time)
+    ).fetchone()
+
+def read_header(conn, dataset, variable, obs_time=None):
+    """(rowid, GridHeader) of the requested (default: latest) grid, or None."""
+    row = _row(conn, dataset, variable, obs_time, "rowid, lat0, dlat, nlat, lon0, dlon, nlon, nodata")
+    return (row[0], GridHeader(*row[1:])) if row else None
+
+def read_grid(conn, dataset, variable, obs_time=None):
+    """(GridHeader, float32 array with NaN for nodata), or None."""
+    row = _row(conn, dataset, variable, obs_time, "lat0, dlat, nlat, lon0, dlon, nlon, nodata, data")
+    if not row:
+        return None
+    h = GridHeader(*row[:7])
+    return h, decode(row[7], h)
+
+def cell_of(header: GridHeader, lat, lon):
+    """Nearest (r, c); columns wrap at the dateline when the grid spans 360°."""
+    r = min(max(int(round((lat - header.lat0) / header.dlat)), 0), header.nlat - 1)
+    lon = ((lon + 180.0) % 360.0) - 180.0
+    c = int(round((lon - header.lon0) / header.dlon))
+    if abs(header.nlon * header.dlon - 360.0) < header.dlon / 2:
+        c %= header.nlon
+    else:
+        c = min(max(c, 0), header.nlon - 1)
+    return r, c
+
+def point_value(conn: sqlite3.Connection, dataset, variable, lat, lon, obs_time=None):
+    """Value of the nearest cell (None for nodata), reading 4 bytes of the blob."""
+    found = read_header(conn, dataset, variable, obs_time)
+    if not found:
+        return None
+    rowid, h = found
+    r, c = cell_of(h, lat, lon)
+    with conn.blobopen("grid_blob", "data", rowid, readonly=True) as blob:
+        blob.seek((r * h.nlon + c) * DTYPE.itemsize)
+        v = float(np.frombuffer(blob.read(DTYPE.itemsize), dtype=DTYPE)[0])
+    return None if v == float(np.float32(h.nodata)) else v
+
+def region(conn: sqlite3.Connection, dataset, variable, south, north, west, east, obs_time=None):
+    """(lats, lons, values) for the cells inside a bbox (no dateline crossing), reading only its rows."""
+    found = read_header(conn, dataset, variable, obs_time)
+    if not found:
+        return None
+    rowid, h = found
+    r0 = max(int(np.ceil((south - h.lat0) / h.dlat)), 0)
+    r1 = min(int(np.floor((north - h.lat0) / h.dlat)), h.nlat - 1)
+    c0 = max(int(np.ceil((west - h.lon0) / h.dlon)), 0)
+    c1 = min(int(np.floor((east - h.lon0) / h.dlon)), h.nlon - 1)
+    if r1 < r0 or c1 < c0:
+        return np.empty(0), np.empty(0), np.empty((0, 0), dtype=np.float32)
+    row_bytes = h.nlon * DTYPE.itemsize
+    with conn.blobopen("grid_blob", "data", rowid, readonly=True) as blob:
+        blob.seek(r0 * row_bytes)
+        rows = np.frombuffer(blob.read((r1 - r0 + 1) * row_bytes), dtype=DTYPE).reshape(-1, h.nlon)
+    sub = rows[:, c0:c1 + 1].astype(np.float32)
+    sub[sub == np.float32(h.nodata)] = np.nan
+    lats = h.lat0 + h.dlat * np.arange(r0, r1 + 1)
+    lons = h.lon0 + h.dlon * np.arange(c0, c1 + 1)
+    return lats, lons, sub
@@ -0,0 +1,99 @@
+# worker/gridindex.py
+# Integer cell addressing for nearest-grid-point lookups (same idea as sst_grid's r/c).
+# - grid_spec: origin/spacing/shape of a regular lat/lon grid, one row per indexed grid
+# - grid_cell: (grid, r, c) -> value, a WITHOUT ROWID table keyed for an index seek
+# The SQLPage endpoints turn a click into (r, c) with round() and read one row,
+# instead of sorting the whole table by squared distance.
+
+import sqlite3
+from itertools import repeat
+import numpy as np
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS grid_spec (
+  name  TEXT    PRIMARY KEY,   -- 'co2_grid' or 'ghg_surface:<variable>'
+  lat0  REAL    NOT NULL,      -- southernmost row (r = 0)
+  dlat  REAL    NOT NULL,
+  nlat  INTEGER NOT NULL,
+  lon0  REAL    NOT NULL,      -- westernmost column (c = 0), in [-180, 180)
+  dlon  REAL    NOT NULL,
+  nlon  INTEGER NOT NULL,
+  wrap  INTEGER NOT NULL       -- 1 if columns span 360° (c wraps at the dateline)
+);
+CREATE TABLE IF NOT EXISTS grid_cell (
+  grid  TEXT    NOT NULL,
+  r     INTEGER NOT NULL,
+  c     INTEGER NOT NULL,
+  lat   REAL    NOT NULL,
+  lon   REAL    NOT NULL,
+  value REAL    NOT NULL,
+  PRIMARY KEY (grid, r, c)
+) WITHOUT ROWID;
+"""
+
+def ensure_schema(conn: sqlite3.Connection):
+    conn.executescript(SCHEMA)
+
+def regular_axis(values):
+    """(start, step, n) if the coordinates sit on a regular axis (gaps allowed), else None."""
+    u = np.unique(np.round(np.asarray(values, dtype=np.float64), 6))
+    if u.size < 2:
+        return None
+    d = np.diff(u)
+    step = float(d.min())
+    k = d / step
+    if not np.allclose(k, np.rint(k), atol=1e-3):
+        return None
+    return float(u[0]), step, int(round((u[-1] - u[0]) / step)) + 1
+
+def index_grid(conn: sqlite3.Connection, name, lats, lons, vals):
+    """
+    Replace the cell index for `name` in one transaction. Irregular grids
+    (e.g. curvilinear) are left unindexed; the endpoints then fall back to
+    their distance scan.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    vals = np.asarray(vals, dtype=np.float64)
+    ok = np.isfinite(vals)
+    lats, lons, vals = lats[ok], lons[ok], vals[ok]
+    ax_lat, ax_lon = regular_axis(lats), regular_axis(lons)
+
+    ensure_schema(conn)
+    with conn:
+        conn.execute("DELETE FROM grid_cell WHERE grid=?", (name,))
+        conn.execute("DELETE FROM grid_spec WHERE name=?", (name,))
+        if ax_lat is None or ax_lon is None:
+            print(f"[index] {name}: not a regular lat/lon grid, left unindexed")
+            return 0
+        lat0, dlat, nlat = ax_lat
+        lon0, dlon, nlon = ax_lon
+        wrap = int(abs(nlon * dlon - 360.0) < dlon / 2)
+        r = np.rint((lats - lat0) / dlat).astype(np.int64)
+        c = np.rint((lons - lon0) / dlon).astype(np.int64)
+        conn.execute(
+            "INSERT INTO grid_spec(name,lat0,dlat,nlat,lon0,dlon,nlon,wrap) VALUES (?,?,?,?,?,?,?,?)",
+            (name, lat0, dlat, nlat, lon0, dlon, nlon, wrap)
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO grid_cell(grid,r,c,lat,lon,value) VALUES (?,?,?,?,?,?)",
+            zip(repeat(name), r.tolist(), c.tolist(), lats.tolist(), lons.tolist(), vals.tolist())
+        )
+    print(f"[index] {name}: {vals.size} cells on {nlat}x{nlon} grid (wrap={wrap})")
+    return int(vals.size)
+
+def index_table(conn: sqlite3.Connection, name, sql, params=()):
+    """Build the index for `name` from (lat, lon, value) rows returned by `sql`."""
+    rows = conn.execute(sql, params).fetchall()
+    if not rows:
+        return 0
+    lats, lons, vals = (np.array(col, dtype=np.float64) for col in zip(*rows))
+    return index_grid(conn, name, lats, lons, vals)
+
+def index_surface(conn: sqlite3.Connection, variable, obs_time, table="ghg_surface"):
+    """Index one ghg_surface snapshot as 'ghg_surface:<variable>'."""
+    return index_table(
+        conn, f"ghg_surface:{variable}",
+        f"SELECT lat, lon, value FROM {table} WHERE variable=? AND obs_time=?",
+        (variable, obs_time)
+    )
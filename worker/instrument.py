@@ -0,0 +1,165 @@
+# worker/instrument.py
+# Per-stage timing / throughput for the loaders and queue workers.
+#   with job("load_local"):
+#       with stage("extract", var="co2") as s:
+#           ...; s.rows(n)
+# - each stage appends one JSON line to $GHG_METRICS_DIR/<job>.jsonl
+#   (seconds, rows, rows/s, peak RSS so far, labels)
+# - when the job ends, ghg_<job>.prom is rewritten atomically in
+#   $GHG_PROM_DIR (default: same dir) for node_exporter's textfile collector
+# - GHG_PROFILE=cpu writes a cProfile .pstats per run; GHG_PROFILE=mem adds
+#   tracemalloc peaks per stage and the top allocation sites per run ("cpu,mem" for both)
+# Stages outside a job() (e.g. in pool workers) are buffered; collect()/merge()
+# carry them back to the parent process.
+
+import contextlib, json, os, pathlib, time
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+METRICS_DIR = pathlib.Path(os.environ.get("GHG_METRICS_DIR", ROOT / "data" / "metrics"))
+PROM_DIR = pathlib.Path(os.environ.get("GHG_PROM_DIR", METRICS_DIR))
+PROFILE = {p.strip() for p in os.environ.get("GHG_PROFILE", "").lower().split(",") if p.strip()}
+
+_records = []     # stage records not yet written
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1)  # KiB on Linux
+
+class Stage:
+    def __init__(self, name, labels):
+        self.name, self.labels, self.n = name, labels, 0
+
+    def rows(self, n):
+        self.n += int(n)
+
+@contextlib.contextmanager
+def stage(name, **labels):
+    """Time one stage; call .rows(n) on the yielded object to count rows/cells/jobs."""
+    s = Stage(name, labels)
+    tm = _tracemalloc()
+    if tm:
+        tm.reset_peak()
+    t0 = time.perf_counter()
+    ok = False
+    try:
+        yield s
+        ok = True
+    finally:
+        secs = time.perf_counter() - t0
+        rec = {
+            "ts": round(time.time(), 3), "stage": name, "seconds": round(secs, 6),
+            "rows": s.n, "rows_per_s": round(s.n / secs, 1) if s.n and secs > 0 else None,
+            "rss_peak_mb": peak_rss_mb(), "ok": ok, **({"labels": labels} if labels else {}),
+        }
+        if tm:
+            rec["py_peak_mb"] = round(tm.get_traced_memory()[1] / 2**20, 1)
+        _records.append(rec)
+
+def _tracemalloc():
+    if "mem" not in PROFILE:
+        return None
+    import tracemalloc
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    return tracemalloc
+
+def collect():
+    """Take the buffered stage records (pool workers return these to the parent)."""
+    out = _records[:]
+    del _records[:]
+    return out
+
+def merge(records):
+    """Add stage records produced in another process to the current job."""
+    _records.extend(records)
+
+@contextlib.contextmanager
+def job(name):
+    """One worker run: flushes stage records as JSON lines and rewrites the .prom file."""
+    prof = None
+    if "cpu" in PROFILE:
+        import cProfile
+        prof = cProfile.Profile()
+        prof.enable()
+    _tracemalloc()
+    t0, ok = time.perf_counter(), False
+    try:
+        yield
+        ok = True
+    finally:
+        secs = time.perf_counter() - t0
+        if prof:
+            prof.disable()
+        try:
+            write_outputs(name, secs, ok, prof)
+        except OSError as e:
+            print(f"[metrics] could not write metrics: {e}")
+
+def _top_allocations(limit=10):
+    tm = _tracemalloc()
+    if not tm:
+        return None
+    stats = tm.take_snapshot().statistics("lineno")[:limit]
+    return [{"where": str(s.traceback), "mb": round(s.size / 2**20, 2), "count": s.count} for s in stats]
+
+def write_outputs(name, secs, ok, prof=None):
+    METRICS_DIR.mkdir(parents=True, exist_ok=True)
+    records = [{**r, "job": name} for r in collect()]
+    stamp = time.strftime("%Y%m%dT%H%M%S")
+    run = {"ts": round(time.time(), 3), "job": name, "stage": "_run", "seconds": round(secs, 6),
+           "rss_peak_mb": peak_rss_mb(), "ok": ok}
+    if prof:
+        run["pstats"] = str(METRICS_DIR / f"{name}-{stamp}.pstats")
+        prof.dump_stats(run["pstats"])
+    top = _top_allocations()
+    if top:
+        run["top_allocations"] = top
+    with open(METRICS_DIR / f"{name}.jsonl", "a") as f:
+        for r in records + [run]:
+            f.write(json.dumps(r, separators=(",", ":")) + "\n")
+    write_prom(name, records, run)
+
+def write_prom(name, records, run):
+    """Prometheus text exposition for the textfile collector (atomic rename)."""
+    agg = {}
+    for r in records:
+        a = agg.setdefault(r["stage"], [0.0, 0, 0])
+        a[0] += r["seconds"]; a[1] += r["rows"]; a[2] += 1
+    lines = [
+        "# HELP ghg_worker_stage_seconds Wall time spent in a stage during the last run.",
+        "# TYPE ghg_worker_stage_seconds gauge",
+    ]
+    lines += [f'ghg_worker_stage_seconds{{job="{name}",stage="{s}"}} {a[0]:.6f}' for s, a in sorted(agg.items())]
+    lines += ["# HELP ghg_worker_stage_rows Rows/cells/jobs handled by a stage during the last run.",
+              "# TYPE ghg_worker_stage_rows gauge"]
+    lines += [f'ghg_worker_stage_rows{{job="{name}",stage="{s}"}} {a[1]}' for s, a in sorted(agg.items())]
+    lines += ["# HELP ghg_worker_stage_calls Times a stage ran during the last run.",
+              "# TYPE ghg_worker_stage_calls gauge"]
+    lines += [f'ghg_worker_stage_calls{{job="{name}",stage="{s}"}} {a[2]}' for s, a in sorted(agg.items())]
+    lines += [
+        "# HELP ghg_worker_run_seconds Wall time of the last run.",
+        "# TYPE ghg_worker_run_seconds gauge",
+        f'ghg_worker_run_seconds{{job="{name}"}} {run["seconds"]:.6f}',
+        "# HELP ghg_worker_run_success 1 if the last run finished without an exception.",
+        "# TYPE ghg_worker_run_success gauge",
+        f'ghg_worker_run_success{{job="{name}"}} {int(run["ok"])}',
+        "# HELP ghg_worker_last_run_timestamp_seconds Unix time the last run ended.",
+        "# TYPE ghg_worker_last_run_timestamp_seconds gauge",
+        f'ghg_worker_last_run_timestamp_seconds{{job="{name}"}} {run["ts"]}',
+    ]
+    if run["rss_peak_mb"] is not None:
+        lines += [
+            "# HELP ghg_worker_peak_rss_bytes Peak resident set size of the last run.",
+            "# TYPE ghg_worker_peak_rss_bytes gauge",
+            f'ghg_worker_peak_rss_bytes{{job="{name}"}} {int(run["rss_peak_mb"] * 2**20)}',
+        ]
+    PROM_DIR.mkdir(parents=True, exist_ok=True)
+    path = PROM_DIR / f"ghg_{name}.prom"
+    tmp = path.with_suffix(".prom.tmp")
+    tmp.write_text("\n".join(lines) + "\n")
+    os.replace(tmp, path)
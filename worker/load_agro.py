@@ -1,22 +1,31 @@
 # worker/load_agro.py
 # Pulls one agroclimatic indicator (e.g., precipitation) and loads into ghg_surface.
 # Requires: cdsapi xarray netCDF4
+# A request already in ingest_manifest isn't retrieved again (--force to re-check);
+# retrievals are kept in the download cache (download.py) under the request hash, so a
+# fresh DB reloads without calling CDS. Changed results only write the cells that
+# differ from the current snapshot. Writes go through one database.Writer (short
+# row/time-bounded transactions; a full snapshot stays invisible until published).
 
-import sqlite3, pathlib, datetime, tempfile
-import xarray as xr
-import cdsapi
+import pathlib, datetime, argparse, json
+from publish import publish_snapshot
+from database import connect, Writer
+from instrument import job, stage
+import download, manifest
 
 DB = pathlib.Path(__file__).resolve().parents[1] / "sqlpage" / "sqlpage.db"
 obs_time = datetime.datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
 
-def upsert(cur, pts, variable):
-    cur.executemany(
+def upsert(writer, pts, variable):
+    writer.executemany(
         "INSERT OR REPLACE INTO ghg_surface(lat,lon,variable,value,obs_time) VALUES (?,?,?,?,?)",
-        [(float(lat), float(lon), variable, float(val), obs_time) for (lat, lon, val) in pts]
+        ((float(lat), float(lon), variable, float(val), obs_time) for (lat, lon, val) in pts)
     )
 
 def main():
-    c = cdsapi.Client()  # uses ~/.cdsapirc (CDS key)
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--force", action="store_true", help="Retrieve even if this request was loaded before")
+    args = ap.parse_args()
     req = {
         "format": "netcdf",
         "variable": ["precipitation"],      # pick an indicator; see dataset docs for full list
@@ -25,29 +34,66 @@ def main():
         "gcm_model": "hadgem2-es",          # one of the CMIP5 models used
         "year": ["2010"],
     }
-    with tempfile.NamedTemporaryFile(suffix=".nc", delete=False) as tf:
-        c.retrieve("sis-agroclimatic-indicators", req, tf.name)
-        ds = xr.open_dataset(tf.name)
+    # CDS results for a fixed request don't change; the request itself is the source key
+    params = json.dumps(req, sort_keys=True)
+    source = "sis-agroclimatic-indicators:" + manifest.sha256_bytes(params.encode())[:16]
+    conn = connect(DB)
+    manifest.ensure_schema(conn)
+    prev = manifest.lookup(conn, source, "precip")
+    if prev and prev["params"] == params and not args.force:
+        print(f"[skip] precip: request already loaded @ {prev['obs_time']}")
+        conn.close()
+        return
+
+    import xarray as xr  # not needed when the request was loaded before
+    art = None if args.force else download.lookup(source)
+    if art is None:
+        import cdsapi
+        c = cdsapi.Client()  # uses ~/.cdsapirc (CDS key)
+        with stage("download"):
+            part = download.partial_path(source, ".nc")
+            c.retrieve("sis-agroclimatic-indicators", req, str(part))
+            art = download.put(source, part, ".nc", url="cds:sis-agroclimatic-indicators")
+    if manifest.unchanged(prev, art.sha256, params):
+        print("[skip] precip: retrieved file unchanged")
+        conn.close()
+        return
+    ds = xr.open_dataset(art.path)
 
     varname = list(ds.data_vars)[0]  # first variable is our indicator
     field = ds[varname]
 
     points = []
     # dataset is 0.5° global grid (NetCDF-4)
-    for lat in field.lat.values[::2]:
-        for lon in field.lon.values[::2]:
-            val = float(field.sel(lat=lat, lon=lon))
-            lon180 = float(((lon + 180) % 360) - 180)
-            points.append((float(lat), lon180, val))
+    with stage("extract") as st:
+        for lat in field.lat.values[::2]:
+            for lon in field.lon.values[::2]:
+                val = float(field.sel(lat=lat, lon=lon))
+                lon180 = float(((lon + 180) % 360) - 180)
+                points.append((float(lat), lon180, val))
+        st.rows(len(points))
 
-    conn = sqlite3.connect(DB); cur = conn.cursor()
+    cur = conn.cursor()
     cur.execute("""CREATE TABLE IF NOT EXISTS ghg_surface(
         lat REAL, lon REAL, variable TEXT, value REAL, obs_time TEXT,
         PRIMARY KEY(lat, lon, variable, obs_time)
     )""")
-    upsert(cur, points, "precip")
-    conn.commit(); conn.close()
-    print(f"Loaded Agroclimatic precip: {len(points)} points @ {obs_time}")
+
+    with stage("write") as st, Writer(DB) as writer:
+        def full_write(pts):
+            upsert(writer, pts, "precip")
+            return obs_time
+
+        written = manifest.write_points(writer, "precip", points, full_write)
+        snapshot = written or manifest.current_obs_time(conn, "precip")
+        writer.call(lambda c: manifest.record(c, source, "precip", art.sha256, params, art.size,
+                                              obs_time=snapshot, n_cells=len(points)))
+        st.rows(len(points))
+    if written:
+        publish_snapshot(conn, "precip", written, source="sis-agroclimatic-indicators")
+    conn.close()
+    print(f"Loaded Agroclimatic precip: {len(points)} points @ {snapshot}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with job("load_agro"):
+        main()
\ No newline at end of file
@@ -1,7 +1,15 @@
 # worker/load_co2_from_nc.py
 # Load a CAMS CO₂ NetCDF into SQLite table: co2_grid(lat, lon, value)
+# --bulk: fills co2_grid_staging and swaps it in atomically (see bulkload.py)
+# --storage blob: one packed float32 grid_blob row instead of a row per cell
+# --stream: reads/reduces/writes in lat-band x time chunks under a --max-mem-mb ceiling
 import argparse, os, sqlite3, math, sys
 from typing import Optional, Tuple
+from bulkload import relax_pragmas, begin_staging, swap_in
+from gridindex import index_table
+from gridblob import from_axes, write_blob, ensure_schema as ensure_blob_schema
+from instrument import job, stage
+from database import connect
 
 def pick(var_names, *candidates):
     lower = {v.lower(): v for v in var_names}
@@ -42,6 +50,125 @@ def ensure_schema(conn: sqlite3.Connection):
     cur.execute("CREATE INDEX IF NOT EXISTS idx_co2_lon ON co2_grid(lon);")
     conn.commit()
 
+def open_target(args):
+    """Connection + table to write: co2_grid itself, or a staging copy with --bulk."""
+    conn = connect(args.db)
+    ensure_schema(conn)
+    if not args.bulk:
+        return conn, "co2_grid"
+    relax_pragmas(conn)
+    return conn, begin_staging(conn, "co2_grid")
+
+def finish_target(conn, table, storage="rows"):
+    if table != "co2_grid":
+        with stage("swap"):
+            swap_in(conn, "co2_grid", table)
+    if storage != "blob":
+        with stage("index"):
+            index_table(conn, "co2_grid", "SELECT lat, lon, value FROM co2_grid WHERE value IS NOT NULL")
+    conn.close()
+
+def store_blob(conn, lat, lon_sorted, arr_sorted):
+    """Write the whole reduced grid as one packed grid_blob row (--storage blob/both)."""
+    import datetime
+    packed = from_axes(lat, lon_sorted, arr_sorted)
+    if packed is None:
+        print("[WARN] co2 grid is not on regular lat/lon axes; no grid_blob written")
+        return
+    obs_time = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0).isoformat().replace("+00:00", "Z")
+    ensure_blob_schema(conn)
+    write_blob(conn, "co2_grid", "co2", obs_time, *packed)
+    conn.commit()
+
+def plan_chunks(n_lat, n_lon, n_time, itemsize, chunk_lat, chunk_time, max_mem_mb):
+    """Shrink (chunk_lat, chunk_time) until one read block fits the memory ceiling."""
+    budget = max_mem_mb * 1024 * 1024
+
+    def cost(cl, ct):
+        # raw block + float64 copy + masked copy + finite mask, plus sum/count/mean per band
+        return cl * n_lon * (ct * (itemsize + 8 + 8 + 1) + 24)
+
+    cl = max(1, min(chunk_lat, n_lat))
+    ct = max(1, min(chunk_time, n_time))
+    while cost(cl, ct) > budget and ct > 1:
+        ct = max(1, ct // 2)
+    while cost(cl, ct) > budget and cl > 1:
+        cl = max(1, cl // 2)
+    if cost(cl, ct) > budget:
+        print(f"--max-mem-mb {max_mem_mb} is too small for a single {n_lon}-point row.")
+        sys.exit(1)
+    return cl, ct
+
+def stream_bands(da, lat_name, lon_name, time_index, chunk_lat, chunk_time):
+    """
+    Yield (i0, band[lat, lon]) one latitude band at a time. Only a
+    chunk_lat x chunk_time slab is ever read; the time mean is accumulated
+    as a running NaN-skipping sum/count, so peak memory doesn't depend on
+    the size of the file.
+    """
+    import numpy as np
+    extra = {d: 0 for d in da.dims if d not in (lat_name, lon_name, "time")}
+    if extra:
+        da = da.isel(extra)  # e.g. level -> surface (first slice)
+    has_time = "time" in da.dims
+    if has_time and time_index is not None:
+        da = da.isel(time=time_index)
+        has_time = False
+    da = da.transpose(*(("time",) if has_time else ()), lat_name, lon_name)
+
+    for i0 in range(0, da.sizes[lat_name], chunk_lat):
+        band = da.isel({lat_name: slice(i0, i0 + chunk_lat)})
+        if not has_time:
+            yield i0, np.asarray(band.values, dtype=np.float64)
+            continue
+        total = count = None
+        for t0 in range(0, band.sizes["time"], chunk_time):
+            block = np.asarray(band.isel(time=slice(t0, t0 + chunk_time)).values, dtype=np.float64)
+            ok = np.isfinite(block)
+            s = np.where(ok, block, 0.0).sum(axis=0)
+            c = ok.sum(axis=0)
+            total = s if total is None else total + s
+            count = c if count is None else count + c
+            del block, ok
+        with np.errstate(invalid="ignore", divide="ignore"):
+            yield i0, np.where(count > 0, total / np.maximum(count, 1), np.nan)
+
+def load_streaming(conn, da, lat_name, lon_name, lat, lon, args, table="co2_grid"):
+    """Reduce and write co2_grid one lat band at a time (--stream)."""
+    import numpy as np
+    if lat_name not in da.dims or lon_name not in da.dims:
+        print("CO₂ variable does not have explicit lat/lon dims. Dims:", list(da.dims))
+        sys.exit(1)
+    n_time = da.sizes.get("time", 1) if args.time_index is None else 1
+    chunk_lat, chunk_time = plan_chunks(lat.size, lon.size, n_time, da.dtype.itemsize,
+                                        args.chunk_lat, args.chunk_time, args.max_mem_mb)
+    print(f"[stream] lat band={chunk_lat} rows, time chunk={chunk_time} steps, ceiling={args.max_mem_mb} MB")
+
+    sort_lon_idx = np.argsort(lon)
+    lon_sorted = lon[sort_lon_idx]
+    cur = conn.cursor()
+    if args.storage != "blob":
+        cur.execute(f"DELETE FROM {table};")  # replace
+    count = 0
+    packed_bands = []  # only the reduced 2D grid (float32) is kept, for --storage blob/both
+    for i0, band in stream_bands(da, lat_name, lon_name, args.time_index, chunk_lat, chunk_time):
+        band = band[:, sort_lon_idx]
+        ok = ~np.isnan(band)
+        count += int(ok.sum())
+        if args.storage != "rows":
+            packed_bands.append(band.astype(np.float32))
+        if args.storage == "blob":
+            continue
+        la, lo = np.meshgrid(lat[i0:i0 + band.shape[0]], lon_sorted, indexing="ij")
+        cur.executemany(
+            f"INSERT OR REPLACE INTO {table}(lat,lon,value) VALUES (?,?,?)",
+            zip(la[ok].astype(float).tolist(), lo[ok].astype(float).tolist(), band[ok].tolist())
+        )
+        conn.commit()
+    if packed_bands:
+        store_blob(conn, lat, lon_sorted, np.vstack(packed_bands))
+    return count
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--nc", required=True, help="Path to CAMS NetCDF")
@@ -50,9 +177,20 @@ def main():
     g = ap.add_mutually_exclusive_group()
     g.add_argument("--time-mean", action="store_true", help="Average across time (default)")
     g.add_argument("--time-index", type=int, help="Use a specific time index (0-based)")
+    ap.add_argument("--stream", action="store_true",
+                    help="Read, reduce and write in lat-band/time chunks (bounded memory)")
+    ap.add_argument("--chunk-lat", type=int, default=64, help="Latitude rows per band (--stream)")
+    ap.add_argument("--chunk-time", type=int, default=8, help="Time steps per read (--stream)")
+    ap.add_argument("--max-mem-mb", type=int, default=256,
+                    help="Peak memory ceiling for one read block; chunks shrink to fit (--stream)")
+    ap.add_argument("--bulk", action="store_true",
+                    help="Load into a staging table and swap it in atomically (no partial reads)")
+    ap.add_argument("--storage", choices=("rows", "blob", "both"), default="rows",
+                    help="co2_grid rows, one packed grid_blob row (gridblob.py), or both")
     args = ap.parse_args()
 
-    ds = open_xarray(args.nc)
+    with stage("open", file=os.path.basename(args.nc)):
+        ds = open_xarray(args.nc)
 
     # Identify coordinates
     lat_name = pick(ds.variables, ("lat","latitude","Latitude"))
@@ -77,44 +215,54 @@ def main():
     da = ds[varname]
     dims = list(da.dims)
 
+    if args.stream:
+        conn, table = open_target(args)
+        with stage("stream", var=varname) as st:
+            count = load_streaming(conn, da, lat_name, lon_name, lat, lon, args, table)
+            st.rows(count)
+        finish_target(conn, table, args.storage)
+        print(f"Loaded {count:,} grid points into {'grid_blob' if args.storage == 'blob' else 'co2_grid'}.")
+        return
+
     # Expect dims like (time, lat, lon) or (lat, lon)
     import numpy as np
-    if "time" in dims:
-        tdim = dims.index("time")
-        # Reorder to (..., lat, lon)
-        if lat_name in dims and lon_name in dims:
-            # move time to front if present
-            if args.time_index is not None:
-                slicer = [slice(None)] * da.ndim
-                slicer[tdim] = args.time_index
-                arr = da[tuple(slicer)].values
+    with stage("reduce", var=varname):
+        if "time" in dims:
+            tdim = dims.index("time")
+            # Reorder to (..., lat, lon)
+            if lat_name in dims and lon_name in dims:
+                # move time to front if present
+                if args.time_index is not None:
+                    slicer = [slice(None)] * da.ndim
+                    slicer[tdim] = args.time_index
+                    arr = da[tuple(slicer)].values
+                else:
+                    # default: mean over time
+                    arr = da.mean(dim="time", keep_attrs=True).values
             else:
-                # default: mean over time
-                arr = da.mean(dim="time", keep_attrs=True).values
-        else:
-            print("CO₂ variable does not have explicit lat/lon dims. Dims:", dims)
-            sys.exit(1)
-    else:
-        arr = da.values
-
-    # Make sure arr aligns as [lat, lon]
-    # Try to find indices of lat and lon in dims
-    # After potential time reduction, dims should be lat/lon in some order
-    post_dims = [d for d in da.dims if d != "time"]
-    if len(post_dims) == 3:
-        # e.g., level, lat, lon -> pick surface level (0)
-        # Try to reduce extra leading dims by taking the first slice
-        while len(arr.shape) > 2:
-            arr = arr[0, ...]
-        post_dims = post_dims[-2:]
-
-    if len(post_dims) != 2:
-        # Fallback: try to reshape if it matches lat/lon sizes
-        if arr.shape[-2:] == (lat.size, lon.size):
-            pass
+                print("CO₂ variable does not have explicit lat/lon dims. Dims:", dims)
+                sys.exit(1)
         else:
-            print("Unexpected CO₂ array shape:", arr.shape, "lat size", lat.size, "lon size", lon.size)
-            sys.exit(1)
+            arr = da.values
+
+        # Make sure arr aligns as [lat, lon]
+        # Try to find indices of lat and lon in dims
+        # After potential time reduction, dims should be lat/lon in some order
+        post_dims = [d for d in da.dims if d != "time"]
+        if len(post_dims) == 3:
+            # e.g., level, lat, lon -> pick surface level (0)
+            # Try to reduce extra leading dims by taking the first slice
+            while len(arr.shape) > 2:
+                arr = arr[0, ...]
+            post_dims = post_dims[-2:]
+
+        if len(post_dims) != 2:
+            # Fallback: try to reshape if it matches lat/lon sizes
+            if arr.shape[-2:] == (lat.size, lon.size):
+                pass
+            else:
+                print("Unexpected CO₂ array shape:", arr.shape, "lat size", lat.size, "lon size", lon.size)
+                sys.exit(1)
 
     # If longitudes are not strictly increasing, sort them together with data
     sort_lon_idx = np.argsort(lon)
@@ -122,34 +270,43 @@ def main():
     arr_sorted = arr[:, sort_lon_idx] if arr.ndim == 2 else arr
 
     # Write to SQLite
-    conn = sqlite3.connect(args.db)
-    ensure_schema(conn)
+    conn, table = open_target(args)
+    if args.storage != "rows":
+        with stage("write", table="grid_blob"):
+            store_blob(conn, lat, lon_sorted, arr_sorted)
+    if args.storage == "blob":
+        finish_target(conn, table, args.storage)
+        print(f"Loaded {int(np.isfinite(arr_sorted).sum()):,} grid points into grid_blob.")
+        return
     cur = conn.cursor()
-    cur.execute("DELETE FROM co2_grid;")  # replace
-    BATCH = 10000
-    batch = []
-    count = 0
+    with stage("write", table=table) as st:
+        cur.execute(f"DELETE FROM {table};")  # replace
+        BATCH = 10000
+        batch = []
+        count = 0
 
-    for i in range(lat.size):
-        row_vals = arr_sorted[i, :]
-        for j in range(lon_sorted.size):
-            v = row_vals[j]
-            if np.isnan(v):
-                continue
-            batch.append((float(lat[i]), float(lon_sorted[j]), float(v)))
-            if len(batch) >= BATCH:
-                cur.executemany("INSERT OR REPLACE INTO co2_grid(lat,lon,value) VALUES (?,?,?)", batch)
-                conn.commit()
-                count += len(batch)
-                batch.clear()
-
-    if batch:
-        cur.executemany("INSERT OR REPLACE INTO co2_grid(lat,lon,value) VALUES (?,?,?)", batch)
-        conn.commit()
-        count += len(batch)
+        for i in range(lat.size):
+            row_vals = arr_sorted[i, :]
+            for j in range(lon_sorted.size):
+                v = row_vals[j]
+                if np.isnan(v):
+                    continue
+                batch.append((float(lat[i]), float(lon_sorted[j]), float(v)))
+                if len(batch) >= BATCH:
+                    cur.executemany(f"INSERT OR REPLACE INTO {table}(lat,lon,value) VALUES (?,?,?)", batch)
+                    conn.commit()
+                    count += len(batch)
+                    batch.clear()
 
-    conn.close()
+        if batch:
+            cur.executemany(f"INSERT OR REPLACE INTO {table}(lat,lon,value) VALUES (?,?,?)", batch)
+            conn.commit()
+            count += len(batch)
+        st.rows(count)
+
+    finish_target(conn, table, args.storage)
     print(f"Loaded {count:,} grid points into co2_grid.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with job("load_cams"):
+        main()
\ No newline at end of file
@@ -3,25 +3,46 @@
 # - Detects lat/lon (1D or 2D)
 # - Picks a real data variable (not bounds)
 # - Skips NaN/Inf values so NOT NULL doesn't fail
+# - Extracts the whole (strided) grid with NumPy, so --stride 1 full-res loads are practical
+# - --parallel: every matching file/variable across a process pool, one writer
+# - --storage blob: one packed float32 grid_blob row per variable instead of a row per cell
+# - --bulk: writes the new snapshot to a staging table and merges it in atomically
+# - inputs whose content hash and load parameters match ingest_manifest are skipped;
+#   changed ones only write the cells that differ from the current snapshot, in
+#   place (--full: new snapshot)
+# - every write goes through one database.Writer: a new snapshot is committed in
+#   short row/time-bounded transactions (invisible until publish_snapshot()
+#   catalogues it), so queue workers can write and SQLPage can read meanwhile
 
-import sqlite3, pathlib, datetime
+import argparse, pathlib, datetime
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 import xarray as xr
 import numpy as np
+from bulkload import relax_pragmas, begin_staging, merge_in
+from publish import publish_snapshot
+from gridblob import from_points, write_blob, ensure_schema as ensure_blob_schema
+from instrument import job, stage, collect, merge
+from database import connect, Writer
+import manifest
 
 ROOT = pathlib.Path(__file__).resolve().parents[1]
 DB = ROOT / "sqlpage" / "sqlpage.db"
 DATA = ROOT / "data"
 OBS_TIME = datetime.datetime.now(datetime.UTC).replace(microsecond=0).isoformat().replace("+00:00","Z")
+SOURCES = {}  # variable -> file names loaded this run (recorded in surface_snapshot)
+WRITTEN = {}  # variable -> obs_time of the snapshot written this run (to publish)
+PENDING = []  # manifest rows, recorded once the data is committed
 
 # ---------------- DB helpers ----------------
-def upsert(cur, pts, variable):
+def upsert(cur, pts, variable, table="ghg_surface"):
     cur.executemany(
-        "INSERT OR REPLACE INTO ghg_surface(lat,lon,variable,value,obs_time) VALUES (?,?,?,?,?)",
+        f"INSERT OR REPLACE INTO {table}(lat,lon,variable,value,obs_time) VALUES (?,?,?,?,?)",
         pts
     )
 
 def lon_to_180(lon):
-    return float(((float(lon) + 180.0) % 360.0) - 180.0)
+    return ((np.asarray(lon, dtype=np.float64) + 180.0) % 360.0) - 180.0
 
 # ---------------- NetCDF helpers ----------------
 def open_ds(path):
@@ -118,98 +139,363 @@ def pick_data_var(ds: xr.Dataset, lat_name: str, lon_name: str, prefer_tokens=()
             return name
     raise RuntimeError("No suitable numeric 2D data variable found.")
 
-def subsample_points(field: xr.DataArray, lat_var: xr.DataArray, lon_var: xr.DataArray,
-                    lat_name: str, lon_name: str,
-                    y_stride=4, x_stride=4, lat_stride=4, lon_stride=4):
-    pts = []
+def _first_index(field: xr.DataArray, keep):
+    """Take index 0 along any dim not in `keep` (e.g. a level dim)."""
+    extra = {d: 0 for d in field.dims if d not in keep}
+    return field.isel(extra) if extra else field
+
+def grid_rows(field: xr.DataArray, lat_var: xr.DataArray, lon_var: xr.DataArray,
+            y_stride=4, x_stride=4, lat_stride=4, lon_stride=4):
+    """
+    Vectorized extraction: slice lat/lon/value arrays once, drop non-finite
+    cells and return flat float64 arrays (lats, lons in [-180,180), values).
+    """
     # 2D curvilinear grid
     if lat_var.ndim == 2 and lon_var.ndim == 2 and lat_var.dims == lon_var.dims:
         y_name, x_name = lat_var.dims
-        y_idx = np.arange(0, lat_var.sizes[y_name], y_stride)
-        x_idx = np.arange(0, lon_var.sizes[x_name], x_stride)
-        for i in y_idx:
-            for j in x_idx:
-                lat = float(lat_var.isel({y_name: i, x_name: j}).values)
-                lon = float(lon_var.isel({y_name: i, x_name: j}).values)
-                val = float(field.isel({y_name: i, x_name: j}).values)
-                if np.isfinite(val):
-                    pts.append((lat, lon_to_180(lon), "coerce_me", val))  # placeholder, fixed below
-        return pts
+        sl = {y_name: slice(None, None, y_stride), x_name: slice(None, None, x_stride)}
+        lats = np.asarray(lat_var.isel(sl).values, dtype=np.float64)
+        lons = np.asarray(lon_var.isel(sl).values, dtype=np.float64)
+        sub = _first_index(field, (y_name, x_name)).isel(sl).transpose(y_name, x_name)
     # 1D lat/lon
-    lats = lat_var.values[::lat_stride]
-    lons = lon_var.values[::lon_stride]
-    for lat in lats:
-        for lon in lons:
-            v = field.sel({lat_name: float(lat), lon_name: float(lon)}, method="nearest")
-            val = float(v.values)
-            if np.isfinite(val):
-                pts.append((float(lat), lon_to_180(lon), "coerce_me", val))
-    return pts
+    else:
+        y_name, x_name = lat_var.dims[0], lon_var.dims[0]
+        sl = {y_name: slice(None, None, lat_stride), x_name: slice(None, None, lon_stride)}
+        lats, lons = np.meshgrid(
+            np.asarray(lat_var.values[::lat_stride], dtype=np.float64),
+            np.asarray(lon_var.values[::lon_stride], dtype=np.float64),
+            indexing="ij",
+        )
+        sub = _first_index(field, (y_name, x_name)).isel(sl).transpose(y_name, x_name)
+
+    vals = np.asarray(sub.values, dtype=np.float64)
+    ok = np.isfinite(vals) & np.isfinite(lats) & np.isfinite(lons)
+    return lats[ok], lon_to_180(lons[ok]), vals[ok]
 
 # -------------- dataset-specific loaders --------------
-def load_any_local(cur, pattern_glob: str, prefer_tokens, var_label: str,
-                stride_xy=(4,4), stride_ll=(4,4)):
+# label -> (file glob under data/, preferred var-name tokens, default stride)
+DATASETS = {
+    # If your CAMS files don’t contain 'co2' token, this still picks the best numeric 2D var
+    "co2": ("CAMS global greenhouse gas forecasts *.nc",
+            ("co2","carbon_dioxide","co2_concentration"), 4),
+    "precip": ("Agroclimatic indicators from 1951 to 2099*.nc",
+               ("precip","pr","rain","gsl","growing_season_length"), 2),
+}
+
+def extract_file(path, prefer_tokens, stride_xy=(4,4), stride_ll=(4,4), data_name=None):
+    """Open one file and return (data_name, lats, lons, vals) for its finite cells."""
+    with stage("open", file=path.name):
+        ds = open_ds(path)
+    try:
+        with stage("pick", file=path.name):
+            lat_name, lon_name = pick_lat_lon_vars(ds)
+            if data_name is None:
+                data_name = pick_data_var(ds, lat_name, lon_name, prefer_tokens=prefer_tokens)
+            elif data_name not in ds.data_vars:
+                raise KeyError(f"no variable '{data_name}'")
+            field = squeeze_time(ds[data_name])
+
+        print(f"[load] file='{path.name}' var='{data_name}' dims={field.dims} lat='{lat_name}' lon='{lon_name}'")
+
+        with stage("extract", file=path.name, var=data_name) as st:
+            lats, lons, vals = grid_rows(
+                field, ds[lat_name], ds[lon_name],
+                y_stride=stride_xy[0], x_stride=stride_xy[1],
+                lat_stride=stride_ll[0], lon_stride=stride_ll[1]
+            )
+            st.rows(vals.size)
+    finally:
+        ds.close()
+    return data_name, lats, lons, vals
+
+def write_arrays(writer, lats, lons, vals, var_label, table="ghg_surface", storage="rows", obs_time=None):
+    obs_time = obs_time or OBS_TIME
+    if storage in ("rows", "both"):
+        with stage("write", var=var_label, storage="rows") as st:
+            # rows in DB shape, built straight from the arrays; queued, committed in chunks
+            rows = zip(lats.tolist(), lons.tolist(), repeat(var_label), vals.tolist(), repeat(obs_time))
+            upsert(writer, rows, var_label, table)
+            st.rows(vals.size)
+        WRITTEN[var_label] = obs_time
+    if storage in ("blob", "both"):
+        with stage("write", var=var_label, storage="blob") as st:
+            packed = from_points(lats, lons, vals)
+            if packed is None:
+                print(f"[WARN] {var_label}: not a regular lat/lon grid, no grid_blob written")
+            else:
+                writer.call(write_blob, "ghg_surface", var_label, obs_time, *packed)
+                st.rows(vals.size)
+
+def write_delta(conn, writer, lats, lons, vals, var_label, table="ghg_surface", storage="rows"):
+    """
+    Write only the cells that differ from the current snapshot of var_label, in
+    place (it is republished afterwards); falls back to a full snapshot when
+    there is none. Returns the obs_time of the snapshot that now holds the
+    cells. The delta edits the live snapshot, so it is applied as one writer
+    transaction.
+    """
+    lats, lons, vals = manifest.dedupe_last(lats, lons, vals)
+    if storage == "blob" or manifest.current_obs_time(conn, var_label) is None:
+        write_arrays(writer, lats, lons, vals, var_label, table, storage)
+        return OBS_TIME
+    with stage("delta", var=var_label) as st:
+        obs_time, changed, added, removed = writer.call(
+            manifest.apply_delta, var_label, lats, lons, vals, table).result()
+        st.rows(changed + added + removed)
+    print(f"[delta] {var_label} @ {obs_time}: {changed} changed, {added} added, {removed} removed of {vals.size}")
+    if not (changed or added or removed):
+        return obs_time
+    WRITTEN[var_label] = obs_time
+    if storage == "both":
+        write_arrays(writer, lats, lons, vals, var_label, table, "blob", obs_time)
+    return obs_time
+
+def check_manifest(conn, path, var_label, params, full=False):
+    """(skip?, manifest row to record once written) for one input file."""
+    prev = manifest.lookup(conn, path.name, var_label)
+    digest, size, mtime_ns = manifest.file_digest(path, prev)
+    entry = dict(source=path.name, variable=var_label, digest=digest, params=params, size=size, mtime_ns=mtime_ns)
+    return not full and manifest.unchanged(prev, digest, params), entry
+
+def record_pending(conn):
+    with conn:
+        for m in PENDING:
+            manifest.record(conn, **m)
+    del PENDING[:]
+
+def load_any_local(conn, writer, pattern_glob: str, prefer_tokens, var_label: str,
+                stride_xy=(4,4), stride_ll=(4,4), table="ghg_surface", storage="rows", full=False):
     files = sorted(DATA.glob(pattern_glob))
     if not files:
         print(f"[WARN] No files match: {pattern_glob}")
         return 0
-    ds = open_ds(files[-1])
-    lat_name, lon_name = pick_lat_lon_vars(ds)
-    data_name = pick_data_var(ds, lat_name, lon_name, prefer_tokens=prefer_tokens)
-    field = squeeze_time(ds[data_name])
-
-    print(f"[load] file='{files[-1].name}' var='{data_name}' dims={field.dims} lat='{lat_name}' lon='{lon_name}'")
-
-    pts = subsample_points(
-        field, ds[lat_name], ds[lon_name], lat_name, lon_name,
-        y_stride=stride_xy[0], x_stride=stride_xy[1],
-        lat_stride=stride_ll[0], lon_stride=stride_ll[1]
-    )
-    # filter out any accidental non-finite values (extra safety)
-    clean = [(lat, lon, var_label, val) for (lat, lon, _, val) in pts if np.isfinite(val)]
-    if not clean:
+    params = f"stride={stride_xy}/{stride_ll};storage={storage}"
+    with stage("hash", file=files[-1].name):
+        skip, entry = check_manifest(conn, files[-1], var_label, params, full)
+    if skip:
+        print(f"[skip] {var_label}: {files[-1].name} unchanged")
+        return 0
+    _, lats, lons, vals = extract_file(files[-1], prefer_tokens, stride_xy, stride_ll)
+    if not vals.size:
         print(f"[WARN] No finite values found for {var_label} in {files[-1].name}")
         return 0
 
-    # prepare tuples in DB shape
-    rows = [(lat, lon, var_label, val, OBS_TIME) for (lat, lon, _, val) in clean]
-    upsert(cur, rows, var_label)
-    print(f"Loaded {var_label} points: {len(rows)}")
-    return len(rows)
+    if full:
+        write_arrays(writer, lats, lons, vals, var_label, table, storage)
+        obs_time = OBS_TIME
+    else:
+        obs_time = write_delta(conn, writer, lats, lons, vals, var_label, table, storage)
+    PENDING.append(dict(entry, obs_time=obs_time, n_cells=int(vals.size)))
+    SOURCES.setdefault(var_label, set()).add(files[-1].name)
+    print(f"Loaded {var_label} points: {vals.size}")
+    return int(vals.size)
 
-def load_cams_local(cur):
-    # If your CAMS files don’t contain 'co2' token, this still picks the best numeric 2D var
-    return load_any_local(cur, "CAMS global greenhouse gas forecasts *.nc",
-                        prefer_tokens=("co2","carbon_dioxide","co2_concentration"),
-                        var_label="co2",
-                        stride_xy=(4,4), stride_ll=(4,4))
+def load_cams_local(conn, writer, stride=DATASETS["co2"][2], table="ghg_surface", storage="rows", full=False):
+    pattern, tokens, _ = DATASETS["co2"]
+    return load_any_local(conn, writer, pattern, prefer_tokens=tokens, var_label="co2",
+                        stride_xy=(stride,stride), stride_ll=(stride,stride),
+                        table=table, storage=storage, full=full)
+
+def load_agro_local(conn, writer, stride=DATASETS["precip"][2], table="ghg_surface", storage="rows", full=False):
+    pattern, tokens, _ = DATASETS["precip"]
+    return load_any_local(conn, writer, pattern, prefer_tokens=tokens, var_label="precip",
+                        stride_xy=(stride,stride), stride_ll=(stride,stride),
+                        table=table, storage=storage, full=full)
+
+# -------------- parallel driver --------------
+def _extract_job(job):
+    """Process-pool worker: extract arrays for one (file, variable); never touches the DB."""
+    path, prefer_tokens, stride, data_name, label = job
+    try:
+        _, lats, lons, vals = extract_file(path, prefer_tokens, (stride,stride), (stride,stride),
+                                        data_name=data_name)
+    except Exception as e:
+        return label, path, None, str(e), collect()
+    return label, path, (lats, lons, vals), None, collect()
+
+def resolve_vars(names):
+    """
+    {DATASETS label: data variable or None (auto-pick)} for --vars entries: a
+    label ("precip"), a variable named by one of its tokens ("pr"), or
+    "label=variable" for any other variable of that dataset. Raises ValueError
+    on an unknown name or on two entries for the same label.
+    """
+    picked = {}
+    for name in names:
+        label, sep, var = name.partition("=")
+        label = label.lower()
+        if sep:
+            if label not in DATASETS:
+                raise ValueError(f"unknown dataset '{label}' in '{name}' (have: {', '.join(DATASETS)})")
+        elif label in DATASETS:
+            var = None
+        else:
+            owners = [l for l, (_, tokens, _) in DATASETS.items() if label in tokens]
+            if not owners:
+                raise ValueError(f"unknown variable '{name}': use a dataset ({', '.join(DATASETS)}) "
+                                 f"or dataset=variable")
+            label, var = owners[0], name
+        if label in picked:
+            raise ValueError(f"--vars names dataset '{label}' twice; each loads into one snapshot")
+        picked[label] = var or None
+    return picked
+
+def plan_jobs(variables=None, stride=None):
+    """
+    Every matching file of every requested dataset ({label: data variable or
+    None}, see resolve_vars(); default: all datasets, variable auto-picked).
+    """
+    jobs = []
+    for label, (pattern, tokens, default_stride) in DATASETS.items():
+        if variables and label not in variables:
+            continue
+        files = sorted(DATA.glob(pattern))
+        if not files:
+            print(f"[WARN] No files match: {pattern}")
+        for f in files:
+            jobs.append((f, tokens, stride or default_stride, (variables or {}).get(label), label))
+    return jobs
 
-def load_agro_local(cur):
-    return load_any_local(cur, "Agroclimatic indicators from 1951 to 2099*.nc",
-                        prefer_tokens=("precip","pr","rain","gsl","growing_season_length"),
-                        var_label="precip",
-                        stride_xy=(2,2), stride_ll=(2,2))
+def skip_unchanged(conn, jobs, storage="rows", full=False):
+    """
+    Drop the jobs of every variable whose inputs all match the manifest; the
+    rest are returned with the manifest row to record for each.
+    """
+    by_label = {}
+    for j in jobs:
+        path, _, stride, var, label = j
+        params = f"stride={stride};var={var or ''};storage={storage}"
+        with stage("hash", file=path.name):
+            skip, entry = check_manifest(conn, path, label, params, full)
+        by_label.setdefault(label, []).append((j, skip, entry))
+    keep = []
+    for label, items in by_label.items():
+        if all(skip for _, skip, _ in items):
+            print(f"[skip] {label}: {len(items)} input(s) unchanged")
+            continue
+        keep += [(j, entry) for j, _, entry in items]
+    return keep
+
+def load_parallel(conn, writer, workers=None, variables=None, stride=None, table="ghg_surface", storage="rows", full=False):
+    """
+    Fan files/variables out to a process pool; this process is the single
+    writer. Each variable's arrays are gathered in plan order and written once
+    its last input has arrived, so later files still win on INSERT OR REPLACE
+    (as with the sequential loaders) and a grid_blob covers every file, not
+    just the last one. With `full` they become a new snapshot; otherwise they
+    are diffed against the current snapshot, and a variable with a failed
+    input is left as it is (a partial set of cells would delete the missing
+    file's cells).
+    """
+    planned = skip_unchanged(conn, plan_jobs(variables, stride), storage, full)
+    jobs = [j for j, _ in planned]
+    remaining = {}
+    for j in jobs:
+        remaining[j[4]] = remaining.get(j[4], 0) + 1
+    gathered, failed, targets = {}, set(), {}
+    total = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for (label, path, arrays, err, timings), (_, entry) in zip(pool.map(_extract_job, jobs), planned):
+            merge(timings)
+            remaining[label] -= 1
+            if err:
+                print(f"[WARN] {label} from {path.name} skipped: {err}")
+                failed.add(label)
+            else:
+                vals = arrays[2]
+                gathered.setdefault(label, []).append(arrays)
+                PENDING.append(dict(entry, n_cells=int(vals.size)))
+                SOURCES.setdefault(label, set()).add(path.name)
+                total += int(vals.size)
+                print(f"Loaded {label} points from {path.name}: {vals.size}")
+            if remaining[label] or label not in gathered:
+                continue
+            cells = [np.concatenate(c) for c in zip(*gathered.pop(label))]
+            if full:
+                write_arrays(writer, *manifest.dedupe_last(*cells), label, table, storage)
+                targets[label] = OBS_TIME
+            elif label in failed:
+                print(f"[WARN] {label}: not updated, an input failed")
+            else:
+                targets[label] = write_delta(conn, writer, *cells, label, table, storage)
+    PENDING[:] = [dict(m, obs_time=targets[m["variable"]]) for m in PENDING if m["variable"] in targets]
+    return total
 
 # ---------------- main ----------------
 def main():
-    conn = sqlite3.connect(DB)
-    cur = conn.cursor()
-    cur.execute("""
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--stride", type=int, default=None,
+                    help="Grid stride for every dataset (1 = full resolution; default: per-dataset)")
+    ap.add_argument("--parallel", action="store_true",
+                    help="Ingest every matching file/variable with a process pool")
+    ap.add_argument("--workers", type=int, default=None, help="Pool size (--parallel; default: CPU count)")
+    ap.add_argument("--vars", default="",
+                    help="Comma-separated datasets / data variables to load, e.g. co2,pr or precip=gsl "
+                         "(--parallel; default: every dataset, variable auto-picked)")
+    ap.add_argument("--bulk", action="store_true",
+                    help="Load into a staging table and merge it into ghg_surface in one transaction")
+    ap.add_argument("--storage", choices=("rows", "blob", "both"), default="rows",
+                    help="ghg_surface rows, packed grid_blob rows (gridblob.py), or both")
+    ap.add_argument("--full", action="store_true",
+                    help="Reload every input as a new snapshot, ignoring the manifest (implied by --bulk)")
+    ap.add_argument("--txn-rows", type=int, default=50_000,
+                    help="Commit the writer's transaction after this many rows")
+    ap.add_argument("--txn-seconds", type=float, default=0.5,
+                    help="... or once it is this many seconds old")
+    args = ap.parse_args()
+    try:
+        variables = resolve_vars(v.strip() for v in args.vars.split(",") if v.strip())
+    except ValueError as e:
+        ap.error(str(e))
+    full = args.full or args.bulk
+    kw = {} if args.stride is None else {"stride": args.stride}
+    kw["storage"] = args.storage
+    kw["full"] = full
+
+    conn = connect(DB)
+    conn.execute("""
     CREATE TABLE IF NOT EXISTS ghg_surface(
     lat REAL, lon REAL, variable TEXT, value REAL, obs_time TEXT,
     PRIMARY KEY(lat, lon, variable, obs_time)
     )
     """)
+    ensure_blob_schema(conn)
+    manifest.ensure_schema(conn)
+    conn.commit()
+    table = "ghg_surface"
+    if args.bulk:
+        relax_pragmas(conn)
+        table = begin_staging(conn, "ghg_surface")  # just this run's snapshots; older ones stay live
+
+    writer = Writer(DB, rows=args.txn_rows, seconds=args.txn_seconds,
+                    setup=relax_pragmas if args.bulk else None)
     try:
-        load_cams_local(cur)
-    except Exception as e:
-        print(f"[WARN] CAMS load failed: {e}")
-    try:
-        load_agro_local(cur)
-    except Exception as e:
-        print(f"[WARN] Agro load failed: {e}")
-    conn.commit(); conn.close()
-    print(f"Done @ {OBS_TIME}")
+        if args.parallel:
+            n = load_parallel(conn, writer, workers=args.workers, variables=variables, stride=args.stride,
+                            table=table, storage=args.storage, full=full)
+            print(f"Loaded {n} points.")
+        else:
+            try:
+                load_cams_local(conn, writer, table=table, **kw)
+            except Exception as e:
+                print(f"[WARN] CAMS load failed: {e}")
+            try:
+                load_agro_local(conn, writer, table=table, **kw)
+            except Exception as e:
+                print(f"[WARN] Agro load failed: {e}")
+    finally:
+        with stage("commit"):
+            writer.close()  # raises the writer's error, if any
+    print(f"[db] {writer.written} writes in {writer.commits} transactions")
+    if args.bulk:
+        with stage("swap"):
+            merge_in(conn, "ghg_surface", table)
+    record_pending(conn)
+    for variable, obs_time in sorted(WRITTEN.items()):
+        publish_snapshot(conn, variable, obs_time, source=",".join(sorted(SOURCES.get(variable, ()))))
+    conn.close()
+    print(f"Done @ {OBS_TIME}" if WRITTEN else "Done: nothing changed")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with job("load_local"):
+        main()
\ No newline at end of file
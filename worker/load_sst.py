@@ -1,5 +1,13 @@
 #!/usr/bin/env python3
-import os, csv, sqlite3, glob, sys
+# Loads the 1° SST climatology into sst_grid (and/or grid_blob).
+# Default: parses data/sst_climate_1d_1971-2000-MM.asc directly into NumPy, one
+# month per process, one transaction per month. --csv loads asc_to_csv.py output instead.
+import os, re, csv, glob, sys, argparse
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import numpy as np
+from instrument import job, stage, collect, merge
+from database import connect
 
 # repo-root/sqlpage/sqlpage.db
 DB_PATH = os.path.join(os.path.dirname(__file__), '..', 'sqlpage', 'sqlpage.db')
@@ -19,7 +27,78 @@ def ensure_table(conn):
       ON sst_grid(kind, period, r, c);
     """)
 
-def load_csv(conn, csv_path):
+# 1° grid: r 0..179 (0 = 90N), c 0..359 (0 = 180W); cell centres at .5
+SST_HEADER = dict(lat0=-89.5, dlat=1.0, nlat=180, lon0=-179.5, dlon=1.0, nlon=360)
+SST_SENTINELS = (-888.8, -999.9)  # land / missing
+ASC_PATTERN = re.compile(r'sst_climate_1d_1971-2000-(\d{2})\.asc$', re.IGNORECASE)
+
+def parse_asc(path):
+    """(period, 180x360 float64 array as written, r = 0 at 90N, land/missing mask)."""
+    m = ASC_PATTERN.search(os.path.basename(path))
+    if not m:
+        raise ValueError(f"Unrecognized SST filename (expect climatology MM): {path}")
+    with open(path) as f:
+        lines = [ln for ln in f.read().splitlines() if len(ln.split()) == 360]  # skip non-data lines
+    arr = np.fromstring(" ".join(lines), dtype=np.float64, sep=" ").reshape(-1, 360)
+    if arr.shape[0] != 180:
+        raise ValueError(f"{path}: expected 180 rows of 360 values, got {arr.shape[0]}")
+    return m.group(1), arr, np.isin(arr, SST_SENTINELS)
+
+def _parse_job(path):
+    """Process-pool worker: parse one month; never touches the DB."""
+    try:
+        with stage("parse", file=os.path.basename(path)) as st:
+            parsed = parse_asc(path)
+            st.rows(parsed[1].size)
+        return path, parsed, None, collect()
+    except Exception as e:
+        return path, None, str(e), collect()
+
+def write_month(conn, period, arr, sentinel, storage="rows", kind="clim"):
+    """Replace one month in a single transaction."""
+    with conn:
+        if storage in ("rows", "both"):
+            # sst_grid keeps the sentinels as-is (see 005_sst.sql)
+            conn.execute("DELETE FROM sst_grid WHERE kind=? AND period=?", (kind, period))
+            r, c = np.indices(arr.shape)
+            conn.executemany(
+                "INSERT INTO sst_grid(kind, period, r, c, sst) VALUES (?, ?, ?, ?, ?)",
+                zip(repeat(kind), repeat(period), r.ravel().tolist(), c.ravel().tolist(), arr.ravel().tolist())
+            )
+        if storage in ("blob", "both"):
+            from gridblob import GridHeader, NODATA, write_blob
+            grid = np.where(sentinel, np.nan, arr)[::-1]  # flip to south-up
+            write_blob(conn, "sst", kind, period, GridHeader(nodata=NODATA, **SST_HEADER), grid)
+
+def load_asc(conn, paths, storage="rows", workers=None):
+    """Parse months in parallel; this process writes each one as it arrives."""
+    total = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for path, parsed, err, timings in pool.map(_parse_job, paths):
+            merge(timings)
+            if err:
+                print(f"[WARN] {os.path.basename(path)} skipped: {err}")
+                continue
+            period, arr, sentinel = parsed
+            with stage("write", period=period, storage=storage) as st:
+                write_month(conn, period, arr, sentinel, storage)
+                st.rows(arr.size)
+            total += arr.size
+            print(f"Loaded {os.path.basename(path)}: {arr.size} cells ({int(sentinel.sum())} land/missing)")
+    return total
+
+def store_blob(conn, rows):
+    """One packed grid_blob row per (kind, period); sentinels become nodata."""
+    from gridblob import GridHeader, NODATA, write_blob
+    grids = {}
+    for kind, period, r, c, sst in rows:
+        arr = grids.setdefault((kind, period), np.full((180, 360), np.nan, dtype=np.float32))
+        if sst not in SST_SENTINELS:
+            arr[179 - r, c] = sst  # flip to south-up
+    for (kind, period), arr in grids.items():
+        write_blob(conn, "sst", kind, period, GridHeader(nodata=NODATA, **SST_HEADER), arr)
+
+def load_csv(conn, csv_path, storage="rows"):
     print("Loading", csv_path)
     with open(csv_path, newline='') as f:
         rdr = csv.reader(f)
@@ -29,27 +108,45 @@ def load_csv(conn, csv_path):
                 continue
             kind, period, r, c, sst = row
             rows.append((kind, period, int(r), int(c), float(sst)))
-        conn.executemany(
-            "INSERT INTO sst_grid(kind, period, r, c, sst) VALUES (?, ?, ?, ?, ?)",
-            rows
-        )
+        if storage in ("rows", "both"):
+            conn.executemany(
+                "INSERT INTO sst_grid(kind, period, r, c, sst) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+        if storage in ("blob", "both"):
+            store_blob(conn, rows)
     print("Inserted", len(rows), "rows")
 
 def main():
-    csvs = sorted(glob.glob(os.path.join(DATA_DIR, "sst_climate_1d_1971-2000-*.csv")))
-    if not csvs:
-        print("No CSVs found in", DATA_DIR)
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--storage", choices=("rows", "blob", "both"), default="rows",
+                    help="sst_grid rows, packed grid_blob rows (gridblob.py), or both")
+    ap.add_argument("--csv", action="store_true", help="Load asc_to_csv.py CSVs instead of the .asc grids")
+    ap.add_argument("--workers", type=int, default=None, help="Parse processes (default: CPU count)")
+    args = ap.parse_args()
+    pattern = "sst_climate_1d_1971-2000-*." + ("csv" if args.csv else "asc")
+    paths = sorted(glob.glob(os.path.join(DATA_DIR, pattern)))
+    if not paths:
+        print(f"No {pattern} found in", DATA_DIR)
         sys.exit(2)
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     try:
         ensure_table(conn)
-        conn.executescript("DELETE FROM sst_grid WHERE kind='clim' AND period IN ('01','04','07','10');")
-        for p in csvs:
-            load_csv(conn, p)
-        conn.commit()
+        if args.storage != "rows":
+            from gridblob import ensure_schema
+            ensure_schema(conn)
+        if args.csv:
+            conn.executescript("DELETE FROM sst_grid WHERE kind='clim' AND period IN ('01','04','07','10');")
+            for p in paths:
+                with stage("load_csv", file=os.path.basename(p)):
+                    load_csv(conn, p, args.storage)
+            conn.commit()
+        else:
+            load_asc(conn, paths, args.storage, args.workers)
     finally:
         conn.close()
     print("Done. DB:", DB_PATH)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with job("load_sst"):
+        main()
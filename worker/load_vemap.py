@@ -2,9 +2,17 @@
 # Downloads the VEMAP-2 annual ecosystem results bundle from ORNL DAAC (Earthdata login),
 # reads a variable (e.g., NPP) from NetCDF/ASCII, and loads into ghg_surface.
 # Requires: requests xarray netCDF4
+# The bundle is streamed into the download cache (download.py) once; later runs reuse
+# it without touching the network (--refresh revalidates with ETag / Last-Modified).
+# Only the .nc member that's used is extracted. An unchanged bundle (same sha256 in
+# ingest_manifest) is skipped; otherwise only changed cells are written, through one
+# database.Writer (short row/time-bounded transactions).
 
-import os, sqlite3, pathlib, zipfile, tempfile, datetime, requests
-import xarray as xr
+import os, pathlib, datetime, argparse, requests
+from publish import publish_snapshot
+from database import connect, Writer
+from instrument import job, stage
+import download, manifest
 
 DB = pathlib.Path(__file__).resolve().parents[1] / "sqlpage" / "sqlpage.db"
 # Earthdata credentials from environment or .netrc:
@@ -18,28 +26,36 @@ def earthdata_session():
         s.auth = (ED_USER, ED_PASS)
     return s
 
-def upsert_points(cur, pts, variable, obs_time):
-    cur.executemany(
+def upsert_points(writer, pts, variable, obs_time):
+    writer.executemany(
         "INSERT OR REPLACE INTO ghg_surface(lat,lon,variable,value,obs_time) VALUES (?,?,?,?,?)",
-        [(float(lat), float(lon), variable, float(val), obs_time) for (lat, lon, val) in pts]
+        ((float(lat), float(lon), variable, float(val), obs_time) for (lat, lon, val) in pts)
     )
 
 def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--force", action="store_true", help="Download and reload even if the bundle is unchanged")
+    ap.add_argument("--refresh", action="store_true",
+                    help="Ask the server whether the cached bundle is still current (conditional GET)")
+    args = ap.parse_args()
     obs_time = datetime.datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
-    s = earthdata_session()
-    with tempfile.NamedTemporaryFile(suffix=".zip", delete=False) as tf:
-        r = s.get(VEMAP_ZIP, allow_redirects=True)
-        r.raise_for_status()
-        tf.write(r.content)
-        zpath = tf.name
+    conn = connect(DB)
+    manifest.ensure_schema(conn)
+    prev = None if args.force else manifest.lookup(conn, VEMAP_ZIP, "npp")
 
-    # Extract and try to locate a NetCDF (or ASCII) with annual ecosystem variable (e.g., NPP)
+    with stage("download"):
+        art = download.fetch(VEMAP_ZIP, session=earthdata_session(), revalidate=args.refresh, force=args.force)
+    if manifest.unchanged(prev, art.sha256):
+        print("[skip] npp: bundle unchanged")
+        conn.close()
+        return
+
+    # Locate a NetCDF with an annual ecosystem variable (e.g., NPP); members are extracted one at a time
+    import xarray as xr  # not needed when the bundle is unchanged
     points = []
-    with zipfile.ZipFile(zpath) as z:
-        z.extractall(pathlib.Path(zpath).parent)
-        for name in z.namelist():
-            if name.lower().endswith((".nc", ".nc4")):
-                ds = xr.open_dataset(pathlib.Path(zpath).parent / name)
+    with stage("extract") as st:
+        for path in download.members(art, lambda name: name.lower().endswith((".nc", ".nc4"))):
+            with xr.open_dataset(path) as ds:
                 # guess a variable like NPP; adjust to the exact VEMAP variable name in your bundle
                 var = None
                 for v in ds.data_vars:
@@ -56,16 +72,31 @@ def main():
                         val = float(var.sel(lat=lat, lon=lon, method="nearest"))
                         lon180 = float(((float(lon) + 180) % 360) - 180)
                         points.append((float(lat), lon180, val))
-                break  # one variable is enough for now
+            break  # one variable is enough for now
+        st.rows(len(points))
 
-    conn = sqlite3.connect(DB); cur = conn.cursor()
+    cur = conn.cursor()
     cur.execute("""CREATE TABLE IF NOT EXISTS ghg_surface(
         lat REAL, lon REAL, variable TEXT, value REAL, obs_time TEXT,
         PRIMARY KEY(lat, lon, variable, obs_time)
     )""")
-    upsert_points(cur, points, "npp", obs_time)
-    conn.commit(); conn.close()
-    print(f"Loaded VEMAP-2 NPP: {len(points)} points @ {obs_time}")
+
+    with stage("write") as st, Writer(DB) as writer:
+        def full_write(pts):
+            upsert_points(writer, pts, "npp", obs_time)
+            return obs_time
+
+        written = manifest.write_points(writer, "npp", points, full_write)
+        snapshot = written or manifest.current_obs_time(conn, "npp")
+        writer.call(lambda c: manifest.record(c, VEMAP_ZIP, "npp", art.sha256, size=art.size,
+                                              etag=art.etag, last_modified=art.last_modified,
+                                              obs_time=snapshot, n_cells=len(points)))
+        st.rows(len(points))
+    if written:
+        publish_snapshot(conn, "npp", written, source=pathlib.Path(VEMAP_ZIP).name)
+    conn.close()
+    print(f"Loaded VEMAP-2 NPP: {len(points)} points @ {snapshot}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with job("load_vemap"):
+        main()
\ No newline at end of file
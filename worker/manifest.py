@@ -0,0 +1,151 @@
+# worker/manifest.py
+# Ingestion manifest + delta writes for the ghg_surface loaders.
+# - ingest_manifest remembers, per (source, variable), the sha256 of the input
+#   (plus the load parameters and HTTP validators); an unchanged input is skipped
+#   before it is opened, re-downloaded or written
+# - apply_delta() diffs freshly extracted cells against the variable's current
+#   snapshot (numpy, no per-cell Python loop) and writes only the changed / new /
+#   vanished cells in place, in one transaction, instead of INSERT OR REPLACE-ing
+#   the whole grid as a new snapshot; the loader then republishes that snapshot
+
+import hashlib, os, sqlite3
+import numpy as np
+from catalog import current_snapshots
+from scenario_engine import patch_baseline
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingest_manifest (
+  source      TEXT     NOT NULL,      -- file name, URL or request key
+  variable    TEXT     NOT NULL,      -- ghg_surface variable it feeds
+  sha256      TEXT     NOT NULL,
+  params      TEXT     NOT NULL DEFAULT '',   -- stride / data var etc.; a change forces a reload
+  size        INTEGER,
+  mtime_ns    INTEGER,
+  etag        TEXT,                   -- HTTP validators for downloaded sources
+  last_modified TEXT,
+  obs_time    TEXT,                   -- snapshot the input was last written to
+  n_cells     INTEGER,
+  loaded_at   DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (source, variable)
+);
+"""
+
+def ensure_schema(conn: sqlite3.Connection):
+    conn.executescript(SCHEMA)
+
+def lookup(conn: sqlite3.Connection, source, variable):
+    """Manifest row for (source, variable) as a dict, or None."""
+    cur = conn.execute("SELECT * FROM ingest_manifest WHERE source=? AND variable=?", (source, variable))
+    row = cur.fetchone()
+    return dict(zip([d[0] for d in cur.description], row)) if row else None
+
+def sha256_bytes(data: bytes):
+    return hashlib.sha256(data).hexdigest()
+
+def file_digest(path, prev=None, chunk=1 << 20):
+    """
+    (sha256, size, mtime_ns) of a file. When size and mtime match the manifest
+    row `prev` the stored hash is reused instead of reading the file again.
+    """
+    st = os.stat(path)
+    if prev and prev["size"] == st.st_size and prev["mtime_ns"] == st.st_mtime_ns:
+        return prev["sha256"], st.st_size, st.st_mtime_ns
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest(), st.st_size, st.st_mtime_ns
+
+def unchanged(prev, digest, params=""):
+    return bool(prev) and prev["sha256"] == digest and prev["params"] == params
+
+def record(conn: sqlite3.Connection, source, variable, digest, params="", size=None, mtime_ns=None,
+           etag=None, last_modified=None, obs_time=None, n_cells=None):
+    """Insert/replace the manifest row (doesn't commit)."""
+    conn.execute("""
+        INSERT OR REPLACE INTO ingest_manifest
+          (source, variable, sha256, params, size, mtime_ns, etag, last_modified, obs_time, n_cells)
+        VALUES (?,?,?,?,?,?,?,?,?,?)
+    """, (source, variable, digest, params, size, mtime_ns, etag, last_modified, obs_time, n_cells))
+
+def current_obs_time(conn: sqlite3.Connection, variable):
+    return dict(current_snapshots(conn)).get(variable)
+
+def dedupe_last(lats, lons, vals):
+    """Keep the last value per (lat, lon), as successive INSERT OR REPLACEs would."""
+    key = np.stack([lats, lons], axis=1)
+    _, first_rev = np.unique(key[::-1], axis=0, return_index=True)
+    keep = np.sort(len(vals) - 1 - first_rev)
+    return lats[keep], lons[keep], vals[keep]
+
+def diff_cells(old, lats, lons, vals):
+    """
+    Boolean masks (changed, added) over the new cells and (removed) over `old`
+    = (lats, lons, values) of the stored snapshot; (lat, lon) pairs are matched
+    exactly through a sorted complex key.
+    """
+    olats, olons, ovals = old
+    okey = olats + 1j * olons
+    order = np.argsort(okey, kind="stable")
+    sorted_key = okey[order]
+    key = lats + 1j * lons
+    if not sorted_key.size:
+        return np.zeros(key.size, bool), np.ones(key.size, bool), np.zeros(0, bool)
+    pos = np.minimum(np.searchsorted(sorted_key, key), sorted_key.size - 1)
+    hit = sorted_key[pos] == key
+    idx = order[pos[hit]]
+    changed = np.zeros(key.size, bool)
+    changed[hit] = ovals[idx] != vals[hit]
+    removed = np.ones(okey.size, bool)
+    removed[idx] = False
+    return changed, ~hit, removed
+
+def apply_delta(conn: sqlite3.Connection, variable, lats, lons, vals, table="ghg_surface"):
+    """
+    Bring the current snapshot of `variable` in line with the extracted cells,
+    writing only the changed / new / vanished cells in place (doesn't commit;
+    apply it as one transaction, e.g. a Writer.call, and republish the snapshot
+    afterwards). Returns (obs_time, changed, added, removed), or None when
+    there's no current snapshot to diff against (the caller writes a full one).
+    """
+    obs_time = current_obs_time(conn, variable)
+    if obs_time is None:
+        return None
+    rows = conn.execute(f"SELECT lat, lon, value FROM {table} WHERE variable=? AND obs_time=?",
+                        (variable, obs_time)).fetchall()
+    old = np.array(rows, dtype=np.float64).reshape(-1, 3).T  # NULL values -> nan (always "changed")
+    changed, added, removed = diff_cells(old, lats, lons, vals)
+    n_changed, n_added, n_removed = int(changed.sum()), int(added.sum()), int(removed.sum())
+    conn.executemany(
+        f"UPDATE {table} SET value=? WHERE variable=? AND obs_time=? AND lat=? AND lon=?",
+        ((v, variable, obs_time, la, lo) for la, lo, v in
+         zip(lats[changed].tolist(), lons[changed].tolist(), vals[changed].tolist())))
+    conn.executemany(
+        f"INSERT INTO {table}(lat,lon,variable,value,obs_time) VALUES (?,?,?,?,?)",
+        ((la, lo, variable, v, obs_time) for la, lo, v in
+         zip(lats[added].tolist(), lons[added].tolist(), vals[added].tolist())))
+    conn.executemany(
+        f"DELETE FROM {table} WHERE variable=? AND obs_time=? AND lat=? AND lon=?",
+        ((variable, obs_time, la, lo) for la, lo in zip(old[0][removed].tolist(), old[1][removed].tolist())))
+    if n_changed or n_added or n_removed:
+        patch_baseline(conn, variable, obs_time,
+                       zip(vals[changed].tolist(), lats[changed].tolist(), lons[changed].tolist()),
+                       restructured=bool(n_added or n_removed))
+    return obs_time, n_changed, n_added, n_removed
+
+def write_points(writer, variable, points, full_write):
+    """
+    [(lat, lon, value)] from a downloaded source, written through database.Writer
+    `writer`: the changed cells of the current snapshot, in place (one writer
+    transaction), or full_write(points) -> obs_time when there is none. Returns
+    the obs_time to (re)publish, or None when no cell changed.
+    """
+    if not points:
+        return None  # an empty extract never wipes the current snapshot
+    lats, lons, vals = dedupe_last(*(np.array(c, dtype=np.float64) for c in zip(*points)))
+    res = writer.call(apply_delta, variable, lats, lons, vals).result()
+    if res is None:
+        return full_write(points)
+    obs_time, changed, added, removed = res
+    print(f"[delta] {variable} @ {obs_time}: {changed} changed, {added} added, {removed} removed of {vals.size}")
+    return obs_time if changed or added or removed else None
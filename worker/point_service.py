@@ -0,0 +1,283 @@
+# worker/point_service.py
+# Resident point-query service for the map (value_at.sql / scenario_value_at.sql
+# without a SQLite query per click):
+# - loads co2_grid, the current ghg_surface snapshots and scenario_surface into
+#   NumPy arrays once; a lookup is index arithmetic on a regular grid (masked cells
+#   pre-filled from their nearest valid cell), a KD-tree query otherwise
+# - GET  /value?variable=co2&lat=..&lon=..          -> {"baseline": v, "scenario": v}
+#   POST /values {"variable": "co2", "points": [[lat, lon], ...]}
+#                                                   -> {"baseline": [...], "scenario": [...]}
+#   GET  /health                                    -> loaded layers
+# - requests arriving in the same event-loop turn (or --window ms) are coalesced
+#   into one vectorized lookup per layer
+# - PRAGMA data_version is polled; when the published snapshots, factories or
+#   co2_grid change, the arrays are rebuilt in a thread and swapped in
+# Set GHG_POINT_SERVICE=http://127.0.0.1:8081 for SQLPage so the map uses it.
+#   python worker/point_service.py [--port 8081]
+
+import argparse, asyncio, json, sqlite3, pathlib, time
+from urllib.parse import urlsplit, parse_qs
+import numpy as np
+from gridblob import from_points
+from database import connect
+
+DB = pathlib.Path(__file__).resolve().parents[1] / "sqlpage" / "sqlpage.db"
+
+# ---------------- layers ----------------
+class Layer:
+    """Nearest-cell lookups on one grid (same cell rule as gridblob.cell_of)."""
+    def __init__(self, lats, lons, vals):
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = ((np.asarray(lons, dtype=np.float64) + 180.0) % 360.0) - 180.0
+        vals = np.asarray(vals, dtype=np.float64)
+        self.size = int(vals.size)
+        packed = from_points(lats, lons, vals)
+        self.tree = None
+        if packed is not None and packed[0].nlat * packed[0].nlon <= 4 * vals.size:
+            self.h, arr = packed
+            self.wrap = abs(self.h.nlon * self.h.dlon - 360.0) < self.h.dlon / 2
+            self.arr = _fill_nearest(np.asarray(arr, dtype=np.float64))
+        else:
+            from scipy.spatial import cKDTree
+            self.tree, self.vals = cKDTree(_unit(lats, lons)), vals
+
+    def lookup(self, lats, lons):
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = ((np.asarray(lons, dtype=np.float64) + 180.0) % 360.0) - 180.0
+        if self.tree is not None:
+            return self.vals[self.tree.query(_unit(lats, lons))[1]]
+        h = self.h
+        r = np.clip(np.rint((lats - h.lat0) / h.dlat), 0, h.nlat - 1).astype(np.int64)
+        c = np.rint((lons - h.lon0) / h.dlon).astype(np.int64)
+        c = c % h.nlon if self.wrap else np.clip(c, 0, h.nlon - 1)
+        return self.arr[r, c]
+
+def _unit(lat, lon):
+    la, lo = np.radians(lat), np.radians(lon)
+    return np.stack([np.cos(la) * np.cos(lo), np.cos(la) * np.sin(lo), np.sin(la)], axis=-1)
+
+def _fill_nearest(arr):
+    """Masked cells take their nearest valid cell, like the endpoints' fallback scan."""
+    bad = ~np.isfinite(arr)
+    if not bad.any() or bad.all():
+        return arr
+    from scipy.ndimage import distance_transform_edt
+    idx = distance_transform_edt(bad, return_distances=False, return_indices=True)
+    return arr[tuple(idx)]
+
+def _has_table(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,)).fetchone()
+
+def _layer(rows):
+    if not rows:
+        return None
+    return Layer(*(np.array(c, dtype=np.float64) for c in zip(*rows)))
+
+def signature(conn: sqlite3.Connection):
+    """Cheap fingerprint of everything the layers come from."""
+    parts = []
+    if _has_table(conn, "surface_snapshot"):
+        parts.append(conn.execute(
+            "SELECT group_concat(variable || '@' || obs_time || '@' || loaded_at, ';') "
+            "FROM surface_snapshot WHERE is_current = 1").fetchone())
+    if _has_table(conn, "scenario_contrib"):
+        parts.append(conn.execute(
+            "SELECT COUNT(*), total(marker_id * 7 + lat * 31 + lon * 17 + strength) FROM scenario_contrib").fetchone())
+    if _has_table(conn, "co2_grid"):
+        parts.append(conn.execute("SELECT COUNT(*), total(value) FROM co2_grid").fetchone())
+    return repr(parts)
+
+def load_layers(db):
+    """({name: Layer}, signature) read in one snapshot of the DB."""
+    conn = connect(db, readonly=True)
+    try:
+        conn.execute("BEGIN")  # one consistent read across all layers
+        layers = {}
+        if _has_table(conn, "co2_grid"):
+            layers["co2_grid"] = _layer(conn.execute(
+                "SELECT lat, lon, value FROM co2_grid WHERE value IS NOT NULL").fetchall())
+        if _has_table(conn, "surface_snapshot"):
+            for variable, obs_time in conn.execute(
+                    "SELECT variable, obs_time FROM surface_snapshot WHERE is_current = 1").fetchall():
+                layers[f"baseline:{variable}"] = _layer(conn.execute(
+                    "SELECT lat, lon, value FROM ghg_surface WHERE variable=? AND obs_time=? AND value IS NOT NULL",
+                    (variable, obs_time)).fetchall())
+        if _has_table(conn, "scenario_surface"):
+            for (variable,) in conn.execute("SELECT DISTINCT variable FROM scenario_surface").fetchall():
+                layers[f"scenario:{variable}"] = _layer(conn.execute(
+                    "SELECT lat, lon, baseline + delta FROM scenario_surface WHERE variable=?", (variable,)).fetchall())
+        sig = signature(conn)
+    finally:
+        conn.rollback()  # the connection is reused by the next reload
+    return {k: v for k, v in layers.items() if v is not None}, sig
+
+def layers_for(layers, variable):
+    """(baseline layer, scenario layer) for a variable; co2 reads co2_grid like value_at.sql."""
+    base = layers.get("co2_grid") if variable == "co2" and "co2_grid" in layers else layers.get(f"baseline:{variable}")
+    return base, layers.get(f"scenario:{variable}", base)  # scenario mirrors baseline until one exists
+
+# ---------------- batching ----------------
+class Coalescer:
+    """Queues point queries and answers everything pending with one lookup per (variable)."""
+    def __init__(self, service, window=0.0):
+        self.service, self.window = service, window
+        self.pending, self.scheduled = [], False
+        self.batches = self.points = 0
+
+    async def query(self, variable, lats, lons):
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self.pending.append((variable, lats, lons, fut))
+        if not self.scheduled:
+            self.scheduled = True
+            if self.window:
+                loop.call_later(self.window, self.flush)
+            else:
+                loop.call_soon(self.flush)  # after every request already parsed this turn
+        return await fut
+
+    def flush(self):
+        pending, self.pending, self.scheduled = self.pending, [], False
+        by_var = {}
+        for item in pending:
+            by_var.setdefault(item[0], []).append(item)
+        layers = self.service.layers
+        for variable, items in by_var.items():
+            sizes = [len(i[1]) for i in items]
+            lats = np.concatenate([i[1] for i in items])
+            lons = np.concatenate([i[2] for i in items])
+            base, scen = layers_for(layers, variable)
+            try:
+                b = base.lookup(lats, lons) if base else np.full(lats.size, np.nan)
+                s = scen.lookup(lats, lons) if scen else np.full(lats.size, np.nan)
+            except Exception as e:
+                for *_, fut in items:
+                    fut.done() or fut.set_exception(e)
+                continue
+            ends = np.cumsum(sizes)
+            for (*_, fut), hi, n in zip(items, ends, sizes):
+                if not fut.done():
+                    fut.set_result((b[hi - n:hi], s[hi - n:hi]))
+            self.batches += 1
+            self.points += int(lats.size)
+
+def _json_values(a):
+    return [None if not np.isfinite(v) else round(float(v), 6) for v in a]
+
+# ---------------- service ----------------
+class PointService:
+    def __init__(self, db, poll=1.0, window=0.0):
+        self.db, self.poll = str(db), poll
+        self.layers, self.sig, self.loaded_at = {}, None, None
+        self.coalescer = Coalescer(self, window)
+
+    def reload(self):
+        t0 = time.perf_counter()
+        layers, sig = load_layers(self.db)
+        self.layers, self.sig, self.loaded_at = layers, sig, time.time()  # swap; lookups see old or new
+        print(f"[points] loaded {len(layers)} layers ({sum(l.size for l in layers.values())} cells) "
+              f"in {time.perf_counter() - t0:.2f}s")
+
+    async def watch(self):
+        """Reload when another connection commits and the source fingerprint changed."""
+        conn = connect(self.db, readonly=True, check_same_thread=False)
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        while True:
+            await asyncio.sleep(self.poll)
+            v = conn.execute("PRAGMA data_version").fetchone()[0]
+            if v == version:
+                continue
+            version = v
+            try:
+                if await asyncio.to_thread(signature, conn) != self.sig:  # co2_grid probe scans a table
+                    await asyncio.to_thread(self.reload)
+            except sqlite3.Error as e:
+                print(f"[points] reload skipped: {e}")
+
+    async def handle(self, method, target, body):
+        url = urlsplit(target)
+        if method == "GET" and url.path == "/value":
+            q = {k: v[0] for k, v in parse_qs(url.query).items()}
+            try:
+                lat, lon = float(q["lat"]), float(q["lon"])
+            except (KeyError, ValueError):
+                return 400, {"error": "lat and lon are required numbers"}
+            b, s = await self.coalescer.query(q.get("variable", "co2"), np.array([lat]), np.array([lon]))
+            return 200, {"baseline": _json_values(b)[0], "scenario": _json_values(s)[0]}
+        if method == "POST" and url.path == "/values":
+            try:
+                req = json.loads(body or b"{}")
+                if "points" in req:
+                    pts = np.asarray(req["points"], dtype=np.float64).reshape(-1, 2)
+                    lats, lons = pts[:, 0], pts[:, 1]
+                else:
+                    lats = np.asarray(req["lat"], dtype=np.float64).ravel()
+                    lons = np.asarray(req["lon"], dtype=np.float64).ravel()
+                if lats.size != lons.size:
+                    raise ValueError("lat/lon length mismatch")
+            except (ValueError, KeyError, TypeError) as e:
+                return 400, {"error": f"bad request body: {e}"}
+            b, s = await self.coalescer.query(req.get("variable", "co2"), lats, lons)
+            return 200, {"baseline": _json_values(b), "scenario": _json_values(s)}
+        if method == "GET" and url.path == "/health":
+            return 200, {"layers": {k: v.size for k, v in self.layers.items()}, "loaded_at": self.loaded_at,
+                         "batches": self.coalescer.batches, "points": self.coalescer.points}
+        return 404, {"error": "not found"}
+
+    async def serve_conn(self, reader, writer):
+        """Minimal HTTP/1.1 with keep-alive; CORS open so the map page can call it from SQLPage's origin."""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method, target, _ = line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while (h := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    k, _, v = h.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0) or 0))
+                if method == "OPTIONS":
+                    status, payload = 204, None
+                else:
+                    status, payload = await self.handle(method, target, body)
+                data = b"" if payload is None else json.dumps(payload, separators=(",", ":")).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}\r\n"
+                    "Content-Type: application/json\r\n"
+                    "Access-Control-Allow-Origin: *\r\n"
+                    "Access-Control-Allow-Methods: GET, POST, OPTIONS\r\n"
+                    "Access-Control-Allow-Headers: Content-Type\r\n"
+                    f"Content-Length: {len(data)}\r\n\r\n".encode() + data)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+async def serve(args):
+    svc = PointService(args.db, args.poll, args.window / 1000.0)
+    svc.reload()
+    server = await asyncio.start_server(svc.serve_conn, args.host, args.port)
+    print(f"[points] serving on http://{args.host}:{args.port}")
+    async with server:
+        await asyncio.gather(server.serve_forever(), svc.watch())
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db", default=str(DB))
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8081)
+    ap.add_argument("--poll", type=float, default=1.0, help="Seconds between data_version checks")
+    ap.add_argument("--window", type=float, default=0.0,
+                    help="Extra ms to wait for more requests before a lookup (0 = same event-loop turn)")
+    args = ap.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -1,59 +1,66 @@
 # worker/process_queue.py
 # Processes ghg_fetch_queue and writes ghg_observation records per marker.
-# Replace fetch_cams_at() with your real CAMS/NASA lookup.
+# Each batch of pending markers is sampled from every loaded layer in one pass
+# (enrich.py): the CAMS file if one is in data/, the current ghg_surface
+# snapshots and the SST climatology; one transaction per batch.
+# Jobs are leased, completed and failed through queue_daemon.py (claim/complete/
+# fail), so this runs safely next to the daemon; a failing batch backs off and
+# eventually dead-letters instead of blocking the jobs behind it.
 
-import sqlite3, time, datetime, random, pathlib, sys
+import argparse, pathlib, sys
 
-DB = pathlib.Path(__file__).resolve().parents[1] / "sqlpage" / "sqlpage.db"
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))  # fetch_ghg.py lives at the repo root
+import fetch_ghg
+import queue_daemon
+from enrich import Profile
+from instrument import job, stage
+from database import connect
 
-def fetch_cams_at(lat, lon):
-    """
-    TODO: Replace with real CAMS retrieval (e.g., from local NetCDF or API).
-    Return dict: variable -> (value, unit).
-    """
-    # Demo: CO2-ish baseline with tiny perturbation
-    co2 = 410.0 + ((lat % 1.0) * 5) + ((lon % 1.0) * 5) + random.uniform(-0.5, 0.5)
-    return {"co2": (co2, "ppm")}
+DB = ROOT / "sqlpage" / "sqlpage.db"
 
 def main():
-    conn = sqlite3.connect(str(DB))
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db", default=str(DB))
+    ap.add_argument("--batch", type=int, default=500, help="Jobs per transaction")
+    args = ap.parse_args()
+
+    conn = connect(args.db, isolation_level=None)  # claim/complete/fail manage their transactions
+    queue_daemon.check_schema(conn)
+    worker_id = queue_daemon.worker_name()
+    with stage("layers"):
+        nc_path = fetch_ghg.pick_existing_nc()
+        profile = Profile(fetch_ghg.open_sampler(nc_path) if nc_path else None)
+        profile.refresh(conn)
+    if not (profile.cams or profile.surface or profile.sst):
+        print("No CAMS file, surface snapshot or SST loaded; leaving jobs queued", file=sys.stderr)
+        conn.close()
+        return
 
     while True:
-        cur.execute("""
-            SELECT id, marker_id, lat, lon
-            FROM ghg_fetch_queue
-            WHERE processed_at IS NULL
-            ORDER BY enqueued_at ASC
-            LIMIT 1
-        """)
-        row = cur.fetchone()
-        if not row:
-            break  # nothing to do
-
-        qid = row["id"]; marker_id = row["marker_id"]
-        lat = float(row["lat"]); lon = float(row["lon"])
+        with stage("claim") as st:
+            jobs = queue_daemon.claim(conn, worker_id, args.batch)
+            st.rows(len(jobs))
+        if not jobs:
+            break  # nothing visible: done, leased elsewhere, backing off or dead
 
+        _, marker_ids, lats, lons, _ = zip(*jobs)
         try:
-            measures = fetch_cams_at(lat, lon)
-            obs_time = datetime.datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
-
-            for variable, (value, unit) in measures.items():
-                cur.execute("""
-                    INSERT INTO ghg_observation (marker_id, obs_time, variable, value, unit)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (marker_id, obs_time, variable, float(value), unit))
-
-            cur.execute("UPDATE ghg_fetch_queue SET processed_at = ? WHERE id = ?", (obs_time, qid))
-            conn.commit()
-            print(f"Processed marker {marker_id} at ({lat:.4f},{lon:.4f})")
+            with stage("sample") as st:
+                obs_time, rows = profile(marker_ids, [float(v) for v in lats], [float(v) for v in lons])
+                st.rows(len(jobs))
+            with stage("write") as st:
+                n = queue_daemon.complete(conn, worker_id, jobs, obs_time, rows)
+                st.rows(n)
+            print(f"Processed {n}/{len(jobs)} markers: {len(rows)} observations @ {obs_time}")
         except Exception as e:
-            conn.rollback()
-            print("Error processing job", qid, e, file=sys.stderr)
-            # leave job unprocessed for retry
+            with stage("fail") as st:
+                queue_daemon.fail(conn, worker_id, jobs, str(e))  # retried later, dead-lettered after MAX_ATTEMPTS
+                st.rows(len(jobs))
+            print(f"Error processing {len(jobs)} jobs: {e}", file=sys.stderr)
 
     conn.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with job("process_queue"):
+        main()
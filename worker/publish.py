@@ -0,0 +1,17 @@
+# worker/publish.py
+# Post-load hook: refresh everything derived from a freshly loaded ghg_surface snapshot.
+# Loaders call publish_snapshot() once per (variable, obs_time) after committing.
+
+import sqlite3
+from catalog import register_snapshot
+from gridindex import index_surface
+from tile_pyramid import build_pyramid
+from instrument import stage
+
+def publish_snapshot(conn: sqlite3.Connection, variable, obs_time, source=None):
+    with stage("catalog", var=variable):
+        register_snapshot(conn, variable, obs_time, source)  # surface_snapshot / is_current
+    with stage("index", var=variable):
+        index_surface(conn, variable, obs_time)   # nearest-cell lookups (marker_popup.sql)
+    with stage("tiles", var=variable) as st:
+        st.rows(build_pyramid(conn, variable, obs_time))   # overlay tiles (baseline_tile.sql)
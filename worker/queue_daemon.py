@@ -0,0 +1,203 @@
+# worker/queue_daemon.py
+# Resident ghg_fetch_queue worker (replaces cron-launched fetch_ghg.py / process.queue.py).
+# - keeps the CAMS cube open (memory-mapped cache, see cams_cache.py), reopening it
+#   only when the file changes
+# - samples the other loaded layers (current ghg_surface snapshots, SST) in the
+#   same pass (enrich.py); they stay in memory and reload when a loader publishes
+# - claims jobs in batches under a lease (claimed_by/lease_until); a crashed
+#   worker's jobs become visible again when the lease runs out, so several
+#   daemons can share one SQLite file
+# - failed jobs retry with exponential backoff, then move to dead-letter (dead_at)
+# - idles on PRAGMA data_version, so a marker committed by SQLPage is picked up
+#   within one poll interval (default 0.1 s)
+# - refreshes scenario_surface (scenario_engine.refresh) when a marker or factory
+#   edit flagged it or a new snapshot was published (--no-scenario: leave it to cron)
+#   python worker/queue_daemon.py [--batch 500] [--lease 60] [--max-attempts 5]
+
+import argparse, os, signal, socket, sys, time, pathlib
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))  # fetch_ghg.py lives at the repo root
+import fetch_ghg
+from enrich import Profile
+import scenario_engine
+from instrument import job, stage, collect
+from database import connect
+
+DB = ROOT / "sqlpage" / "sqlpage.db"
+LEASE_S = 60          # lease / visibility timeout
+MAX_ATTEMPTS = 5      # attempts before a job is dead-lettered
+BACKOFF_S = 2.0       # first retry delay (doubles per attempt)
+
+# columns added by migration 010_queue_leases.sql; SQLPage owns them (an ALTER from
+# here would make that migration fail with "duplicate column name")
+LEASE_COLUMNS = ("claimed_by", "lease_until", "attempts", "next_attempt_at", "last_error", "dead_at")
+
+def check_schema(conn):
+    """Exit unless SQLPage has applied 010_queue_leases.sql to this DB."""
+    have = {r[1] for r in conn.execute("PRAGMA table_info(ghg_fetch_queue)")}
+    missing = [c for c in LEASE_COLUMNS if c not in have]
+    if missing:
+        sys.exit(f"[daemon] ghg_fetch_queue lacks {', '.join(missing)}: "
+                 "run SQLPage migrations first (sqlpage/migrations/010_queue_leases.sql)")
+
+def worker_name():
+    """claimed_by of this process's leases."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def claim(conn, worker_id, batch, lease_s=LEASE_S):
+    """Atomically lease up to `batch` visible jobs to this worker (batch -1: all of them)."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        jobs = conn.execute("""
+            UPDATE ghg_fetch_queue
+            SET claimed_by = ?, lease_until = datetime('now', ?), attempts = attempts + 1
+            WHERE id IN (
+                SELECT id FROM ghg_fetch_queue
+                WHERE processed_at IS NULL AND dead_at IS NULL
+                  AND (lease_until IS NULL OR lease_until <= datetime('now'))
+                  AND (next_attempt_at IS NULL OR next_attempt_at <= datetime('now'))
+                ORDER BY enqueued_at
+                LIMIT ?
+            )
+            RETURNING id, marker_id, lat, lon, attempts
+        """, (worker_id, f"+{int(lease_s)} seconds", batch)).fetchall()
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return jobs
+
+def complete(conn, worker_id, jobs, obs_time, rows):
+    """Mark still-leased jobs done and insert their observations in one transaction."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        done = set()
+        for jid, marker_id, *_ in jobs:
+            cur = conn.execute(
+                "UPDATE ghg_fetch_queue SET processed_at = CURRENT_TIMESTAMP, lease_until = NULL, last_error = NULL "
+                "WHERE id = ? AND claimed_by = ? AND processed_at IS NULL",
+                (jid, worker_id)
+            )
+            if cur.rowcount:  # lease lost or job re-enqueued by a marker move: skip its rows
+                done.add(marker_id)
+        conn.executemany(
+            "INSERT INTO ghg_observation (marker_id, obs_time, variable, value, unit) VALUES (?,?,?,?,?)",
+            [r for r in rows if r[0] in done]
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return len(done)
+
+def fail(conn, worker_id, jobs, err, max_attempts=MAX_ATTEMPTS, backoff_s=BACKOFF_S):
+    """Release the lease with exponential backoff; dead-letter after max_attempts."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for jid, _, _, _, attempts in jobs:
+            if attempts >= max_attempts:
+                conn.execute(
+                    "UPDATE ghg_fetch_queue SET dead_at = CURRENT_TIMESTAMP, lease_until = NULL, last_error = ? "
+                    "WHERE id = ? AND claimed_by = ?", (err, jid, worker_id))
+            else:
+                delay = backoff_s * (2 ** (attempts - 1))
+                conn.execute(
+                    "UPDATE ghg_fetch_queue SET lease_until = NULL, next_attempt_at = datetime('now', ?), last_error = ? "
+                    "WHERE id = ? AND claimed_by = ?", (f"+{int(delay)} seconds", err, jid, worker_id))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+class Source:
+    """Marker sampler over the current CAMS file; reopened when its path/mtime changes."""
+    def __init__(self, use_cache=True):
+        self.use_cache = use_cache
+        self.path = self.mtime = self.sample = None
+
+    def get(self):
+        path = fetch_ghg.ensure_nc_file() if self.path is None else (fetch_ghg.pick_existing_nc() or self.path)
+        mtime = os.path.getmtime(path)
+        if (path, mtime) != (self.path, self.mtime):
+            self.sample = fetch_ghg.open_sampler(path, self.use_cache)
+            self.path, self.mtime = path, mtime
+            print(f"[daemon] opened {path}")
+        return self.sample
+
+def wait_for_change(conn, poll_s, timeout_s, stop):
+    """Sleep until another connection commits (data_version bumps) or timeout_s passes."""
+    start = conn.execute("PRAGMA data_version").fetchone()[0]
+    deadline = time.monotonic() + timeout_s
+    while not stop() and time.monotonic() < deadline:
+        time.sleep(poll_s)
+        if conn.execute("PRAGMA data_version").fetchone()[0] != start:
+            return
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db", default=str(DB))
+    ap.add_argument("--batch", type=int, default=500, help="Jobs claimed per lease")
+    ap.add_argument("--lease", type=int, default=LEASE_S, help="Lease/visibility timeout, seconds")
+    ap.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS, help="Attempts before a job is dead-lettered")
+    ap.add_argument("--backoff", type=float, default=BACKOFF_S, help="First retry delay, seconds (doubles per attempt)")
+    ap.add_argument("--poll", type=float, default=0.1, help="Idle check interval, seconds")
+    ap.add_argument("--once", action="store_true", help="Drain the queue and exit")
+    ap.add_argument("--no-cache", action="store_true", help="Sample through xarray instead of the memmap cache")
+    ap.add_argument("--cams-only", action="store_true", help="Skip the surface snapshots and SST layers")
+    ap.add_argument("--no-scenario", action="store_true", help="Don't keep scenario_surface current")
+    args = ap.parse_args()
+
+    worker_id = worker_name()
+    stopping = []
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stopping.append(True))
+
+    conn = connect(args.db, isolation_level=None)
+    check_schema(conn)
+    source = Source(use_cache=not args.no_cache)
+    profile = None if args.cams_only else Profile()
+    print(f"[daemon] {worker_id} on {args.db}")
+
+    while not stopping:
+        if not args.no_scenario and scenario_engine.stale(conn):
+            try:
+                with job("scenario_engine"):
+                    scenario_engine.refresh(conn)
+            except Exception as e:
+                print(f"[daemon] scenario refresh failed: {e}", file=sys.stderr)
+        with stage("claim") as st:
+            jobs = claim(conn, worker_id, args.batch, args.lease)
+            st.rows(len(jobs))
+        if not jobs:
+            collect()  # idle polls aren't worth a metrics line
+            if args.once:
+                break
+            # also wakes every lease period to pick up expired leases / due retries
+            wait_for_change(conn, args.poll, args.lease, lambda: bool(stopping))
+            continue
+        t0 = time.perf_counter()
+        with job("queue_daemon"):  # one metrics run per batch
+            try:
+                _, marker_ids, lats, lons, _ = zip(*jobs)
+                sample = source.get()
+                if profile is not None:
+                    with stage("layers"):
+                        profile.refresh(conn)
+                    profile.cams, sample = sample, profile
+                with stage("sample") as st:
+                    obs_time, rows = sample(marker_ids, lats, lons)
+                    st.rows(len(jobs))
+                with stage("write") as st:
+                    n = complete(conn, worker_id, jobs, obs_time, rows)
+                    st.rows(n)
+                print(f"[daemon] {n}/{len(jobs)} jobs done in {time.perf_counter() - t0:.3f}s @ {obs_time}")
+            except Exception as e:
+                with stage("fail") as st:
+                    fail(conn, worker_id, jobs, str(e), args.max_attempts, args.backoff)
+                    st.rows(len(jobs))
+                print(f"[daemon] batch of {len(jobs)} failed: {e}", file=sys.stderr)
+    conn.close()
+
+if __name__ == "__main__":
+    main()
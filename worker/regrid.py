@@ -0,0 +1,275 @@
+# worker/regrid.py
+# Puts every loaded field on a common target grid (default: the 1° SST grid) so
+# variables compare as aligned arrays instead of per-point nearest-cell SQL.
+# - sources: a regular lat/lon grid (GridHeader + south-up array, as in gridblob.py)
+#   or scattered / curvilinear cells (Points)
+# - methods: nearest (any source), bilinear and conservative (regular sources);
+#   "auto" = conservative when the source is finer than the target, bilinear when
+#   coarser, nearest for scattered cells
+# - the weights are a sparse (target cells x source cells) matrix, built once per
+#   (method, source grid, target grid) and cached in data/cache/regrid/; a repeat
+#   load is one sparse matrix-vector product
+# - NaN source cells are renormalized out; target cells nothing valid reaches are NaN
+# Run on demand (not from publish.py: no map path reads the result yet); it stores
+# grid_blob rows (dataset 'regrid:<target>') that aligned() returns.
+#   python worker/regrid.py [--target 1deg] [--method auto] [--sst]   # (re)build all
+
+import argparse, hashlib, os, sqlite3, pathlib, tempfile
+from collections import namedtuple
+import numpy as np
+import scipy.sparse as sp
+from gridblob import GridHeader, NODATA, from_points, read_grid, write_blob, ensure_schema as ensure_blob_schema
+from instrument import job, stage
+from database import connect
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+DB = ROOT / "sqlpage" / "sqlpage.db"
+CACHE_DIR = ROOT / "data" / "cache" / "regrid"
+
+# common target grids (cell centres, r = 0 southernmost, like grid_blob)
+TARGETS = {
+    "1deg": GridHeader(-89.5, 1.0, 180, -179.5, 1.0, 360, NODATA),     # = SST climatology grid
+    "0.5deg": GridHeader(-89.75, 0.5, 360, -179.75, 0.5, 720, NODATA),
+}
+DEFAULT_TARGET = "1deg"
+METHODS = ("auto", "nearest", "bilinear", "conservative")
+
+Points = namedtuple("Points", "lat lon")   # flat cell centres of an irregular source
+
+# ---------------- grid helpers ----------------
+def lon_to_180(lon):
+    return ((np.asarray(lon, dtype=np.float64) + 180.0) % 360.0) - 180.0
+
+def wraps(h: GridHeader):
+    return abs(h.nlon * h.dlon - 360.0) < h.dlon / 2
+
+def centres(h: GridHeader):
+    """2D (lat, lon) of every cell, row-major like the arrays."""
+    lat = h.lat0 + h.dlat * np.arange(h.nlat)
+    lon = h.lon0 + h.dlon * np.arange(h.nlon)
+    return np.meshgrid(lat, lon, indexing="ij")
+
+def signature(grid):
+    """Stable text key of a grid (header values, or a hash of the point coordinates)."""
+    if isinstance(grid, Points):
+        h = hashlib.sha1(np.ascontiguousarray(grid.lat, dtype=np.float64).tobytes())
+        h.update(np.ascontiguousarray(grid.lon, dtype=np.float64).tobytes())
+        return f"points:{len(grid.lat)}:{h.hexdigest()}"
+    return "grid:" + ",".join(f"{v:.6f}" for v in grid[:6])
+
+def size(grid):
+    return len(grid.lat) if isinstance(grid, Points) else grid.nlat * grid.nlon
+
+def pick_method(src, dst: GridHeader):
+    if isinstance(src, Points):
+        return "nearest"
+    return "conservative" if src.dlat * src.dlon < dst.dlat * dst.dlon else "bilinear"
+
+def _unit(lat, lon):
+    la, lo = np.radians(lat), np.radians(lon)
+    return np.stack([np.cos(la) * np.cos(lo), np.cos(la) * np.sin(lo), np.sin(la)], axis=-1)
+
+# ---------------- weight builders ----------------
+def nearest_weights(src, dst: GridHeader):
+    """Each target cell takes its nearest source cell (great-circle, so the dateline/poles are fine)."""
+    from scipy.spatial import cKDTree
+    if isinstance(src, Points):
+        slat, slon = np.asarray(src.lat, dtype=np.float64), np.asarray(src.lon, dtype=np.float64)
+    else:
+        slat, slon = (a.ravel() for a in centres(src))
+    tree = cKDTree(_unit(slat, slon))
+    dlat, dlon = (a.ravel() for a in centres(dst))
+    dist, idx = tree.query(_unit(dlat, dlon))
+    # don't extrapolate past the source's coverage: cap at ~1.5x its own spacing
+    if isinstance(src, Points):
+        spacing = np.median(tree.query(tree.data, k=2)[0][:, 1]) if len(slat) > 1 else np.inf
+    else:
+        spacing = np.radians(max(src.dlat, src.dlon))
+    reach = max(1.5 * spacing, np.radians(max(dst.dlat, dst.dlon)) / 2)
+    ok = dist <= reach
+    rows = np.nonzero(ok)[0]
+    return sp.csr_matrix((np.ones(rows.size), (rows, idx[ok])), shape=(size(dst), size(src)))
+
+def _axis_bilinear(x, x0, dx, n, periodic):
+    """Per target coordinate: (i0, i1, w1, ok) along one source axis."""
+    f = (x - x0) / dx
+    if periodic:
+        f = np.mod(f, n)
+        i0 = np.floor(f).astype(np.int64)
+        return i0 % n, (i0 + 1) % n, f - i0, np.ones(f.shape, dtype=bool)
+    ok = (f >= -0.5) & (f <= n - 0.5)          # within half a cell of the edge rows
+    f = np.clip(f, 0, n - 1)
+    i0 = np.minimum(np.floor(f).astype(np.int64), max(n - 2, 0))
+    i1 = np.minimum(i0 + 1, n - 1)
+    return i0, i1, f - i0, ok
+
+def bilinear_weights(src: GridHeader, dst: GridHeader):
+    dlat, dlon = (a.ravel() for a in centres(dst))
+    r0, r1, wr, okr = _axis_bilinear(dlat, src.lat0, src.dlat, src.nlat, False)
+    c0, c1, wc, okc = _axis_bilinear(dlon, src.lon0, src.dlon, src.nlon, wraps(src))
+    ok = okr & okc
+    t = np.nonzero(ok)[0]
+    r0, r1, wr, c0, c1, wc = r0[ok], r1[ok], wr[ok], c0[ok], c1[ok], wc[ok]
+    rows = np.repeat(t, 4)
+    cols = np.stack([r0 * src.nlon + c0, r0 * src.nlon + c1, r1 * src.nlon + c0, r1 * src.nlon + c1], axis=1).ravel()
+    w = np.stack([(1 - wr) * (1 - wc), (1 - wr) * wc, wr * (1 - wc), wr * wc], axis=1).ravel()
+    W = sp.csr_matrix((w, (rows, cols)), shape=(size(dst), size(src)))
+    W.eliminate_zeros()
+    return W
+
+def _overlap(d_lo, d_hi, s_lo, s_hi, measure=lambda x: x):
+    """(target x source) sparse overlap of 1D intervals, as a fraction of each target interval."""
+    i, j, w = [], [], []
+    for a in range(d_lo.size):
+        lo = np.maximum(d_lo[a], s_lo)
+        hi = np.minimum(d_hi[a], s_hi)
+        hit = np.nonzero(hi > lo)[0]
+        if hit.size:
+            i.append(np.full(hit.size, a))
+            j.append(hit)
+            w.append((measure(hi[hit]) - measure(lo[hit])) / (measure(d_hi[a]) - measure(d_lo[a])))
+    if not i:
+        return sp.csr_matrix((d_lo.size, s_lo.size))
+    return sp.csr_matrix((np.concatenate(w), (np.concatenate(i), np.concatenate(j))), shape=(d_lo.size, s_lo.size))
+
+def conservative_weights(src: GridHeader, dst: GridHeader):
+    """Area-weighted cell overlap; on lat/lon grids this separates into lat (sin) x lon (length) overlaps."""
+    sin = lambda x: np.sin(np.radians(np.clip(x, -90.0, 90.0)))
+    s_lat = src.lat0 + src.dlat * np.arange(src.nlat)
+    d_lat = dst.lat0 + dst.dlat * np.arange(dst.nlat)
+    A = _overlap(d_lat - dst.dlat / 2, d_lat + dst.dlat / 2, s_lat - src.dlat / 2, s_lat + src.dlat / 2, sin)
+    s_lon = src.lon0 + src.dlon * np.arange(src.nlon)
+    d_lon = dst.lon0 + dst.dlon * np.arange(dst.nlon)
+    shifts = (-360.0, 0.0, 360.0) if wraps(src) else (0.0,)
+    B = sum(_overlap(d_lon - dst.dlon / 2, d_lon + dst.dlon / 2,
+                     s_lon + k - src.dlon / 2, s_lon + k + src.dlon / 2) for k in shifts)
+    return sp.kron(A, B, format="csr")
+
+BUILDERS = {
+    "nearest": nearest_weights,
+    "bilinear": bilinear_weights,
+    "conservative": conservative_weights,
+}
+
+# ---------------- cache ----------------
+def cache_key(src, dst, method):
+    raw = f"{method}|{signature(src)}|{signature(dst)}"
+    return f"{method}-{hashlib.sha1(raw.encode()).hexdigest()[:16]}"
+
+def weights(src, dst: GridHeader, method="auto", cache_dir=None):
+    """Sparse (target x source) weights, from the on-disk cache when present."""
+    if method == "auto":
+        method = pick_method(src, dst)
+    if method != "nearest" and isinstance(src, Points):
+        raise ValueError(f"{method} needs a regular source grid; use nearest for scattered cells")
+    cache_dir = pathlib.Path(cache_dir or CACHE_DIR)
+    path = cache_dir / (cache_key(src, dst, method) + ".npz")
+    if path.exists():
+        return sp.load_npz(path)
+    W = BUILDERS[method](src, dst).tocsr()
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=cache_dir, prefix=".build-", suffix=".npz")
+    os.close(fd)
+    sp.save_npz(tmp, W)
+    os.replace(tmp, path)  # atomic; a concurrent builder writes the same weights
+    return W
+
+def apply(W, values, dst: GridHeader):
+    """W @ values with NaN cells renormalized out; (nlat, nlon) float32 on the target."""
+    v = np.asarray(values, dtype=np.float64).ravel()
+    ok = np.isfinite(v)
+    num = W @ np.where(ok, v, 0.0)
+    den = W @ ok.astype(np.float64)
+    out = np.full(num.shape, np.nan)
+    np.divide(num, den, out=out, where=den > 1e-9)
+    return out.reshape(dst.nlat, dst.nlon).astype(np.float32)
+
+def regrid(values, src, dst=None, method="auto", cache_dir=None):
+    """values on `src` (south-up 2D array, or flat for Points) -> float32 array on `dst`."""
+    dst = dst or TARGETS[DEFAULT_TARGET]
+    return apply(weights(src, dst, method, cache_dir), values, dst)
+
+# ---------------- loaded sources ----------------
+def surface_source(conn: sqlite3.Connection, variable, obs_time):
+    """(source grid, values) of one ghg_surface snapshot: a regular grid when it is one, else Points."""
+    rows = conn.execute("SELECT lat, lon, value FROM ghg_surface WHERE variable=? AND obs_time=?",
+                        (variable, obs_time)).fetchall()
+    if not rows:
+        return None
+    lats, lons, vals = (np.array(c, dtype=np.float64) for c in zip(*rows))
+    lons = lon_to_180(lons)
+    packed = from_points(lats, lons, vals)
+    if packed is not None and packed[0].nlat * packed[0].nlon <= 4 * vals.size:  # not just a sparse scatter
+        return packed
+    return Points(lats, lons), vals
+
+def sst_source(conn: sqlite3.Connection, period, kind="clim"):
+    """(GridHeader, south-up array) of one SST month, from grid_blob or sst_grid rows."""
+    from load_sst import SST_HEADER, SST_SENTINELS
+    found = read_grid(conn, "sst", kind, period)
+    if found:
+        return found
+    rows = conn.execute("SELECT r, c, sst FROM sst_grid WHERE kind=? AND period=?", (kind, period)).fetchall()
+    if not rows:
+        return None
+    arr = np.full((180, 360), np.nan)
+    r, c, v = (np.array(x) for x in zip(*rows))
+    arr[179 - r.astype(np.int64), c.astype(np.int64)] = np.where(np.isin(v, SST_SENTINELS), np.nan, v)
+    return GridHeader(nodata=NODATA, **SST_HEADER), arr
+
+def regrid_snapshot(conn: sqlite3.Connection, variable, obs_time, target=DEFAULT_TARGET, method="auto"):
+    """Store one ghg_surface snapshot on the target grid as grid_blob ('regrid:<target>'); returns its cell count."""
+    found = surface_source(conn, variable, obs_time)
+    if not found:
+        return 0
+    src, vals = found
+    dst = TARGETS[target]
+    out = regrid(vals, src, dst, method)
+    ensure_blob_schema(conn)
+    with conn:
+        write_blob(conn, f"regrid:{target}", variable, obs_time, dst, out)
+    n = int(np.isfinite(out).sum())
+    print(f"[regrid] {variable} @ {obs_time} -> {target}: {n} cells")
+    return n
+
+def aligned(conn: sqlite3.Connection, variables, target=DEFAULT_TARGET):
+    """{variable: array} of the latest regridded fields, all on the same target grid."""
+    out = {}
+    for v in variables:
+        found = read_grid(conn, f"regrid:{target}", v)
+        if found:
+            out[v] = found[1]
+    return out
+
+def main():
+    from catalog import current_snapshots
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db", default=str(DB))
+    ap.add_argument("--target", choices=sorted(TARGETS), default=DEFAULT_TARGET)
+    ap.add_argument("--method", choices=METHODS, default="auto")
+    ap.add_argument("--vars", default="", help="Comma-separated variables (default: every current snapshot)")
+    ap.add_argument("--sst", action="store_true", help="Also regrid the SST climatology months")
+    args = ap.parse_args()
+    wanted = {v.strip() for v in args.vars.split(",") if v.strip()}
+    conn = connect(args.db)
+    try:
+        for variable, obs_time in current_snapshots(conn):
+            if not wanted or variable in wanted:
+                with stage("regrid", var=variable) as st:
+                    st.rows(regrid_snapshot(conn, variable, obs_time, args.target, args.method))
+        if args.sst:
+            dst = TARGETS[args.target]
+            for (period,) in conn.execute("SELECT DISTINCT period FROM sst_grid WHERE kind='clim'").fetchall():
+                with stage("sst", var=period) as st:
+                    h, arr = sst_source(conn, period)
+                    out = regrid(arr, h, dst, args.method)
+                    with conn:
+                        write_blob(conn, f"regrid:{args.target}", "sst", period, dst, out)
+                    st.rows(int(np.isfinite(out).sum()))
+                print(f"[regrid] sst {period} -> {args.target}")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    with job("regrid"):
+        main()
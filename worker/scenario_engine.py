@@ -0,0 +1,215 @@
+# worker/scenario_engine.py
+# Keeps the materialized scenario_surface table (baseline + factory influence)
+# up to date so scenario_surface.sql only has to read it.
+# - scenario_contrib remembers the (lat, lon, strength) already applied per marker
+# - a run diffs markers/factory_params against it and adds only the changed
+#   markers' kernel deltas (new - old) to every grid point, vectorized with NumPy
+# - a new ghg_surface snapshot for a variable triggers a full rebuild of that variable
+# - marker / factory_params triggers (015_scenario_dirty.sql) flag scenario_dirty;
+#   queue_daemon.py checks stale() every loop and calls refresh() itself
+# Run after each load, or from cron when no queue daemon is running:
+#   python worker/scenario_engine.py [--rebuild]
+
+import argparse, pathlib
+import numpy as np
+from catalog import current_snapshots
+from instrument import job, stage
+from database import connect
+
+DB = pathlib.Path(__file__).resolve().parents[1] / "sqlpage" / "sqlpage.db"
+
+# same illustrative kernel as the old scenario_surface.sql:
+#   K * strength / (haversine_km^2 + 1)
+R_EARTH_KM = 6371.0
+K = 50.0
+# grid points x factories per NumPy block
+BLOCK = 4_000_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scenario_surface (
+  variable  TEXT NOT NULL,
+  obs_time  TEXT NOT NULL,          -- ghg_surface snapshot the baseline came from
+  lat       REAL NOT NULL,
+  lon       REAL NOT NULL,
+  baseline  REAL NOT NULL,
+  delta     REAL NOT NULL DEFAULT 0.0,
+  PRIMARY KEY (variable, lat, lon)
+);
+CREATE TABLE IF NOT EXISTS scenario_contrib (
+  marker_id INTEGER PRIMARY KEY,
+  lat       REAL NOT NULL,
+  lon       REAL NOT NULL,
+  strength  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scenario_dirty (
+  id          INTEGER  PRIMARY KEY CHECK (id = 1),
+  n           INTEGER  NOT NULL DEFAULT 1,
+  changed_at  DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+def influence(glat, glon, flat, flon, strength):
+    """Summed kernel of factories (flat, flon, strength) at every grid point."""
+    glat = np.asarray(glat, dtype=np.float64)
+    glon = np.asarray(glon, dtype=np.float64)
+    flat = np.asarray(flat, dtype=np.float64)
+    flon = np.asarray(flon, dtype=np.float64)
+    strength = np.asarray(strength, dtype=np.float64)
+    out = np.zeros(glat.shape, dtype=np.float64)
+    if not flat.size:
+        return out
+    p1 = np.radians(glat)[:, None]
+    cos_p1 = np.cos(p1)
+    step = max(1, BLOCK // max(1, glat.size))
+    for i in range(0, flat.size, step):
+        p2 = np.radians(flat[None, i:i + step])
+        dlon = np.radians(flon[None, i:i + step] - glon[:, None])
+        a = np.sin((p2 - p1) / 2.0) ** 2 + cos_p1 * np.cos(p2) * np.sin(dlon / 2.0) ** 2
+        d = 2.0 * R_EARTH_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+        out += (K * strength[None, i:i + step] / (d * d + 1.0)).sum(axis=1)
+    return out
+
+def current_factories(conn):
+    return {
+        mid: (lat, lon, strength)
+        for mid, lat, lon, strength in conn.execute("""
+            SELECT m.id,
+                   CAST(json_extract(m.geojson,'$.geometry.coordinates[1]') AS REAL),
+                   CAST(json_extract(m.geojson,'$.geometry.coordinates[0]') AS REAL),
+                   COALESCE(fp.strength, 1.0)
+            FROM markers m
+            LEFT JOIN factory_params fp ON fp.marker_id = m.id
+        """)
+    }
+
+def applied_factories(conn):
+    return {mid: (lat, lon, s) for mid, lat, lon, s in
+            conn.execute("SELECT marker_id, lat, lon, strength FROM scenario_contrib")}
+
+def diff_factories(old, new):
+    """(removed, added): contributions to subtract and to add for changed markers."""
+    removed = [old[m] for m in old if new.get(m) != old[m]]
+    added = [new[m] for m in new if old.get(m) != new[m]]
+    return removed, added
+
+def _cols(factories):
+    if not factories:
+        return np.empty(0), np.empty(0), np.empty(0)
+    return tuple(np.array(c, dtype=np.float64) for c in zip(*factories))
+
+def rebuild_variable(conn, variable, obs_time, factories):
+    rows = conn.execute(
+        "SELECT lat, lon, value FROM ghg_surface WHERE variable=? AND obs_time=?",
+        (variable, obs_time)
+    ).fetchall()
+    conn.execute("DELETE FROM scenario_surface WHERE variable=?", (variable,))
+    if not rows:
+        return 0
+    glat, glon, base = (np.array(c, dtype=np.float64) for c in zip(*rows))
+    delta = influence(glat, glon, *_cols(list(factories.values())))
+    conn.executemany(
+        "INSERT INTO scenario_surface(variable,obs_time,lat,lon,baseline,delta) VALUES (?,?,?,?,?,?)",
+        ((variable, obs_time, la, lo, b, d) for la, lo, b, d in
+         zip(glat.tolist(), glon.tolist(), base.tolist(), delta.tolist()))
+    )
+    return len(rows)
+
+def apply_delta(conn, variable, removed, added):
+    rows = conn.execute(
+        "SELECT rowid, lat, lon FROM scenario_surface WHERE variable=?", (variable,)
+    ).fetchall()
+    if not rows:
+        return 0
+    rowid, glat, glon = (np.array(c) for c in zip(*rows))
+    change = influence(glat, glon, *_cols(added)) - influence(glat, glon, *_cols(removed))
+    conn.executemany(
+        "UPDATE scenario_surface SET delta = delta + ? WHERE rowid = ?",
+        zip(change.tolist(), rowid.tolist())
+    )
+    return len(rows)
+
+def patch_baseline(conn, variable, obs_time, cells, restructured=False):
+    """
+    Follow an in-place ghg_surface delta (manifest.apply_delta): [(value, lat, lon)]
+    become the new baselines; if cells were added/removed the variable is dropped
+    so the next refresh rebuilds it. Doesn't commit.
+    """
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='scenario_surface'").fetchone():
+        return
+    if restructured:
+        conn.execute("DELETE FROM scenario_surface WHERE variable=?", (variable,))
+        return
+    conn.executemany(
+        "UPDATE scenario_surface SET baseline=? WHERE variable=? AND obs_time=? AND lat=? AND lon=?",
+        ((v, variable, obs_time, la, lo) for v, la, lo in cells)
+    )
+
+def _has_table(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,)).fetchone()
+
+def built_snapshots(conn, variables):
+    """{variable: obs_time scenario_surface was built from} (one PK seek per variable)."""
+    built = {}
+    for variable in variables:
+        row = conn.execute("SELECT obs_time FROM scenario_surface WHERE variable=? LIMIT 1", (variable,)).fetchone()
+        if row:
+            built[variable] = row[0]
+    return built
+
+def stale(conn):
+    """Cheap check: a marker/factory edit is pending or a current snapshot isn't built."""
+    if not _has_table(conn, "scenario_surface"):
+        return False
+    if _has_table(conn, "scenario_dirty") and conn.execute("SELECT 1 FROM scenario_dirty").fetchone():
+        return True
+    latest = current_snapshots(conn)
+    return built_snapshots(conn, [v for v, _ in latest]) != dict(latest)
+
+def refresh(conn, rebuild=False):
+    """One pass: rebuild stale variables, apply marker deltas elsewhere, all in one transaction."""
+    conn.executescript(SCHEMA)
+    latest = current_snapshots(conn)  # may catalogue ghg_surface (executescript commits), so before BEGIN
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")  # also under isolation_level=None (queue_daemon)
+    with conn:
+        new = current_factories(conn)
+        old = applied_factories(conn)
+        removed, added = diff_factories(old, new)
+        built = built_snapshots(conn, [v for v, _ in latest])
+        conn.execute("""
+            DELETE FROM scenario_surface
+            WHERE variable NOT IN (SELECT variable FROM surface_snapshot WHERE is_current = 1)
+        """)
+        for variable, obs_time in latest:
+            if rebuild or built.get(variable) != obs_time:
+                with stage("rebuild", var=variable) as st:
+                    n = rebuild_variable(conn, variable, obs_time, new)
+                    st.rows(n)
+                print(f"[scenario] {variable}: rebuilt {n} points @ {obs_time} ({len(new)} factories)")
+            elif removed or added:
+                with stage("delta", var=variable) as st:
+                    n = apply_delta(conn, variable, removed, added)
+                    st.rows(n)
+                print(f"[scenario] {variable}: applied {len(removed)}-/{len(added)}+ factory deltas to {n} points")
+        gone = [(m,) for m in old if m not in new]
+        conn.executemany("DELETE FROM scenario_contrib WHERE marker_id=?", gone)
+        conn.executemany(
+            "INSERT OR REPLACE INTO scenario_contrib(marker_id,lat,lon,strength) VALUES (?,?,?,?)",
+            [(m, *new[m]) for m in new if old.get(m) != new[m]]
+        )
+        conn.execute("DELETE FROM scenario_dirty")  # no writer can flag it again inside this transaction
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db", default=str(DB))
+    ap.add_argument("--rebuild", action="store_true", help="Recompute every variable from scratch")
+    args = ap.parse_args()
+    conn = connect(args.db)
+    try:
+        refresh(conn, rebuild=args.rebuild)
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    with job("scenario_engine"):
+        main()
@@ -0,0 +1,104 @@
+# worker/tile_pyramid.py
+# Multi-resolution tile pyramid for the baseline overlay.
+# For a ghg_surface snapshot, every zoom 0..MAX_ZOOM is cut into Web Mercator
+# (z, x, y) tiles; each tile is binned into CELLS x CELLS pixels and stores the
+# mean value (and mean lat/lon) of the points in each bin as a small JSON array.
+# baseline_tile.sql serves one tile per request, so the payload is bounded by
+# what is on screen, not by the grid resolution.
+#   python worker/tile_pyramid.py [--variable co2] [--max-zoom 6]
+
+import argparse, json, math, sqlite3, pathlib
+import numpy as np
+from catalog import current_snapshots
+from instrument import job, stage
+from database import connect
+
+DB = pathlib.Path(__file__).resolve().parents[1] / "sqlpage" / "sqlpage.db"
+MAX_ZOOM = 6      # ~0.17° bins at z=6; deeper zooms reuse the z=MAX_ZOOM tile
+CELLS = 32        # bins per tile side (at most 1024 points per tile)
+MAX_LAT = 85.0511287798
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS surface_tile (
+  variable  TEXT    NOT NULL,
+  obs_time  TEXT    NOT NULL,
+  z         INTEGER NOT NULL,
+  x         INTEGER NOT NULL,
+  y         INTEGER NOT NULL,
+  n         INTEGER NOT NULL,   -- binned points in this tile
+  vmin      REAL    NOT NULL,   -- value range of the whole snapshot (for a stable colour scale)
+  vmax      REAL    NOT NULL,
+  cells     TEXT    NOT NULL,   -- JSON [[lat, lon, value], ...]
+  PRIMARY KEY (variable, obs_time, z, x, y)
+) WITHOUT ROWID;
+"""
+
+def mercator(lats, lons):
+    """Normalized Web Mercator (0..1, 0..1); y grows southwards like tile rows."""
+    lat = np.radians(np.clip(lats, -MAX_LAT, MAX_LAT))
+    x = (np.asarray(lons, dtype=np.float64) + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / math.pi) / 2.0
+    return np.clip(x, 0.0, 1.0 - 1e-12), np.clip(y, 0.0, 1.0 - 1e-12)
+
+def pyramid_level(mx, my, lats, lons, vals, z):
+    """Yield (x, y, n, cells) for every non-empty tile at zoom z."""
+    side = (1 << z) * CELLS
+    px = (mx * side).astype(np.int64)
+    py = (my * side).astype(np.int64)
+    bins, inv = np.unique(py * side + px, return_inverse=True)
+    cnt = np.bincount(inv)
+    mlat = np.bincount(inv, lats) / cnt
+    mlon = np.bincount(inv, lons) / cnt
+    mval = np.bincount(inv, vals) / cnt
+    tx = (bins % side) // CELLS
+    ty = (bins // side) // CELLS
+    tile = ty * (1 << z) + tx
+    order = np.argsort(tile, kind="stable")
+    tiles, starts = np.unique(tile[order], return_index=True)
+    for k, t in enumerate(tiles.tolist()):
+        sel = order[starts[k]:(starts[k + 1] if k + 1 < len(starts) else len(order))]
+        cells = [[round(a, 4), round(b, 4), round(v, 6)] for a, b, v in
+                 zip(mlat[sel].tolist(), mlon[sel].tolist(), mval[sel].tolist())]
+        yield t % (1 << z), t // (1 << z), int(cnt[sel].sum()), cells
+
+def build_pyramid(conn: sqlite3.Connection, variable, obs_time, max_zoom=MAX_ZOOM):
+    """(Re)build tiles for one snapshot and drop tiles of older snapshots of the variable."""
+    conn.executescript(SCHEMA)
+    rows = conn.execute(
+        "SELECT lat, lon, value FROM ghg_surface WHERE variable=? AND obs_time=?",
+        (variable, obs_time)
+    ).fetchall()
+    if not rows:
+        return 0
+    lats, lons, vals = (np.array(c, dtype=np.float64) for c in zip(*rows))
+    mx, my = mercator(lats, lons)
+    vmin, vmax = float(vals.min()), float(vals.max())
+    # tiles are built before the write transaction, which then only swaps them in
+    batch = [(variable, obs_time, z, x, y, n, vmin, vmax, json.dumps(cells, separators=(",", ":")))
+             for z in range(max_zoom + 1) for x, y, n, cells in pyramid_level(mx, my, lats, lons, vals, z)]
+    count = len(batch)
+    with conn:
+        conn.execute("DELETE FROM surface_tile WHERE variable=?", (variable,))
+        conn.executemany(
+            "INSERT INTO surface_tile(variable,obs_time,z,x,y,n,vmin,vmax,cells) VALUES (?,?,?,?,?,?,?,?,?)",
+            batch
+        )
+    print(f"[tiles] {variable} @ {obs_time}: {count} tiles, z=0..{max_zoom}")
+    return count
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db", default=str(DB))
+    ap.add_argument("--variable", default="", help="Only this variable (default: all, latest snapshot)")
+    ap.add_argument("--max-zoom", type=int, default=MAX_ZOOM)
+    args = ap.parse_args()
+    conn = connect(args.db)
+    for variable, obs_time in current_snapshots(conn):
+        if not args.variable or variable == args.variable:
+            with stage("tiles", var=variable) as st:
+                st.rows(build_pyramid(conn, variable, obs_time, args.max_zoom))
+    conn.close()
+
+if __name__ == "__main__":
+    with job("tile_pyramid"):
+        main()